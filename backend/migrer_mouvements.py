@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Migration des journaux mouvements_stock et mouvements_outils vers les seaux d'historique
+
+Les mouvements enregistrés à plat sont regroupés par élément (produit ou outil)
+et par mois dans mouvements_stock_seaux et mouvements_outils_seaux, seules
+collections lues par le serveur. La migration peut tourner serveur démarré :
+les nouveaux mouvements vont déjà dans les seaux.
+
+Chaque lot migré est retiré de la collection d'origine : une migration
+interrompue reprend là où elle s'était arrêtée. Un mouvement déjà rangé dans
+un seau (lot rejoué après une interruption, ou relance avec --conserver) est
+reconnu à son identifiant et n'est pas réécrit. La collection d'origine, vide,
+est ensuite supprimée ; avec --conserver, rien n'est retiré et elle est
+renommée en <journal>_avant_seaux.
+
+Les seaux écrits portent la date de la migration (date_modification) : la
+sauvegarde incrémentale suivante les recopie tous.
+
+Exemples :
+    python migrer_mouvements.py
+    python migrer_mouvements.py --journaux mouvements_outils --taille-lot 5000
+    python migrer_mouvements.py --conserver
+"""
+
+import argparse
+import asyncio
+import time
+
+import server
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Migration des mouvements vers les seaux d'historique")
+    parser.add_argument("--journaux", nargs="+", choices=sorted(server.JOURNAUX_MOUVEMENTS),
+                        default=sorted(server.JOURNAUX_MOUVEMENTS), help="Journaux à migrer (tous par défaut)")
+    parser.add_argument("--taille-lot", type=int, default=1000, help="Mouvements lus et écrits par lot")
+    parser.add_argument("--conserver", action="store_true",
+                        help="Garder les mouvements d'origine (collection renommée en <journal>_avant_seaux)")
+    return parser.parse_args(argv)
+
+
+def mouvement_depuis_document(document):
+    """Mouvement tel que rangé dans un seau : l'identifiant exposé par l'API remplace _id"""
+    mouvement = {cle: valeur for cle, valeur in document.items() if cle != "_id"}
+    mouvement["id"] = document.get("id") or str(document["_id"])
+    return mouvement
+
+
+async def migrer_journal(journal, taille_lot=1000, conserver=False):
+    """Range les mouvements du journal dans ses seaux ; renvoie le nombre de mouvements migrés"""
+    collection, champ = server.JOURNAUX_MOUVEMENTS[journal]
+    if journal not in await server.db.list_collection_names():
+        print(f"⏭️  {journal}: rien à migrer")
+        return 0
+
+    source = server.db[journal]
+    debut = time.perf_counter()
+    migres = 0
+    lot = []
+    async for document in source.find({}, batch_size=taille_lot):
+        lot.append(document)
+        if len(lot) >= taille_lot:
+            migres += await migrer_lot(source, collection, champ, lot, conserver)
+            lot = []
+            print(f"   {journal}: {migres} mouvements migrés")
+    if lot:
+        migres += await migrer_lot(source, collection, champ, lot, conserver)
+
+    if conserver:
+        await source.rename(f"{journal}_avant_seaux")
+    else:
+        await source.drop()
+    seaux = await server.db[collection].count_documents({})
+    print(f"✅ {journal} -> {collection}: {migres} mouvements en {time.perf_counter() - debut:.1f}s "
+          f"({seaux} seaux au total)")
+    return migres
+
+
+async def migrer_lot(source, collection, champ, lot, conserver):
+    mouvements = [mouvement_depuis_document(document) for document in lot]
+    deja = await server.ids_deja_journalises(collection, champ, mouvements)
+    a_ecrire = [mouvement for mouvement in mouvements if mouvement["id"] not in deja]
+    if a_ecrire:
+        operations, _ = server.operations_seaux(champ, a_ecrire)
+        await server.db[collection].bulk_write(operations, ordered=False)
+    if not conserver:
+        await source.delete_many({"_id": {"$in": [document["_id"] for document in lot]}})
+    return len(lot)
+
+
+async def main():
+    args = parse_args()
+    # Collections de seaux (avec leur compression) et index avant la première écriture
+    await server.init_indexes()
+    for journal in args.journaux:
+        await migrer_journal(journal, args.taille_lot, args.conserver)
+    server.log_listener.stop()
+    server.client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,17 +1,44 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, status, Query
+from fastapi import FastAPI, HTTPException, Depends, status, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, JSONResponse, HTMLResponse
+from fastapi.encoders import jsonable_encoder
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, ValidationError
 from typing import List, Optional, Dict, Any, Union
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import uuid
 import os
+import sys
+import re
 from motor.motor_asyncio import AsyncIOMotorClient
 import json
-from bson import ObjectId
+import asyncio
+import time
+import threading
+import logging
+import logging.handlers
+import queue
+from collections import deque
+import cProfile
+import pstats
+import io
+import gzip
+import hashlib
+import functools
+import contextlib
+import csv
+import tempfile
+from contextvars import ContextVar
+import bson
+from bson import ObjectId, json_util
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+from pymongo import monitoring, read_preferences, DeleteOne, ReplaceOne, ReturnDocument, UpdateOne, WriteConcern
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError, OperationFailure
 from passlib.context import CryptContext
 from jose import jwt, JWTError
 import secrets
+from email.utils import format_datetime, parsedate_to_datetime
 
 # Constantes pour l'application automobile
 MARQUES_AUTOMOBILES = [
@@ -36,7 +63,11 @@ FORMULES_SERVICE = ["Basic", "Standard", "Premium"]
 
 # Environment variables
 MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-SECRET_KEY = os.environ.get('SECRET_KEY', secrets.token_urlsafe(32))
+DB_NAME = os.environ.get('DB_NAME', 'billing_app')
+# Sans SECRET_KEY, chaque processus tire sa propre clé : les jetons émis par un
+# worker sont refusés par les autres et invalidés à chaque redémarrage
+SECRET_KEY_EPHEMERE = not os.environ.get('SECRET_KEY')
+SECRET_KEY = os.environ.get('SECRET_KEY') or secrets.token_urlsafe(32)
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
@@ -48,18 +79,1147 @@ security = HTTPBearer()
 
 app = FastAPI(title="FacturApp", description="Système de gestion de facturation professionnel avec authentification")
 
-# CORS
+# ===== PROFILAGE À LA DEMANDE =====
+
+try:
+    from pyinstrument import Profiler as ProfileurEchantillonnage
+except ImportError:
+    ProfileurEchantillonnage = None
+
+PROFILE_TOP_N = int(os.environ.get('PROFILE_TOP_N', '60'))
+PROFILE_RETENTION_JOURS = int(os.environ.get('PROFILE_RETENTION_JOURS', '7'))
+
+class ProfilageMiddleware:
+    """Profile une requête sur demande (?__profile=1 ou en-tête X-Profile) - Support seulement
+
+    Le rapport remplace la réponse et est conservé dans la collection profils_requetes.
+    Sans le paramètre, seul un test sur la query string et les en-têtes est ajouté.
+    Avec cProfile, les autres tâches exécutées pendant les await apparaissent aussi
+    dans le rapport ; ?__profile=html utilise pyinstrument (mode async) s'il est installé.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        # Un seul profileur actif à la fois par processus
+        self._verrou = asyncio.Lock()
+
+    @staticmethod
+    def _mode_demande(scope) -> Optional[str]:
+        for parametre in scope.get("query_string", b"").split(b"&"):
+            if parametre == b"__profile" or parametre.startswith(b"__profile="):
+                return parametre.partition(b"=")[2].decode("latin-1") or "1"
+        for nom, valeur in scope.get("headers", []):
+            if nom == b"x-profile":
+                return valeur.decode("latin-1")
+        return None
+
+    @staticmethod
+    async def _utilisateur_support(scope) -> Optional[dict]:
+        for nom, valeur in scope.get("headers", []):
+            if nom == b"authorization":
+                schema, _, jeton = valeur.decode("latin-1").partition(" ")
+                payload = decode_token(jeton) if schema.lower() == "bearer" else None
+                if not payload or not payload.get("sub"):
+                    return None
+                user = await get_user_by_email(payload["sub"])
+                if user and user.get("role") == "support" and user.get("is_active", True):
+                    return user
+                return None
+        return None
+
+    async def __call__(self, scope, receive, send):
+        mode = self._mode_demande(scope) if scope["type"] == "http" else None
+        if mode is None or mode in ("0", "false"):
+            await self.app(scope, receive, send)
+            return
+
+        utilisateur = await self._utilisateur_support(scope)
+        if not utilisateur:
+            await self.app(scope, receive, send)
+            return
+
+        reponse = {"statut": 500, "taille": 0}
+
+        async def send_capture(message):
+            if message["type"] == "http.response.start":
+                reponse["statut"] = message["status"]
+            elif message["type"] == "http.response.body":
+                reponse["taille"] += len(message.get("body", b""))
+
+        async with self._verrou:
+            debut = time.perf_counter()
+            if mode == "html" and ProfileurEchantillonnage is not None:
+                profileur = ProfileurEchantillonnage(async_mode="enabled")
+                profileur.start()
+                try:
+                    await self.app(scope, receive, send_capture)
+                finally:
+                    profileur.stop()
+                rapport, format_rapport = profileur.output_html(), "html"
+            else:
+                profileur = cProfile.Profile()
+                profileur.enable()
+                try:
+                    await self.app(scope, receive, send_capture)
+                finally:
+                    profileur.disable()
+                flux = io.StringIO()
+                pstats.Stats(profileur, stream=flux).sort_stats("cumulative").print_stats(PROFILE_TOP_N)
+                rapport, format_rapport = flux.getvalue(), "pstats"
+            duree_ms = round((time.perf_counter() - debut) * 1000, 2)
+
+        profil = {
+            "id": str(uuid.uuid4()),
+            "methode": scope.get("method"),
+            "chemin": scope.get("path"),
+            "route": getattr(scope.get("route"), "path", None),
+            "statut_reponse": reponse["statut"],
+            "taille_reponse": reponse["taille"],
+            "duree_ms": duree_ms,
+            "format": format_rapport,
+            "rapport": rapport,
+            "utilisateur": utilisateur.get("email"),
+            "date_creation": datetime.utcnow()
+        }
+        await db.profils_requetes.insert_one(profil)
+        profil.pop("_id", None)
+
+        if format_rapport == "html":
+            resultat = HTMLResponse(rapport, headers={"X-Profile-Id": profil["id"]})
+        else:
+            resultat = JSONResponse(jsonable_encoder(profil), headers={"X-Profile-Id": profil["id"]})
+        await resultat(scope, receive, send)
+
+app.add_middleware(ProfilageMiddleware)
+
+# ===== INSTRUMENTATION (LATENCE ET APPELS MONGODB) =====
+
+BUCKETS_LATENCE = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_APPELS_DB = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+class RegistreMetriques:
+    """Registre minimal de compteurs et d'histogrammes au format texte Prometheus"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._types = {}
+        self._aides = {}
+        self._compteurs = {}
+        self._histogrammes = {}
+
+    def decrire(self, nom: str, type_metrique: str, aide: str):
+        self._types[nom] = type_metrique
+        self._aides[nom] = aide
+
+    def inc(self, nom: str, labels: Optional[Dict[str, str]] = None, valeur: float = 1.0):
+        cle = tuple(sorted((labels or {}).items()))
+        with self._lock:
+            serie = self._compteurs.setdefault(nom, {})
+            serie[cle] = serie.get(cle, 0.0) + valeur
+
+    def observe(self, nom: str, valeur: float, labels: Optional[Dict[str, str]] = None, buckets=BUCKETS_LATENCE):
+        cle = tuple(sorted((labels or {}).items()))
+        with self._lock:
+            bornes, serie = self._histogrammes.setdefault(nom, (buckets, {}))
+            etat = serie.get(cle)
+            if etat is None:
+                etat = serie[cle] = {"buckets": [0] * len(bornes), "somme": 0.0, "total": 0}
+            for i, borne in enumerate(bornes):
+                if valeur <= borne:
+                    etat["buckets"][i] += 1
+            etat["somme"] += valeur
+            etat["total"] += 1
+
+    @staticmethod
+    def _labels(paires) -> str:
+        if not paires:
+            return ""
+        contenu = ",".join(
+            '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+            for k, v in paires
+        )
+        return "{" + contenu + "}"
+
+    def exposer(self) -> str:
+        """Sérialise toutes les séries au format d'exposition Prometheus 0.0.4"""
+        lignes = []
+        with self._lock:
+            for nom, serie in sorted(self._compteurs.items()):
+                lignes.append(f"# HELP {nom} {self._aides.get(nom, nom)}")
+                lignes.append(f"# TYPE {nom} {self._types.get(nom, 'counter')}")
+                for cle, valeur in serie.items():
+                    lignes.append(f"{nom}{self._labels(cle)} {valeur}")
+
+            for nom, (bornes, serie) in sorted(self._histogrammes.items()):
+                lignes.append(f"# HELP {nom} {self._aides.get(nom, nom)}")
+                lignes.append(f"# TYPE {nom} histogram")
+                for cle, etat in serie.items():
+                    for borne, nombre in zip(bornes, etat["buckets"]):
+                        lignes.append(f"{nom}_bucket{self._labels(cle + (('le', str(borne)),))} {nombre}")
+                    lignes.append(f"{nom}_bucket{self._labels(cle + (('le', '+Inf'),))} {etat['total']}")
+                    lignes.append(f"{nom}_sum{self._labels(cle)} {etat['somme']}")
+                    lignes.append(f"{nom}_count{self._labels(cle)} {etat['total']}")
+        return "\n".join(lignes) + "\n"
+
+metriques = RegistreMetriques()
+metriques.decrire("http_requests_total", "counter", "Nombre de requêtes HTTP par route et statut")
+metriques.decrire("http_request_duration_seconds", "histogram", "Latence des requêtes HTTP par route")
+metriques.decrire("mongo_commands_total", "counter", "Nombre de commandes MongoDB par type et résultat")
+metriques.decrire("mongo_command_duration_seconds", "histogram", "Durée des commandes MongoDB par type")
+metriques.decrire("mongo_commands_per_request", "histogram", "Nombre de commandes MongoDB par requête HTTP")
+metriques.decrire("mongo_time_per_request_seconds", "histogram", "Temps passé dans MongoDB par requête HTTP")
+
+# Statistiques de la requête HTTP en cours (le contexte est copié dans les threads de Motor)
+stats_requete: ContextVar[Optional[dict]] = ContextVar("stats_requete", default=None)
+
+# ===== CAPTURE DES REQUÊTES LENTES =====
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '100'))
+SLOW_QUERY_MAX_ENTREES = int(os.environ.get('SLOW_QUERY_MAX_ENTREES', '200'))
+
+COMMANDES_EXPLICABLES = {"find", "aggregate", "count", "distinct", "findAndModify", "update", "delete"}
+CHAMPS_HORS_EXPLAIN = {"lsid", "txnNumber", "autocommit", "startTransaction", "readConcern", "writeConcern"}
+
+def forme_requete(valeur):
+    """Remplace les valeurs par '?' en conservant les champs et opérateurs"""
+    if isinstance(valeur, dict):
+        return {cle: forme_requete(v) for cle, v in valeur.items()}
+    if isinstance(valeur, (list, tuple)):
+        if any(isinstance(element, (dict, list, tuple)) for element in valeur):
+            return [forme_requete(element) for element in valeur]
+        return ["?"] if valeur else []
+    return "?"
+
+def extraire_forme_commande(nom: str, commande: dict) -> dict:
+    """Extrait la forme (sans valeurs) du filtre d'une commande MongoDB"""
+    if nom == "find":
+        return {"filter": forme_requete(commande.get("filter", {})), "sort": commande.get("sort")}
+    if nom == "aggregate":
+        return {"pipeline": forme_requete(commande.get("pipeline", []))}
+    if nom in ("count", "distinct", "findAndModify"):
+        return {"query": forme_requete(commande.get("query", {}))}
+    if nom in ("update", "delete"):
+        operations = commande.get(f"{nom}s") or [{}]
+        return {"q": forme_requete(operations[0].get("q", {}))}
+    return {}
+
+def analyser_plan(resultat: dict) -> dict:
+    """Résume un résultat d'explain : étapes du plan gagnant et statistiques d'exécution"""
+    etapes = []
+    statistiques = {}
+
+    def parcourir(noeud, dans_plan_gagnant=False):
+        if isinstance(noeud, dict):
+            if dans_plan_gagnant and "stage" in noeud:
+                etapes.append(noeud["stage"])
+            if "executionStats" in noeud and not statistiques:
+                statistiques.update(noeud["executionStats"])
+            for cle, valeur in noeud.items():
+                if cle == "rejectedPlans":
+                    continue
+                parcourir(valeur, dans_plan_gagnant or cle == "winningPlan")
+        elif isinstance(noeud, list):
+            for element in noeud:
+                parcourir(element, dans_plan_gagnant)
+
+    parcourir(resultat)
+    return {
+        "collscan": "COLLSCAN" in etapes,
+        "etapes": etapes,
+        "n_retournes": statistiques.get("nReturned"),
+        "documents_examines": statistiques.get("totalDocsExamined"),
+        "cles_examinees": statistiques.get("totalKeysExamined"),
+        "duree_execution_ms": statistiques.get("executionTimeMillis")
+    }
+
+class CapteurRequetesLentes:
+    """Agrège par forme les commandes MongoDB dépassant SLOW_QUERY_MS"""
+
+    def __init__(self, seuil_ms: float, max_entrees: int):
+        self.seuil_ms = seuil_ms
+        self.max_entrees = max_entrees
+        self._lock = threading.Lock()
+        self._en_cours = {}
+        self._entrees = {}
+
+    @property
+    def actif(self) -> bool:
+        return self.seuil_ms > 0
+
+    def debut(self, event):
+        if event.command_name in COMMANDES_EXPLICABLES:
+            with self._lock:
+                self._en_cours[(event.connection_id, event.request_id)] = event.command
+
+    def fin(self, event, route: Optional[str]):
+        with self._lock:
+            commande = self._en_cours.pop((event.connection_id, event.request_id), None)
+
+        duree_ms = event.duration_micros / 1000
+        if duree_ms < self.seuil_ms:
+            return
+
+        nom = event.command_name
+        collection = commande.get(nom) if commande else None
+        forme = extraire_forme_commande(nom, commande) if commande else {}
+        cle = (nom, str(collection), route, json.dumps(forme, sort_keys=True, default=str))
+
+        with self._lock:
+            entree = self._entrees.get(cle)
+            if entree is None:
+                if len(self._entrees) >= self.max_entrees:
+                    # Évincer l'entrée la moins coûteuse
+                    del self._entrees[min(self._entrees, key=lambda k: self._entrees[k]["duree_totale_ms"])]
+                entree = self._entrees[cle] = {
+                    "commande": nom,
+                    "collection": collection,
+                    "route": route,
+                    "forme": forme,
+                    "occurrences": 0,
+                    "duree_totale_ms": 0.0,
+                    "duree_max_ms": 0.0,
+                    "plan": None
+                }
+            entree["occurrences"] += 1
+            entree["duree_totale_ms"] += duree_ms
+            entree["duree_max_ms"] = max(entree["duree_max_ms"], duree_ms)
+            entree["derniere_occurrence"] = datetime.utcnow()
+            # Dernière commande réelle, conservée en mémoire uniquement pour l'explain
+            entree["_commande_brute"] = commande
+
+    def pires(self, top: int) -> List[dict]:
+        with self._lock:
+            return sorted(self._entrees.values(), key=lambda e: e["duree_totale_ms"], reverse=True)[:top]
+
+    def reinitialiser(self):
+        with self._lock:
+            self._entrees.clear()
+
+capteur_requetes_lentes = CapteurRequetesLentes(SLOW_QUERY_MS, SLOW_QUERY_MAX_ENTREES)
+
+class EcouteurCommandesMongo(monitoring.CommandListener):
+    """Mesure chaque commande MongoDB et l'attribue à la requête HTTP en cours"""
+
+    def started(self, event):
+        if capteur_requetes_lentes.actif:
+            capteur_requetes_lentes.debut(event)
+
+    def succeeded(self, event):
+        self._enregistrer(event, "succes")
+
+    def failed(self, event):
+        self._enregistrer(event, "echec")
+
+    def _enregistrer(self, event, resultat: str):
+        duree = event.duration_micros / 1_000_000
+        metriques.inc("mongo_commands_total", {"command": event.command_name, "result": resultat})
+        metriques.observe("mongo_command_duration_seconds", duree, {"command": event.command_name})
+
+        stats = stats_requete.get()
+        if stats is not None:
+            stats["mongo_durees"].append(duree)
+
+        if capteur_requetes_lentes.actif and event.command_name != "explain":
+            route = None
+            if stats is not None:
+                scope = stats["scope"]
+                route = getattr(scope.get("route"), "path", None) or scope.get("path")
+            capteur_requetes_lentes.fin(event, route)
+
+metriques.decrire("mongo_pool_checkout_wait_seconds", "histogram", "Attente d'une connexion du pool MongoDB")
+metriques.decrire("mongo_pool_checkout_failures_total", "counter", "Échecs d'obtention d'une connexion du pool par raison")
+metriques.decrire("mongo_pool_connections", "gauge", "Connexions ouvertes dans le pool MongoDB par serveur")
+metriques.decrire("mongo_pool_connections_in_use", "gauge", "Connexions empruntées au pool MongoDB par serveur")
+
+BUCKETS_ATTENTE_POOL = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+class EcouteurPoolMongo(monitoring.ConnectionPoolListener):
+    """Mesure l'attente des connexions : un pool saturé se voit ici avant d'être une latence HTTP"""
+
+    @staticmethod
+    def _serveur(event) -> Dict[str, str]:
+        return {"server": "%s:%s" % event.address}
+
+    def connection_checked_out(self, event):
+        metriques.observe("mongo_pool_checkout_wait_seconds", event.duration, buckets=BUCKETS_ATTENTE_POOL)
+        metriques.inc("mongo_pool_connections_in_use", self._serveur(event))
+
+    def connection_check_out_failed(self, event):
+        metriques.observe("mongo_pool_checkout_wait_seconds", event.duration, buckets=BUCKETS_ATTENTE_POOL)
+        metriques.inc("mongo_pool_checkout_failures_total", {"reason": str(event.reason)})
+
+    def connection_checked_in(self, event):
+        metriques.inc("mongo_pool_connections_in_use", self._serveur(event), -1)
+
+    def connection_created(self, event):
+        metriques.inc("mongo_pool_connections", self._serveur(event))
+
+    def connection_closed(self, event):
+        metriques.inc("mongo_pool_connections", self._serveur(event), -1)
+
+    # Événements sans métrique associée
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+class MetriquesMiddleware:
+    """Middleware ASGI : latence, statut et appels MongoDB par route"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = {"mongo_durees": [], "scope": scope}
+        jeton = stats_requete.set(stats)
+        reponse = {"statut": 500, "fin": None}
+        debut = time.perf_counter()
+
+        async def send_instrumente(message):
+            if message["type"] == "http.response.start":
+                reponse["statut"] = message["status"]
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                # Les tâches de fond s'exécutent après l'envoi : elles ne comptent pas dans la latence
+                reponse["fin"] = time.perf_counter()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_instrumente)
+        finally:
+            stats_requete.reset(jeton)
+            duree = (reponse["fin"] or time.perf_counter()) - debut
+
+            # Utiliser le modèle de route pour éviter une série par identifiant
+            route = getattr(scope.get("route"), "path", None) or "non_route"
+            labels = {"method": scope.get("method", ""), "route": route}
+
+            metriques.inc("http_requests_total", {**labels, "status": str(reponse["statut"])})
+            metriques.observe("http_request_duration_seconds", duree, labels)
+            metriques.observe("mongo_commands_per_request", len(stats["mongo_durees"]), labels, buckets=BUCKETS_APPELS_DB)
+            metriques.observe("mongo_time_per_request_seconds", sum(stats["mongo_durees"]), labels)
+
+app.add_middleware(MetriquesMiddleware)
+
+# ===== CONTRÔLE D'ADMISSION =====
+
+# Chaque classe de routes a sa propre limite de requêtes simultanées et sa file d'attente :
+# des rapports ou des listes complètes lancés en nombre ne privent plus la création de
+# factures ni les paiements. Variables ADMISSION_<CLASSE>_LIMITE, _FILE et _ATTENTE.
+def configuration_admission(classe: str, limite: int, file: int, attente: float, par_utilisateur: int, cede: bool,
+                            par_route: bool = False) -> dict:
+    prefixe = f"ADMISSION_{classe.upper()}_"
+    return {
+        "limite": int(os.environ.get(prefixe + "LIMITE", str(limite))),
+        # Au-delà, refus immédiat (503) plutôt qu'une attente qui finirait en délai dépassé
+        "file": int(os.environ.get(prefixe + "FILE", str(file))),
+        "attente_max": float(os.environ.get(prefixe + "ATTENTE", str(attente))),
+        # Requêtes simultanées d'un même utilisateur (0 : sans limite), refus en 429 ; par route
+        # ou pour toute la classe (une seule sauvegarde ou un seul import à la fois)
+        "par_utilisateur": par_utilisateur,
+        "par_route": par_route,
+        # N'admet rien tant qu'une écriture attend : les écritures gardent la priorité
+        "cede_aux_ecritures": cede,
+    }
+
+CLASSES_ADMISSION = {
+    "transactionnel": configuration_admission("transactionnel", 64, 256, 10, 0, False),
+    "liste": configuration_admission("liste", 32, 128, 5, 0, True),
+    # Le tableau de bord demande /api/stats et /api/vente/stats ensemble : un de chaque
+    "rapport": configuration_admission("rapport", 4, 16, 5, 1, True, par_route=True),
+    "export": configuration_admission("export", 2, 4, 2, 1, True),
+}
+
+# Premier motif qui correspond ; classe None : route jamais limitée
+ROUTES_ADMISSION = [
+    (re.compile(r"^/(metrics$|api/(auth/|health$|parametres/health$))"), None, None),
+    (re.compile(r"^/api/(import/|parametres/backup$|parametres/backups/[^/]+/restaurer$)"), {"POST"}, "export"),
+    (re.compile(r"^/api/(stats$|vente/stats$|outils/rapports/)"), {"GET"}, "rapport"),
+    (re.compile(r"^/api/"), {"POST", "PUT", "PATCH", "DELETE"}, "transactionnel"),
+    (re.compile(r"^/api/"), {"GET"}, "liste"),
+]
+
+BUCKETS_ATTENTE_ADMISSION = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+metriques.decrire("admission_wait_seconds", "histogram", "Attente en file avant admission par classe de routes")
+metriques.decrire("admission_rejections_total", "counter", "Requêtes refusées par classe et motif")
+metriques.decrire("admission_in_flight", "gauge", "Requêtes admises en cours par classe")
+
+def classe_admission(methode: str, chemin: str) -> Optional[str]:
+    for motif, methodes, classe in ROUTES_ADMISSION:
+        if motif.match(chemin) and (methodes is None or methode in methodes):
+            return classe
+    return None
+
+class RefusAdmission(Exception):
+    def __init__(self, statut: int, motif: str, detail: str, reessayer_apres: int):
+        self.statut, self.motif, self.detail, self.reessayer_apres = statut, motif, detail, reessayer_apres
+
+class ControleAdmission:
+    """Compteurs par classe partagés par les requêtes du worker, sous une même condition
+
+    Une seule condition pour toutes les classes : une écriture qui quitte la file
+    doit réveiller les classes qui lui cédaient la place.
+    """
+
+    def __init__(self, classes: dict):
+        self.classes = classes
+        self.condition = asyncio.Condition()
+        self.actives = {classe: 0 for classe in classes}
+        self.en_attente = {classe: 0 for classe in classes}
+        self.par_utilisateur: Dict[tuple, int] = {}
+
+    def _admissible(self, classe: str) -> bool:
+        configuration = self.classes[classe]
+        if configuration["cede_aux_ecritures"] and self.en_attente["transactionnel"] > 0:
+            return False
+        return self.actives[classe] < configuration["limite"]
+
+    def cle_utilisateur(self, classe: str, utilisateur: str, chemin: str) -> tuple:
+        return (classe, utilisateur, chemin if self.classes[classe]["par_route"] else None)
+
+    async def entrer(self, classe: str, utilisateur: str, chemin: str = "") -> float:
+        """Attend une place et renvoie l'attente, ou lève RefusAdmission"""
+        configuration = self.classes[classe]
+        cle_utilisateur = self.cle_utilisateur(classe, utilisateur, chemin)
+        if configuration["par_utilisateur"] and self.par_utilisateur.get(cle_utilisateur, 0) >= configuration["par_utilisateur"]:
+            raise RefusAdmission(429, "utilisateur", "Une requête de ce type est déjà en cours pour cet utilisateur", 5)
+
+        # Place libre et personne avant : admission immédiate, sans passer par la file
+        if self._admissible(classe) and not self.en_attente[classe]:
+            self.actives[classe] += 1
+            self.par_utilisateur[cle_utilisateur] = self.par_utilisateur.get(cle_utilisateur, 0) + 1
+            return 0.0
+        if self.en_attente[classe] >= configuration["file"]:
+            raise RefusAdmission(503, "file_pleine", "Serveur surchargé, réessayez dans quelques instants", 2)
+
+        debut = time.perf_counter()
+        self.en_attente[classe] += 1
+        # Compté dès la file : un même utilisateur ne peut pas y empiler ses requêtes
+        self.par_utilisateur[cle_utilisateur] = self.par_utilisateur.get(cle_utilisateur, 0) + 1
+        admis = False
+        try:
+            async with self.condition:
+                try:
+                    await asyncio.wait_for(
+                        self.condition.wait_for(lambda: self._admissible(classe)), configuration["attente_max"]
+                    )
+                    self.actives[classe] += 1
+                    admis = True
+                finally:
+                    # Verrou repris même après délai dépassé ou annulation
+                    self.en_attente[classe] -= 1
+                    if not admis:
+                        self._liberer_utilisateur(cle_utilisateur)
+                    if classe == "transactionnel":
+                        self.condition.notify_all()
+        except asyncio.TimeoutError:
+            raise RefusAdmission(503, "attente_depassee", "Serveur surchargé, réessayez dans quelques instants", 5)
+        return time.perf_counter() - debut
+
+    def _liberer_utilisateur(self, cle_utilisateur: tuple):
+        self.par_utilisateur[cle_utilisateur] -= 1
+        if not self.par_utilisateur[cle_utilisateur]:
+            del self.par_utilisateur[cle_utilisateur]
+
+    async def sortir(self, classe: str, utilisateur: str, chemin: str = ""):
+        self.actives[classe] -= 1
+        self._liberer_utilisateur(self.cle_utilisateur(classe, utilisateur, chemin))
+        async with self.condition:
+            self.condition.notify_all()
+
+controle_admission = ControleAdmission(CLASSES_ADMISSION)
+
+def utilisateur_admission(scope) -> str:
+    """Sujet du jeton (signature vérifiée, sans lecture en base), sinon adresse du client"""
+    for nom, valeur in scope.get("headers", []):
+        if nom == b"authorization":
+            schema, _, jeton = valeur.decode("latin-1").partition(" ")
+            if schema.lower() == "bearer":
+                try:
+                    return jwt.decode(jeton, SECRET_KEY, algorithms=[ALGORITHM]).get("sub") or "anonyme"
+                except JWTError:
+                    pass
+            break
+    client = scope.get("client")
+    return client[0] if client else "anonyme"
+
+class AdmissionMiddleware:
+    """Middleware ASGI : limite de concurrence et file par classe de routes, 429/503 avec Retry-After
+
+    Placé hors de MetriquesMiddleware : la latence HTTP mesure le traitement, l'attente
+    en file est mesurée à part (admission_wait_seconds).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        classe = classe_admission(scope.get("method", ""), scope.get("path", "")) if scope["type"] == "http" else None
+        if classe is None:
+            await self.app(scope, receive, send)
+            return
+
+        utilisateur = utilisateur_admission(scope)
+        chemin = scope.get("path", "")
+        try:
+            attente = await controle_admission.entrer(classe, utilisateur, chemin)
+        except RefusAdmission as refus:
+            metriques.inc("admission_rejections_total", {"class": classe, "reason": refus.motif})
+            reponse = JSONResponse(
+                {"detail": refus.detail}, status_code=refus.statut,
+                headers={"Retry-After": str(refus.reessayer_apres)}
+            )
+            await reponse(scope, receive, send)
+            return
+
+        metriques.observe("admission_wait_seconds", attente, {"class": classe}, buckets=BUCKETS_ATTENTE_ADMISSION)
+        metriques.inc("admission_in_flight", {"class": classe})
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            metriques.inc("admission_in_flight", {"class": classe}, -1)
+            await controle_admission.sortir(classe, utilisateur, chemin)
+
+app.add_middleware(AdmissionMiddleware)
+
+# ===== JOURNALISATION STRUCTURÉE =====
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+# Niveaux par module, ex. "facture=DEBUG,auth=WARNING"
+LOG_LEVELS = os.environ.get('LOG_LEVELS', '')
+LOG_BUFFER_SIZE = int(os.environ.get('LOG_BUFFER_SIZE', '1000'))
+
+# Identifiant de corrélation de la requête HTTP en cours
+request_id_courant: ContextVar[Optional[str]] = ContextVar("request_id_courant", default=None)
+
+# Attributs standards d'un LogRecord, exclus des champs supplémentaires
+ATTRIBUTS_LOG_STANDARDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+class FiltreRequestId(logging.Filter):
+    """Ajoute l'identifiant de requête au moment de l'émission (dans la tâche appelante)"""
+
+    def filter(self, record):
+        if not hasattr(record, "request_id"):
+            record.request_id = request_id_courant.get()
+        return True
+
+def entree_log(record: logging.LogRecord) -> dict:
+    """Convertit un LogRecord en entrée structurée"""
+    entree = {
+        "timestamp": datetime.utcfromtimestamp(record.created).isoformat(),
+        "level": record.levelname,
+        "module": record.name.split(".")[-1].upper(),
+        "message": record.getMessage(),
+        "request_id": getattr(record, "request_id", None)
+    }
+    for cle, valeur in vars(record).items():
+        if cle not in ATTRIBUTS_LOG_STANDARDS and not cle.startswith("_"):
+            entree[cle] = valeur
+    return entree
+
+class FormatteurJSON(logging.Formatter):
+    """Formate chaque entrée sur une ligne JSON"""
+
+    def format(self, record):
+        return json.dumps(entree_log(record), ensure_ascii=False, default=str)
+
+class TamponCirculaireHandler(logging.Handler):
+    """Conserve les dernières entrées en mémoire pour /api/parametres/logs"""
+
+    def __init__(self, capacite: int):
+        super().__init__()
+        self.entrees = deque(maxlen=capacite)
+
+    def emit(self, record):
+        self.entrees.append(entree_log(record))
+
+    def recentes(self) -> List[dict]:
+        with self.lock:
+            return list(self.entrees)
+
+class EcouteurLogs(logging.handlers.QueueListener):
+    """QueueListener redémarrable : start et stop sans effet s'il tourne déjà ou est déjà arrêté
+
+    Démarré dès l'import (scripts, logs d'initialisation) puis à chaque démarrage de
+    l'application : un second lifespan dans le même processus (tests) retrouve ses logs.
+    """
+
+    def start(self):
+        if self._thread is None:
+            super().start()
+
+    def stop(self):
+        if self._thread is not None:
+            super().stop()
+
+def configurer_journalisation():
+    """Configure le logger 'facturapp' : écriture hors de la boucle via QueueHandler/QueueListener"""
+    racine = logging.getLogger("facturapp")
+    racine.setLevel(LOG_LEVEL)
+    racine.propagate = False
+
+    for definition in filter(None, (d.strip() for d in LOG_LEVELS.split(","))):
+        module, _, niveau = definition.partition("=")
+        logging.getLogger(f"facturapp.{module.strip()}").setLevel(niveau.strip().upper())
+
+    file_logs = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(file_logs)
+    queue_handler.addFilter(FiltreRequestId())
+    racine.handlers = [queue_handler]
+
+    sortie = logging.StreamHandler()
+    sortie.setFormatter(FormatteurJSON())
+    tampon = TamponCirculaireHandler(LOG_BUFFER_SIZE)
+
+    listener = EcouteurLogs(file_logs, sortie, tampon, respect_handler_level=True)
+    listener.start()
+    return listener, tampon
+
+log_listener, log_tampon = configurer_journalisation()
+
+log_auth = logging.getLogger("facturapp.auth")
+log_facture = logging.getLogger("facturapp.facture")
+log_paiement = logging.getLogger("facturapp.paiement")
+log_devis = logging.getLogger("facturapp.devis")
+log_email = logging.getLogger("facturapp.email")
+log_propagation = logging.getLogger("facturapp.propagation")
+log_taux = logging.getLogger("facturapp.taux")
+
+class RequestIdMiddleware:
+    """Middleware ASGI : attribue un X-Request-ID à chaque requête et le renvoie"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for nom, valeur in scope.get("headers", []):
+            if nom == b"x-request-id":
+                request_id = valeur.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        jeton = request_id_courant.set(request_id)
+
+        async def send_avec_id(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_avec_id)
+        finally:
+            request_id_courant.reset(jeton)
+
+app.add_middleware(RequestIdMiddleware)
+
+# ===== COMPRESSION DES RÉPONSES =====
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# En dessous, l'en-tête et le temps CPU coûtent plus que le gain
+COMPRESSION_TAILLE_MIN = int(os.environ.get('COMPRESSION_TAILLE_MIN', '1024'))
+# Au-delà, la compression passe dans un thread pour ne pas bloquer la boucle asyncio
+COMPRESSION_TAILLE_THREAD = int(os.environ.get('COMPRESSION_TAILLE_THREAD', str(64 * 1024)))
+# Préférence du serveur à qualité égale côté client ; br et zstd nécessitent les paquets brotli / zstandard
+COMPRESSION_ENCODAGES = [
+    encodage.strip() for encodage in os.environ.get('COMPRESSION_ENCODAGES', 'zstd,br,gzip').split(',')
+    if encodage.strip()
+]
+
+# Niveaux rapides pour les petites réponses fréquentes
+NIVEAUX_COMPRESSION = {"gzip": 6, "br": 4, "zstd": 3}
+# Listes volumineuses et très répétitives envoyées aux agences sur liaisons lentes :
+# un niveau plus élevé se rentabilise largement (0 désactive la compression de la route)
+NIVEAUX_COMPRESSION_LISTES = {"gzip": 9, "br": 6, "zstd": 9}
+NIVEAUX_COMPRESSION_ROUTES = {
+    "/api/factures": NIVEAUX_COMPRESSION_LISTES,
+    "/api/bootstrap": NIVEAUX_COMPRESSION_LISTES,
+    "/api/sync": NIVEAUX_COMPRESSION_LISTES,
+    "/api/outils/rapports/stock-par-entrepot": NIVEAUX_COMPRESSION_LISTES,
+    "/api/outils/rapports/mouvements": NIVEAUX_COMPRESSION_LISTES,
+}
+
+TYPES_COMPRESSIBLES = ("application/json", "application/x-ndjson", "text/", "application/javascript", "image/svg+xml")
+BUCKETS_RATIO_COMPRESSION = (1, 1.5, 2, 3, 5, 10, 20, 50)
+BUCKETS_CPU_COMPRESSION = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+def encodages_disponibles() -> List[str]:
+    modules = {"gzip": gzip, "br": brotli, "zstd": zstandard}
+    return [encodage for encodage in COMPRESSION_ENCODAGES if modules.get(encodage) is not None]
+
+def choisir_encodage(accept_encoding: str) -> Optional[str]:
+    """Encodage négocié : meilleure qualité (q) côté client, puis ordre de préférence du serveur"""
+    qualites = {}
+    for element in accept_encoding.split(","):
+        nom, _, parametres = element.strip().partition(";")
+        qualite = 1.0
+        parametres = parametres.strip()
+        if parametres.startswith("q="):
+            try:
+                qualite = float(parametres[2:])
+            except ValueError:
+                qualite = 0.0
+        if nom:
+            qualites[nom.strip().lower()] = qualite
+    candidats = [
+        (qualites.get(encodage, qualites.get("*", 0.0)), -rang, encodage)
+        for rang, encodage in enumerate(encodages_disponibles())
+    ]
+    candidats = [candidat for candidat in candidats if candidat[0] > 0]
+    return max(candidats)[2] if candidats else None
+
+def compresser(encodage: str, corps: bytes, niveau: int) -> tuple:
+    """Corps compressé et temps CPU consommé (mesuré dans le thread qui compresse)"""
+    debut = time.thread_time()
+    if encodage == "gzip":
+        compresse = gzip.compress(corps, compresslevel=niveau, mtime=0)
+    elif encodage == "br":
+        compresse = brotli.compress(corps, quality=niveau)
+    else:
+        compresse = zstandard.ZstdCompressor(level=niveau).compress(corps)
+    return compresse, time.thread_time() - debut
+
+metriques.decrire("http_response_bytes_total", "counter", "Octets des réponses avant compression par route et encodage")
+metriques.decrire("http_response_compressed_bytes_total", "counter", "Octets des réponses après compression par route et encodage")
+metriques.decrire("http_compression_ratio", "histogram", "Taux de compression (taille initiale / taille compressée) par route")
+metriques.decrire("http_compression_cpu_seconds", "histogram", "Temps CPU de compression par route et encodage")
+
+class CompressionMiddleware:
+    """Middleware ASGI : compression négociée (zstd, br, gzip) des réponses d'un seul bloc
+
+    Les réponses en flux (plusieurs morceaux) passent sans compression. L'ETag d'une
+    réponse compressée devient faible : la représentation diffère, les données non.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for nom, valeur in scope.get("headers", []):
+            if nom == b"accept-encoding":
+                accept_encoding = valeur.decode("latin-1")
+                break
+        encodage = choisir_encodage(accept_encoding)
+        demarrage = {}
+
+        async def send_compresse(message):
+            if message["type"] == "http.response.start":
+                # Retenu jusqu'au corps : la taille décide de la compression
+                demarrage["message"] = message
+                return
+            if message["type"] != "http.response.body" or "message" not in demarrage:
+                await send(message)
+                return
+
+            debut = demarrage.pop("message")
+            entetes = [(nom.lower(), valeur) for nom, valeur in debut.get("headers", [])]
+            type_contenu = next((valeur for nom, valeur in entetes if nom == b"content-type"), b"").decode("latin-1")
+            deja_encode = any(nom == b"content-encoding" for nom, valeur in entetes)
+            compressible = type_contenu.startswith(TYPES_COMPRESSIBLES) and not deja_encode
+            if compressible:
+                entetes.append((b"vary", b"Accept-Encoding"))
+
+            route = getattr(scope.get("route"), "path", None) or "non_route"
+            niveau = NIVEAUX_COMPRESSION_ROUTES.get(route, NIVEAUX_COMPRESSION).get(encodage, 0) if encodage else 0
+            corps = message.get("body", b"")
+            if (not compressible or niveau <= 0 or message.get("more_body", False)
+                    or debut["status"] in (204, 304) or len(corps) < COMPRESSION_TAILLE_MIN):
+                await send({**debut, "headers": entetes})
+                await send(message)
+                return
+
+            if len(corps) > COMPRESSION_TAILLE_THREAD:
+                compresse, cpu = await asyncio.to_thread(compresser, encodage, corps, niveau)
+            else:
+                compresse, cpu = compresser(encodage, corps, niveau)
+
+            labels = {"route": route, "encoding": encodage}
+            metriques.inc("http_response_bytes_total", labels, len(corps))
+            metriques.observe("http_compression_cpu_seconds", cpu, labels, buckets=BUCKETS_CPU_COMPRESSION)
+            if len(compresse) >= len(corps):
+                metriques.inc("http_response_compressed_bytes_total", labels, len(corps))
+                await send({**debut, "headers": entetes})
+                await send(message)
+                return
+            metriques.inc("http_response_compressed_bytes_total", labels, len(compresse))
+            metriques.observe("http_compression_ratio", len(corps) / len(compresse), labels, buckets=BUCKETS_RATIO_COMPRESSION)
+
+            entetes = [
+                (nom, b"W/" + valeur if nom == b"etag" and not valeur.startswith(b"W/") else valeur)
+                for nom, valeur in entetes if nom != b"content-length"
+            ]
+            entetes += [(b"content-encoding", encodage.encode("latin-1")), (b"content-length", str(len(compresse)).encode("latin-1"))]
+            await send({**debut, "headers": entetes})
+            await send({**message, "body": compresse})
+
+        await self.app(scope, receive, send_compresse)
+
+app.add_middleware(CompressionMiddleware)
+
+# CORS : ajouté en dernier, donc le plus extérieur. Les réponses des autres middlewares
+# (refus d'admission 429/503) portent aussi les en-têtes CORS, et le navigateur laisse
+# l'application lire Retry-After
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After"],
 )
 
-# MongoDB client
-client = AsyncIOMotorClient(MONGO_URL)
-db = client.billing_app
+# ===== CLIENT MONGODB =====
+
+# Options du pool : une variable non définie garde la valeur par défaut du pilote
+OPTIONS_POOL_MONGO = {
+    "maxPoolSize": ("MONGO_MAX_POOL_SIZE", int),
+    "minPoolSize": ("MONGO_MIN_POOL_SIZE", int),
+    "maxIdleTimeMS": ("MONGO_MAX_IDLE_TIME_MS", int),
+    "maxConnecting": ("MONGO_MAX_CONNECTING", int),
+    "waitQueueTimeoutMS": ("MONGO_WAIT_QUEUE_TIMEOUT_MS", int),
+    "serverSelectionTimeoutMS": ("MONGO_SERVER_SELECTION_TIMEOUT_MS", int),
+    "connectTimeoutMS": ("MONGO_CONNECT_TIMEOUT_MS", int),
+    "socketTimeoutMS": ("MONGO_SOCKET_TIMEOUT_MS", int),
+    # Ex. "zstd,snappy" : nécessite les paquets zstandard / python-snappy, sinon ignoré par le pilote
+    "compressors": ("MONGO_COMPRESSORS", str),
+    "zlibCompressionLevel": ("MONGO_ZLIB_COMPRESSION_LEVEL", int),
+}
+
+# Lectures des rapports : secondaires si disponibles, pour ne pas concurrencer les écritures
+MONGO_RAPPORTS_READ_PREFERENCE = os.environ.get('MONGO_RAPPORTS_READ_PREFERENCE', 'secondaryPreferred')
+MONGO_RAPPORTS_MAX_STALENESS_SECONDES = int(os.environ.get('MONGO_RAPPORTS_MAX_STALENESS_SECONDES', '-1'))
+
+def options_client_mongo() -> Dict[str, Any]:
+    options = {}
+    for option, (variable, conversion) in OPTIONS_POOL_MONGO.items():
+        valeur = os.environ.get(variable)
+        if valeur:
+            options[option] = conversion(valeur)
+    return options
+
+def preference_lecture_rapports():
+    if MONGO_RAPPORTS_READ_PREFERENCE == "primary":
+        return read_preferences.Primary()
+    modes = {
+        "primaryPreferred": read_preferences.PrimaryPreferred,
+        "secondary": read_preferences.Secondary,
+        "secondaryPreferred": read_preferences.SecondaryPreferred,
+        "nearest": read_preferences.Nearest,
+    }
+    if MONGO_RAPPORTS_READ_PREFERENCE not in modes:
+        raise RuntimeError(f"MONGO_RAPPORTS_READ_PREFERENCE invalide: {MONGO_RAPPORTS_READ_PREFERENCE}")
+    return modes[MONGO_RAPPORTS_READ_PREFERENCE](max_staleness=MONGO_RAPPORTS_MAX_STALENESS_SECONDES)
+
+# Collections suivies par la synchronisation incrémentale (GET /api/sync)
+COLLECTIONS_SYNCHRONISEES = {
+    "clients", "produits", "services", "taux_change", "factures", "paiements", "devis",
+    "opportunites", "commandes", "users", "outils", "affectations_outils", "entrepots",
+}
+
+# Collections de référence servies en GET conditionnel : chaque écriture incrémente leur version
+COLLECTIONS_VERSIONNEES = {"clients", "produits", "entrepots", "taux_change", "app_config"}
+
+def horodater_modification(maj, maintenant: datetime):
+    """Ajoute date_modification à une mise à jour (opérateurs ou pipeline)"""
+    if isinstance(maj, list):
+        return maj + [{"$set": {"date_modification": maintenant}}]
+    if set(maj) == {"$setOnInsert"}:
+        # Upsert d'amorçage : le document existant n'est pas modifié
+        return {"$setOnInsert": {**maj["$setOnInsert"], "date_modification": maintenant}}
+    maj = dict(maj)
+    if "$setOnInsert" in maj and "date_modification" in maj["$setOnInsert"]:
+        maj["$setOnInsert"] = {k: v for k, v in maj["$setOnInsert"].items() if k != "date_modification"}
+    maj["$set"] = {**maj.get("$set", {}), "date_modification": maintenant}
+    return maj
+
+class CollectionHorodatee:
+    """Collection dont les écritures tiennent date_modification à jour et journalisent les suppressions
+
+    insert, update, replace et find_one_and_update horodatent les documents ;
+    delete_one, delete_many et find_one_and_delete laissent une pierre tombale
+    dans la collection suppressions. bulk_write n'est pas réécrit : les appelants
+    horodatent eux-mêmes leurs opérations. Le reste est délégué à la collection Motor.
+
+    Avec versions, toute écriture incrémente ensuite la version de la collection
+    (ETag des GET conditionnels) ; l'incrément suit l'écriture pour qu'un ETag ne
+    désigne jamais des données plus anciennes que sa version.
+    """
+
+    def __init__(self, collection, suppressions, versions=None):
+        self._collection = collection
+        self._suppressions = suppressions
+        self._versions = versions
+
+    def __getattr__(self, nom):
+        return getattr(self._collection, nom)
+
+    async def _nouvelle_version(self, resultat):
+        if self._versions is not None:
+            await self._versions.update_one(
+                {"_id": self._collection.name},
+                {"$inc": {"version": 1}, "$set": {"date_modification": datetime.utcnow()}},
+                upsert=True
+            )
+        return resultat
+
+    async def insert_one(self, document, *args, **kwargs):
+        if isinstance(document, dict):
+            document["date_modification"] = datetime.now()
+        return await self._nouvelle_version(await self._collection.insert_one(document, *args, **kwargs))
+
+    async def insert_many(self, documents, *args, **kwargs):
+        maintenant = datetime.now()
+        documents = list(documents)
+        for document in documents:
+            # Les RawBSONDocument de la restauration restent tels quels
+            if isinstance(document, dict):
+                document["date_modification"] = maintenant
+        return await self._nouvelle_version(await self._collection.insert_many(documents, *args, **kwargs))
+
+    async def update_one(self, filtre, maj, *args, **kwargs):
+        return await self._nouvelle_version(await self._collection.update_one(
+            filtre, horodater_modification(maj, datetime.now()), *args, **kwargs
+        ))
+
+    async def update_many(self, filtre, maj, *args, **kwargs):
+        return await self._nouvelle_version(await self._collection.update_many(
+            filtre, horodater_modification(maj, datetime.now()), *args, **kwargs
+        ))
+
+    async def find_one_and_update(self, filtre, maj, *args, **kwargs):
+        return await self._nouvelle_version(await self._collection.find_one_and_update(
+            filtre, horodater_modification(maj, datetime.now()), *args, **kwargs
+        ))
+
+    async def replace_one(self, filtre, document, *args, **kwargs):
+        return await self._nouvelle_version(await self._collection.replace_one(
+            filtre, {**document, "date_modification": datetime.now()}, *args, **kwargs
+        ))
+
+    async def bulk_write(self, operations, *args, **kwargs):
+        return await self._nouvelle_version(await self._collection.bulk_write(operations, *args, **kwargs))
+
+    async def _enterrer(self, identifiants: list):
+        if identifiants:
+            maintenant = datetime.now()
+            await self._suppressions.insert_many([
+                {"entite": self._collection.name, "id": str(identifiant), "date_suppression": maintenant}
+                for identifiant in identifiants
+            ], ordered=False)
+
+    async def delete_one(self, filtre, *args, **kwargs):
+        document = await self._collection.find_one(filtre, {"_id": 1})
+        if document is None:
+            return await self._collection.delete_one(filtre, *args, **kwargs)
+        resultat = await self._collection.delete_one({"_id": document["_id"]}, *args, **kwargs)
+        if resultat.deleted_count:
+            await self._enterrer([document["_id"]])
+            await self._nouvelle_version(resultat)
+        return resultat
+
+    async def delete_many(self, filtre, *args, **kwargs):
+        identifiants = [document["_id"] async for document in self._collection.find(filtre, {"_id": 1})]
+        resultat = await self._collection.delete_many({"_id": {"$in": identifiants}}, *args, **kwargs)
+        await self._enterrer(identifiants)
+        return await self._nouvelle_version(resultat)
+
+    async def find_one_and_delete(self, filtre, *args, **kwargs):
+        document = await self._collection.find_one_and_delete(filtre, *args, **kwargs)
+        if document is not None:
+            await self._enterrer([document["_id"]])
+            await self._nouvelle_version(document)
+        return document
+
+class BaseHorodatee:
+    """Base MongoDB dont les collections synchronisées ou versionnées sont enveloppées dans CollectionHorodatee"""
+
+    def __init__(self, base):
+        self._base = base
+
+    def __getattr__(self, nom):
+        return self[nom]
+
+    def __getitem__(self, nom):
+        collection = self._base[nom]
+        if nom in COLLECTIONS_SYNCHRONISEES or nom in COLLECTIONS_VERSIONNEES:
+            return CollectionHorodatee(
+                collection, self._base["suppressions"],
+                self._base["versions_collections"] if nom in COLLECTIONS_VERSIONNEES else None
+            )
+        return collection
+
+    # Méthodes de la base elle-même (commandes, flux de changements, liste des collections...)
+    def command(self, *args, **kwargs):
+        return self._base.command(*args, **kwargs)
+
+    def watch(self, *args, **kwargs):
+        return self._base.watch(*args, **kwargs)
+
+    def list_collection_names(self, *args, **kwargs):
+        return self._base.list_collection_names(*args, **kwargs)
+
+    def create_collection(self, *args, **kwargs):
+        return self._base.create_collection(*args, **kwargs)
+
+    def get_collection(self, *args, **kwargs):
+        return self._base.get_collection(*args, **kwargs)
+
+    def collection_brute(self, nom):
+        """Collection Motor sans horodatage ni pierres tombales (restauration en masse)"""
+        return self._base[nom]
+
+    @property
+    def name(self):
+        return self._base.name
+
+    @property
+    def client(self):
+        return self._base.client
+
+client = AsyncIOMotorClient(
+    MONGO_URL,
+    event_listeners=[EcouteurCommandesMongo(), EcouteurPoolMongo()],
+    **options_client_mongo()
+)
+db = BaseHorodatee(client[DB_NAME])
+# Même pool, autre préférence de lecture : réservé aux statistiques et rapports en lecture seule
+db_rapports = client.get_database(DB_NAME, read_preference=preference_lecture_rapports())
 
 # Taux de change par défaut
 TAUX_CHANGE = {
@@ -117,8 +1277,11 @@ class Produit(BaseModel):
 
 
 class LigneFacture(BaseModel):
-    service_id: str
-    nom_service: str
+    # Les lignes envoyées par l'interface et issues des devis référencent un produit
+    produit_id: Optional[str] = None
+    nom_produit: Optional[str] = None
+    service_id: Optional[str] = None
+    nom_service: Optional[str] = None
     quantite: float
     prix_unitaire_usd: float
     prix_unitaire_fc: float
@@ -665,31 +1828,1082 @@ async def mettre_a_jour_stock(produit_id: str, quantite_vendue: float, motif: st
         "date_mouvement": datetime.now()
     }
     
-    await db.mouvements_stock.insert_one(mouvement)
+    await journal_mouvements.journaliser("mouvements_stock", mouvement)
+
+# ===== TRAVAUX DE FOND PERSISTANTS =====
+
+# Les travaux longs (envois d'emails, propagations, sauvegardes, imports...) sont
+# enregistrés dans la collection jobs puis exécutés par un worker : celui intégré
+# au processus API, ou `python worker.py` lancé à part pour que le traitement par
+# lots n'influe pas sur la latence de l'API. Un worker réserve un travail pour la
+# durée d'un bail qu'il renouvelle tant qu'il travaille ; si le processus meurt,
+# le bail expire et un autre worker reprend le travail.
+JOBS_WORKER_INTEGRE = os.environ.get('JOBS_WORKER_INTEGRE', 'true').lower() in ('1', 'true', 'yes', 'oui')
+JOBS_BAIL_SECONDES = int(os.environ.get('JOBS_BAIL_SECONDES', '60'))
+JOBS_TENTATIVES_MAX = int(os.environ.get('JOBS_TENTATIVES_MAX', '5'))
+JOBS_DELAI_BASE_SECONDES = float(os.environ.get('JOBS_DELAI_BASE_SECONDES', '5'))
+JOBS_DELAI_MAX_SECONDES = float(os.environ.get('JOBS_DELAI_MAX_SECONDES', '600'))
+JOBS_SONDAGE_SECONDES = float(os.environ.get('JOBS_SONDAGE_SECONDES', '1'))
+# Les travaux terminés ou abandonnés sont purgés après ce délai
+JOBS_RETENTION_JOURS = int(os.environ.get('JOBS_RETENTION_JOURS', '7'))
+# Travaux simultanés par type et par worker, ex. "email=8,sauvegarde=1"
+CONCURRENCE_TRAVAUX_DEFAUT = {
+    "email": 8,
+    "propagation_noms": 4,
+    "reconciliation_noms": 1,
+    "sauvegarde": 1,
+    "increment": 1,
+    "restauration": 1,
+    "import": 2,
+    "recalcul_prix": 1,
+}
+JOBS_CONCURRENCE = {
+    **CONCURRENCE_TRAVAUX_DEFAUT,
+    **{
+        type_travail.strip(): int(limite)
+        for type_travail, limite in (
+            element.split("=") for element in os.environ.get('JOBS_CONCURRENCE', '').split(",") if "=" in element
+        )
+    }
+}
 
-async def init_demo_data():
-    """Initialise des données de démonstration"""
-    # Nettoyer et réinitialiser les données pour corriger les erreurs
-    await db.clients.delete_many({})
-    await db.produits.delete_many({})
-    await db.factures.delete_many({})
-    await db.taux_change.delete_many({})
+log_travaux = logging.getLogger("facturapp.jobs")
+metriques.decrire("jobs_total", "counter", "Travaux de fond exécutés par type et résultat")
+metriques.decrire("job_duration_seconds", "histogram", "Durée d'exécution des travaux de fond par type")
+
+BUCKETS_DUREE_TRAVAUX = (0.01, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0)
+
+# Type de travail -> coroutine appelée avec les paramètres enregistrés
+GESTIONNAIRES_TRAVAUX = {}
+
+# Tentative du travail en cours d'exécution : (numéro, maximum) ; (1, 1) hors worker
+tentative_travail: ContextVar[tuple] = ContextVar("tentative_travail", default=(1, 1))
+
+def statut_echec() -> str:
+    """Statut du document métier après un échec : erreur seulement si le travail ne sera plus repris
+
+    Le gestionnaire enregistre ce statut puis relève l'exception, que le worker transforme
+    en nouvelle tentative ou en abandon.
+    """
+    numero, maximum = tentative_travail.get()
+    return "erreur" if numero >= maximum else "en_attente"
+
+def travail_de_fond(type_travail: str):
+    """Déclare la coroutine exécutée pour un type de travail"""
+    def enregistrer(gestionnaire):
+        GESTIONNAIRES_TRAVAUX[type_travail] = gestionnaire
+        return gestionnaire
+    return enregistrer
+
+async def planifier_travail(type_travail: str, params: Optional[dict] = None, tentatives_max: Optional[int] = None,
+                            identifiant: Optional[str] = None, disponible_a: Optional[datetime] = None) -> str:
+    """Enregistre un travail ; il survit aux redémarrages jusqu'à son exécution
+
+    Un identifiant fixe rend l'enregistrement unique (DuplicateKeyError s'il existe déjà).
+    """
+    maintenant = datetime.utcnow()
+    travail = {
+        "id": identifiant or str(uuid.uuid4()),
+        "type": type_travail,
+        "params": params or {},
+        "statut": "en_attente",
+        "tentatives": 0,
+        "tentatives_max": tentatives_max or JOBS_TENTATIVES_MAX,
+        "disponible_a": disponible_a or maintenant,
+        "date_creation": maintenant
+    }
+    await db.jobs.insert_one(travail)
+    return travail["id"]
+
+def delai_nouvelle_tentative(tentatives: int) -> float:
+    """Attente exponentielle plafonnée, avec une part aléatoire pour étaler les reprises"""
+    delai = min(JOBS_DELAI_MAX_SECONDES, JOBS_DELAI_BASE_SECONDES * 2 ** max(0, tentatives - 1))
+    return delai / 2 + secrets.randbelow(1000) / 1000 * delai / 2
+
+class WorkerTravaux:
+    """Réserve les travaux disponibles et les exécute dans la limite de concurrence de chaque type"""
+
+    def __init__(self, types: Optional[List[str]] = None):
+        self.identifiant = f"{os.uname().nodename}:{os.getpid()}:{secrets.token_hex(3)}"
+        self.types = types or sorted(GESTIONNAIRES_TRAVAUX)
+        self.en_cours = {type_travail: set() for type_travail in self.types}
+        self.arret = asyncio.Event()
+
+    def types_disponibles(self) -> List[str]:
+        return [t for t in self.types if len(self.en_cours[t]) < JOBS_CONCURRENCE.get(t, 1)]
+
+    async def reserver(self, types: List[str]) -> Optional[dict]:
+        """Prend atomiquement le plus ancien travail prêt, ou dont le bail a expiré"""
+        maintenant = datetime.utcnow()
+        return await db.jobs.find_one_and_update(
+            {
+                "type": {"$in": types},
+                "$or": [
+                    {"statut": "en_attente", "disponible_a": {"$lte": maintenant}},
+                    {"statut": "en_cours", "bail_expire": {"$lt": maintenant}},
+                ]
+            },
+            {
+                "$set": {
+                    "statut": "en_cours",
+                    "worker": self.identifiant,
+                    "bail_expire": maintenant + timedelta(seconds=JOBS_BAIL_SECONDES),
+                    "date_debut": maintenant
+                },
+                "$inc": {"tentatives": 1}
+            },
+            sort=[("disponible_a", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def renouveler_bail(self, travail: dict):
+        while True:
+            await asyncio.sleep(JOBS_BAIL_SECONDES / 3)
+            resultat = await db.jobs.update_one(
+                {"id": travail["id"], "worker": self.identifiant, "statut": "en_cours"},
+                {"$set": {"bail_expire": datetime.utcnow() + timedelta(seconds=JOBS_BAIL_SECONDES)}}
+            )
+            if resultat.matched_count == 0:
+                log_travaux.warning("Bail du travail %s (%s) perdu", travail["id"], travail["type"])
+                return
+
+    async def executer(self, travail: dict):
+        type_travail = travail["type"]
+        filtre = {"id": travail["id"], "worker": self.identifiant}
+        if travail["tentatives"] > travail["tentatives_max"]:
+            # Bail expiré à la dernière tentative : le worker est mort en l'exécutant
+            await db.jobs.update_one(filtre, {"$set": {
+                "statut": "erreur", "erreur": "Abandonné après expiration du bail", "date_fin": datetime.utcnow()
+            }})
+            metriques.inc("jobs_total", {"type": type_travail, "resultat": "abandon"})
+            return
+
+        bail = asyncio.create_task(self.renouveler_bail(travail))
+        debut = time.perf_counter()
+        # Propre à la tâche de ce travail (contexte copié par create_task)
+        tentative_travail.set((travail["tentatives"], travail["tentatives_max"]))
+        try:
+            resultat = await GESTIONNAIRES_TRAVAUX[type_travail](**travail["params"])
+        except Exception as e:
+            duree = time.perf_counter() - debut
+            if travail["tentatives"] < travail["tentatives_max"]:
+                delai = delai_nouvelle_tentative(travail["tentatives"])
+                log_travaux.warning(
+                    "Travail %s (%s) en échec, tentative %d/%d, reprise dans %.0fs: %s",
+                    travail["id"], type_travail, travail["tentatives"], travail["tentatives_max"], delai, e
+                )
+                await db.jobs.update_one(filtre, {"$set": {
+                    "statut": "en_attente",
+                    "erreur": str(e),
+                    "disponible_a": datetime.utcnow() + timedelta(seconds=delai)
+                }})
+                metriques.inc("jobs_total", {"type": type_travail, "resultat": "reprise"})
+            else:
+                log_travaux.exception("Travail %s (%s) abandonné après %d tentatives", travail["id"], type_travail, travail["tentatives"])
+                await db.jobs.update_one(filtre, {"$set": {"statut": "erreur", "erreur": str(e), "date_fin": datetime.utcnow()}})
+                metriques.inc("jobs_total", {"type": type_travail, "resultat": "erreur"})
+        else:
+            duree = time.perf_counter() - debut
+            await db.jobs.update_one(filtre, {
+                "$set": {
+                    "statut": "termine",
+                    "resultat": resultat if isinstance(resultat, dict) else None,
+                    "duree_secondes": round(duree, 3),
+                    "date_fin": datetime.utcnow()
+                },
+                "$unset": {"erreur": ""}
+            })
+            metriques.inc("jobs_total", {"type": type_travail, "resultat": "termine"})
+        finally:
+            bail.cancel()
+        metriques.observe("job_duration_seconds", duree, {"type": type_travail}, buckets=BUCKETS_DUREE_TRAVAUX)
+
+    def lancer(self, travail: dict):
+        taches = self.en_cours[travail["type"]]
+        tache = asyncio.create_task(self.executer(travail))
+        taches.add(tache)
+        tache.add_done_callback(taches.discard)
+
+    async def boucle(self):
+        log_travaux.info("Worker %s démarré (%s)", self.identifiant, ", ".join(self.types))
+        while not self.arret.is_set():
+            try:
+                types = self.types_disponibles()
+                travail = await self.reserver(types) if types else None
+            except Exception as e:
+                log_travaux.exception("Erreur lors de la réservation d'un travail: %s", e)
+                travail = None
+            if travail is not None:
+                self.lancer(travail)
+                continue
+            try:
+                await asyncio.wait_for(self.arret.wait(), JOBS_SONDAGE_SECONDES)
+            except asyncio.TimeoutError:
+                pass
+
+    async def arreter(self, delai: float = 30):
+        """Arrêt propre : plus de réservation, les travaux en cours ont delai secondes pour finir"""
+        self.arret.set()
+        taches = [tache for taches in self.en_cours.values() for tache in taches]
+        if taches:
+            await asyncio.wait(taches, timeout=delai)
+        # Les travaux non terminés seront repris à l'expiration de leur bail
+
+worker_integre: Optional[WorkerTravaux] = None
+
+# ===== ÉCRITURES DIFFÉRÉES =====
+
+# Mises à jour non critiques (dernière connexion...) regroupées par document et écrites
+# par lots : la requête n'attend plus MongoDB. Seul un arrêt brutal du processus les perd.
+ECRITURES_DIFFEREES_INTERVALLE_SECONDES = float(os.environ.get('ECRITURES_DIFFEREES_INTERVALLE_SECONDES', '2'))
+# Documents en attente au-delà desquels le tampon est vidé sans attendre l'intervalle
+ECRITURES_DIFFEREES_MAX = int(os.environ.get('ECRITURES_DIFFEREES_MAX', '1000'))
+
+log_ecritures = logging.getLogger("facturapp.ecritures")
+
+metriques.decrire("deferred_writes_total", "counter", "Mises à jour différées reçues par collection")
+metriques.decrire("deferred_writes_flushed_total", "counter", "Documents écrits par les vidages, par collection et résultat")
+metriques.decrire("deferred_writes_flush_seconds", "histogram", "Durée des vidages du tampon d'écritures différées")
+
+class TamponEcritures:
+    """Tampon write-behind : dernières valeurs $set par document, vidées par bulk_write
+
+    Plusieurs mises à jour d'un même document entre deux vidages n'en font qu'une.
+    Un lot en échec revient dans le tampon sans écraser les valeurs reçues entre-temps.
+    """
+
+    def __init__(self):
+        # (collection, filtre figé) -> {"filtre": ..., "champs": ...}
+        self.en_attente: Dict[tuple, dict] = {}
+        self.verrou = asyncio.Lock()
+        self.reveil = asyncio.Event()
+        self.arret = False
+
+    @staticmethod
+    def _cle(collection: str, filtre: dict) -> tuple:
+        return collection, tuple(sorted((champ, str(valeur)) for champ, valeur in filtre.items()))
+
+    def differer(self, collection: str, filtre: dict, champs: dict):
+        entree = self.en_attente.setdefault(self._cle(collection, filtre), {"filtre": filtre, "champs": {}})
+        entree["champs"].update(champs)
+        metriques.inc("deferred_writes_total", {"collection": collection})
+        if len(self.en_attente) >= ECRITURES_DIFFEREES_MAX:
+            self.reveil.set()
+
+    async def vider(self):
+        async with self.verrou:
+            lot, self.en_attente = self.en_attente, {}
+            if not lot:
+                return
+            debut = time.perf_counter()
+            par_collection: Dict[str, list] = {}
+            for (collection, _), entree in lot.items():
+                par_collection.setdefault(collection, []).append(entree)
+
+            maintenant = datetime.now()
+            for collection, entrees in par_collection.items():
+                operations = []
+                for entree in entrees:
+                    maj = {"$set": entree["champs"]}
+                    # bulk_write n'est pas horodaté par CollectionHorodatee
+                    if collection in COLLECTIONS_SYNCHRONISEES:
+                        maj = horodater_modification(maj, maintenant)
+                    operations.append(UpdateOne(entree["filtre"], maj))
+                try:
+                    await db[collection].bulk_write(operations, ordered=False)
+                    metriques.inc("deferred_writes_flushed_total", {"collection": collection, "result": "ok"}, len(entrees))
+                except Exception:
+                    log_ecritures.exception("Échec du vidage de %d écritures différées sur %s", len(entrees), collection)
+                    metriques.inc("deferred_writes_flushed_total", {"collection": collection, "result": "error"}, len(entrees))
+                    for entree in entrees:
+                        cle = self._cle(collection, entree["filtre"])
+                        recente = self.en_attente.get(cle)
+                        if recente is not None:
+                            entree["champs"].update(recente["champs"])
+                        self.en_attente[cle] = entree
+            metriques.observe("deferred_writes_flush_seconds", time.perf_counter() - debut)
+
+    def demarrer(self) -> asyncio.Task:
+        """Réarme le tampon arrêté par un lifespan précédent (boucle asyncio éventuellement neuve)"""
+        self.arret = False
+        self.verrou = asyncio.Lock()
+        self.reveil = asyncio.Event()
+        return asyncio.create_task(self.boucle())
+
+    async def boucle(self):
+        while not self.arret:
+            try:
+                await asyncio.wait_for(self.reveil.wait(), ECRITURES_DIFFEREES_INTERVALLE_SECONDES)
+            except asyncio.TimeoutError:
+                pass
+            self.reveil.clear()
+            await self.vider()
+
+    async def arreter(self):
+        """Dernier vidage, garanti à l'arrêt normal du serveur"""
+        self.arret = True
+        self.reveil.set()
+        await self.vider()
+        if self.en_attente:
+            log_ecritures.error("%d écritures différées perdues à l'arrêt", len(self.en_attente))
+
+tampon_ecritures = TamponEcritures()
+
+# ===== JOURNAL DES MOUVEMENTS =====
+
+# Group commit des journaux mouvements_stock et mouvements_outils : les mouvements reçus
+# pendant l'écriture précédente (ou pendant le délai) partent ensemble dans un bulk_write
+JOURNAL_DELAI_MAX_MS = float(os.environ.get('JOURNAL_DELAI_MAX_MS', '5'))
+JOURNAL_LOT_MAX = int(os.environ.get('JOURNAL_LOT_MAX', '500'))
+# Mouvements non écrits : nouveaux essais en arrière-plan, attente doublée à chaque fois
+JOURNAL_TENTATIVES_MAX = int(os.environ.get('JOURNAL_TENTATIVES_MAX', '8'))
+JOURNAL_REPRISE_DELAI_SECONDES = float(os.environ.get('JOURNAL_REPRISE_DELAI_SECONDES', '1'))
+
+# Historique rangé en seaux d'un élément et d'un mois : l'historique d'un produit ou une
+# période ne lit que ses seaux, et un seul document (et une entrée d'index) couvre jusqu'à
+# MOUVEMENTS_PAR_SEAU mouvements. Journal -> (collection des seaux, champ de l'élément)
+JOURNAUX_MOUVEMENTS = {
+    "mouvements_stock": ("mouvements_stock_seaux", "produit_id"),
+    "mouvements_outils": ("mouvements_outils_seaux", "outil_id"),
+}
+MOUVEMENTS_PAR_SEAU = int(os.environ.get('MOUVEMENTS_PAR_SEAU', '200'))
+# Compression de bloc des seaux, plus forte que le snappy par défaut sur ces tableaux répétitifs
+COMPRESSION_SEAUX = {"wiredTiger": {"configString": "block_compressor=zstd"}}
+
+# Session de la transaction en cours : les mouvements journalisés dedans en font partie
+session_transaction: ContextVar[Optional[Any]] = ContextVar("session_transaction", default=None)
+
+log_journal = logging.getLogger("facturapp.journal")
+
+metriques.decrire("journal_movements_total", "counter", "Mouvements journalisés par collection et mode (lot ou transaction)")
+metriques.decrire("journal_batches_total", "counter", "bulk_write du journal des mouvements, par collection et résultat")
+metriques.decrire("journal_batch_size", "histogram", "Mouvements par bulk_write du journal")
+metriques.decrire("journal_retries_total", "counter", "Mouvements remis en file après un échec d'écriture, par collection")
+metriques.decrire("journal_movements_lost_total", "counter", "Mouvements abandonnés après JOURNAL_TENTATIVES_MAX essais, par collection")
+
+TAILLES_LOT_JOURNAL = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+@contextlib.asynccontextmanager
+async def transaction_mongo():
+    """Ouvre une transaction MongoDB (replica set requis) ; passer la session aux autres écritures"""
+    async with await client.start_session() as session:
+        async with session.start_transaction():
+            jeton = session_transaction.set(session)
+            try:
+                yield session
+            finally:
+                session_transaction.reset(jeton)
+
+def mois_mouvement(mouvement: dict) -> str:
+    date_mouvement = mouvement.get("date_mouvement")
+    return date_mouvement.strftime("%Y-%m") if isinstance(date_mouvement, datetime) else "inconnu"
+
+def operations_seaux(champ: str, mouvements: list) -> tuple:
+    """Mises à jour des seaux (élément, mois) et, pour chacune, les positions de ses mouvements
+
+    Un seau plein n'est plus ciblé : l'upsert en ouvre un nouveau pour le même mois. Le
+    dédoublonnage d'un rejeu se fait avant, par identifiant (ids_deja_journalises) : un
+    $addToSet ne verrait pas le même mouvement rangé dans un autre seau du mois.
+    date_modification date l'écriture elle-même (sauvegardes incrémentales par filigrane) ;
+    debut et fin bornent les dates des mouvements, anciennes pour une migration.
+    """
+    maintenant = datetime.now()
+    groupes: Dict[tuple, list] = {}
+    for position, mouvement in enumerate(mouvements):
+        groupes.setdefault((mouvement.get(champ), mois_mouvement(mouvement)), []).append(position)
+
+    operations, positions_operations = [], []
+    for (cle, mois), positions_groupe in groupes.items():
+        for debut in range(0, len(positions_groupe), MOUVEMENTS_PAR_SEAU):
+            positions = positions_groupe[debut:debut + MOUVEMENTS_PAR_SEAU]
+            contenu = [mouvements[position] for position in positions]
+            maj = {"$push": {"mouvements": {"$each": contenu}}, "$inc": {"n": len(contenu)},
+                   "$set": {"date_modification": maintenant}}
+            dates = [m["date_mouvement"] for m in contenu if isinstance(m.get("date_mouvement"), datetime)]
+            if dates:
+                maj["$min"] = {"debut": min(dates)}
+                maj["$max"] = {"fin": max(dates)}
+            operations.append(UpdateOne({champ: cle, "mois": mois, "n": {"$lt": MOUVEMENTS_PAR_SEAU}}, maj, upsert=True))
+            positions_operations.append(positions)
+    return operations, positions_operations
+
+async def creer_collection_seaux(collection: str):
+    """Crée la collection de seaux avec sa compression ; sans effet si elle existe"""
+    try:
+        await db.create_collection(collection, storageEngine=COMPRESSION_SEAUX)
+    except CollectionInvalid:
+        pass
+
+async def historique_mouvements(journal: str, cles: list) -> list:
+    """Mouvements des éléments, du plus récent au plus ancien, lus dans leurs seuls seaux"""
+    collection, champ = JOURNAUX_MOUVEMENTS[journal]
+    mouvements = []
+    async for seau in db[collection].find({champ: {"$in": cles}}, {"_id": 0, "mouvements": 1}):
+        mouvements.extend(seau["mouvements"])
+    mouvements.sort(
+        key=lambda m: m["date_mouvement"] if isinstance(m.get("date_mouvement"), datetime) else datetime.min,
+        reverse=True
+    )
+    return mouvements
+
+async def ids_deja_journalises(collection: str, champ: str, mouvements: list) -> set:
+    """Identifiants des mouvements déjà rangés dans leurs seaux (rejeu sans doublon)
+
+    La recherche passe par l'index (élément, mois) : seuls les seaux des éléments
+    et des mois concernés sont examinés.
+    """
+    ids = {mouvement["id"] for mouvement in mouvements if mouvement.get("id")}
+    if not ids:
+        return set()
+    filtre = {
+        champ: {"$in": list({mouvement.get(champ) for mouvement in mouvements})},
+        "mois": {"$in": list({mois_mouvement(mouvement) for mouvement in mouvements})},
+        "mouvements.id": {"$in": list(ids)},
+    }
+    deja = set()
+    async for seau in db[collection].find(filtre, {"_id": 0, "mouvements.id": 1}):
+        deja.update(mouvement.get("id") for mouvement in seau["mouvements"])
+    return deja & ids
+
+class JournalMouvements:
+    """Regroupe les mouvements en un bulk_write sur leurs seaux, un écrivain par journal
+
+    L'appelant qui attend reçoit l'acquittement de l'écriture majoritaire et journalisée
+    de son lot. L'opération métier étant déjà enregistrée, un échec ne lui est pas
+    transmis : les mouvements concernés sont retentés en arrière-plan (attente
+    exponentielle, sans doublon), puis abandonnés et journalisés en erreur après
+    JOURNAL_TENTATIVES_MAX essais. Dans une transaction, l'insertion est immédiate
+    et en fait partie : son erreur annule la transaction.
+    """
+
+    def __init__(self):
+        self.lots: Dict[str, list] = {}  # journal -> [(mouvement, future ou None, tentative)]
+        self.ecrivains: Dict[str, asyncio.Task] = {}
+        self.pleins: Dict[str, asyncio.Event] = {}
+        self.reprises: set = set()
+        self.arret = False
+
+    def _collection(self, nom: str):
+        # get_collection plutôt que with_options : même objet Motor réel ou simulé
+        return db.get_collection(nom, write_concern=WriteConcern(w="majority", j=True))
+
+    async def journaliser(self, collection: str, *mouvements: dict, attendre: bool = True):
+        if not mouvements:
+            return
+        session = session_transaction.get()
+        if session is not None:
+            nom, champ = JOURNAUX_MOUVEMENTS[collection]
+            operations, _ = operations_seaux(champ, list(mouvements))
+            await db[nom].bulk_write(operations, ordered=False, session=session)
+            metriques.inc("journal_movements_total", {"collection": collection, "mode": "transaction"}, len(mouvements))
+            return
+
+        boucle = asyncio.get_running_loop()
+        futures = [boucle.create_future() if attendre else None for _ in mouvements]
+        self._ajouter(collection, [(mouvement, future, 1) for mouvement, future in zip(mouvements, futures)])
+        metriques.inc("journal_movements_total", {"collection": collection, "mode": "lot"}, len(mouvements))
+        if attendre:
+            await asyncio.gather(*futures)
+
+    def _ajouter(self, collection: str, entrees: list):
+        lot = self.lots.setdefault(collection, [])
+        lot.extend(entrees)
+        if len(lot) >= JOURNAL_LOT_MAX:
+            self.pleins.setdefault(collection, asyncio.Event()).set()
+        if collection not in self.ecrivains:
+            self.ecrivains[collection] = asyncio.create_task(self._ecrivain(collection))
+
+    async def _ecrivain(self, collection: str):
+        plein = self.pleins.setdefault(collection, asyncio.Event())
+        try:
+            while self.lots.get(collection):
+                if len(self.lots[collection]) < JOURNAL_LOT_MAX and JOURNAL_DELAI_MAX_MS > 0 and not self.arret:
+                    try:
+                        await asyncio.wait_for(plein.wait(), JOURNAL_DELAI_MAX_MS / 1000)
+                    except asyncio.TimeoutError:
+                        pass
+                plein.clear()
+                lot = self.lots[collection][:JOURNAL_LOT_MAX]
+                del self.lots[collection][:JOURNAL_LOT_MAX]
+                await self._inserer(collection, lot)
+        finally:
+            # Aucun await entre le dernier test de la boucle et ce retrait : rien n'est oublié
+            self.ecrivains.pop(collection, None)
+
+    async def _inserer(self, collection: str, lot: list):
+        nom, champ = JOURNAUX_MOUVEMENTS[collection]
+        erreurs: Dict[int, Exception] = {}
+        try:
+            # Un essai précédent a pu écrire malgré son erreur (write concern, réseau)
+            rejoues = [mouvement for mouvement, _, tentative in lot if tentative > 1]
+            deja = await ids_deja_journalises(nom, champ, rejoues) if rejoues else set()
+            a_ecrire = [index for index, (mouvement, _, _) in enumerate(lot) if mouvement.get("id") not in deja]
+            if a_ecrire:
+                operations, positions_operations = operations_seaux(champ, [lot[index][0] for index in a_ecrire])
+                try:
+                    await self._collection(nom).bulk_write(operations, ordered=False)
+                except BulkWriteError as e:
+                    for erreur in e.details.get("writeErrors", []):
+                        echec = OperationFailure(erreur.get("errmsg", ""), erreur.get("code"))
+                        for position in positions_operations[erreur["index"]]:
+                            erreurs[a_ecrire[position]] = echec
+                    if not erreurs:  # write concern non satisfait : tout le lot est incertain
+                        erreurs = {index: e for index in a_ecrire}
+        except Exception as e:
+            erreurs = {index: e for index in range(len(lot))}
+
+        metriques.inc("journal_batches_total", {"collection": collection, "result": "error" if erreurs else "ok"})
+        metriques.observe("journal_batch_size", len(lot), buckets=TAILLES_LOT_JOURNAL)
+        a_reprendre, abandonnes = [], []
+        for index, (mouvement, future, tentative) in enumerate(lot):
+            if index in erreurs:
+                if tentative < JOURNAL_TENTATIVES_MAX and not self.arret:
+                    a_reprendre.append((mouvement, None, tentative + 1))
+                else:
+                    abandonnes.append(mouvement)
+            if future is not None and not future.done():
+                future.set_result(None)
+
+        if a_reprendre:
+            tentative = a_reprendre[0][2]
+            delai = min(JOURNAL_REPRISE_DELAI_SECONDES * 2 ** (tentative - 2), 60)
+            log_journal.warning("%d mouvements sur %d non journalisés dans %s (%s) : nouvel essai %d dans %.1fs",
+                                len(a_reprendre), len(lot), collection, next(iter(erreurs.values())), tentative, delai)
+            metriques.inc("journal_retries_total", {"collection": collection}, len(a_reprendre))
+            reprise = asyncio.create_task(self._reprendre(collection, a_reprendre, delai))
+            self.reprises.add(reprise)
+            reprise.add_done_callback(self.reprises.discard)
+        if abandonnes:
+            metriques.inc("journal_movements_lost_total", {"collection": collection}, len(abandonnes))
+            for mouvement in abandonnes:
+                log_journal.error("Mouvement abandonné dans %s (%s) : %s", collection,
+                                  next(iter(erreurs.values())), json.dumps(mouvement, default=str))
+
+    async def _reprendre(self, collection: str, entrees: list, delai: float):
+        try:
+            await asyncio.sleep(delai)
+        finally:
+            # Annulée à l'arrêt : les mouvements sont remis en file pour un dernier essai
+            self._ajouter(collection, entrees)
+
+    def demarrer(self):
+        """Réarme le journal arrêté par un lifespan précédent : regroupement et nouveaux essais"""
+        self.arret = False
+        self.pleins = {}
+
+    async def arreter(self):
+        """Écrit les mouvements encore en file ; ceux en attente d'un nouvel essai le tentent une dernière fois"""
+        self.arret = True
+        for reprise in list(self.reprises):
+            reprise.cancel()
+        await asyncio.gather(*self.reprises, return_exceptions=True)
+        for plein in self.pleins.values():
+            plein.set()
+        while self.ecrivains:
+            await asyncio.gather(*self.ecrivains.values(), return_exceptions=True)
+
+journal_mouvements = JournalMouvements()
+
+# ===== CALCULS PARTAGÉS =====
+
+# Durée de vie des résultats partagés : 0 ne regroupe que les calculs simultanés. Une
+# valeur de quelques secondes absorbe aussi les vagues (ouverture des agences à 8 h)
+# au prix de statistiques en retard d'autant après une écriture.
+PARTAGE_TTL_SECONDES = float(os.environ.get('PARTAGE_TTL_SECONDES', '0'))
+
+metriques.decrire("shared_computations_total", "counter", "Calculs partagés par route : exécutés, rejoints en vol ou servis du cache")
+
+# Clé -> tâche en cours ; clé -> (expiration monotone, résultat)
+calculs_en_vol: Dict[tuple, asyncio.Task] = {}
+resultats_partages: Dict[tuple, tuple] = {}
+
+async def calcul_partage(cle: tuple, calcul, ttl: Optional[float] = None) -> Any:
+    """Exécute calcul() une seule fois pour tous les appelants simultanés de même clé
+
+    La tâche est protégée (shield) : un client qui se déconnecte n'annule pas le
+    calcul attendu par les autres. Une erreur est transmise à tous et jamais gardée.
+    """
+    ttl = PARTAGE_TTL_SECONDES if ttl is None else ttl
+    entree = resultats_partages.get(cle)
+    if entree and entree[0] > time.monotonic():
+        metriques.inc("shared_computations_total", {"route": cle[0], "result": "cache"})
+        return entree[1]
+
+    tache = calculs_en_vol.get(cle)
+    if tache is not None:
+        metriques.inc("shared_computations_total", {"route": cle[0], "result": "joined"})
+        return await asyncio.shield(tache)
+
+    metriques.inc("shared_computations_total", {"route": cle[0], "result": "computed"})
+    tache = asyncio.ensure_future(calcul())
+    calculs_en_vol[cle] = tache
+
+    def terminer(tache_terminee):
+        calculs_en_vol.pop(cle, None)
+        if tache_terminee.cancelled() or tache_terminee.exception() is not None or ttl <= 0:
+            return
+        maintenant = time.monotonic()
+        for cle_expiree in [c for c, (expiration, _) in resultats_partages.items() if expiration <= maintenant]:
+            del resultats_partages[cle_expiree]
+        resultats_partages[cle] = (maintenant + ttl, tache_terminee.result())
+
+    tache.add_done_callback(terminer)
+    return await asyncio.shield(tache)
+
+def partage(ttl: Optional[float] = None, par_role: bool = False):
+    """Décorateur de route : calcul partagé par route et paramètres normalisés
+
+    Les dépendances d'authentification s'exécutent avant : seul un appelant autorisé
+    rejoint un calcul. par_role sépare les résultats quand ils dépendent du rôle.
+    Réservé aux routes dont le résultat ne dépend pas de l'utilisateur lui-même.
+    """
+    def decorer(route):
+        @functools.wraps(route)
+        async def route_partagee(**kwargs):
+            current_user = kwargs.get("current_user") or {}
+            parametres = tuple(sorted(
+                (nom, repr(valeur)) for nom, valeur in kwargs.items()
+                if nom != "current_user" and not nom.startswith("_")
+            ))
+            cle = (route.__name__, current_user.get("role") if par_role else None, parametres)
+            return await calcul_partage(cle, lambda: route(**kwargs), ttl)
+        return route_partagee
+    return decorer
+
+# ===== GET CONDITIONNEL =====
+
+async def version_collections(collections: tuple) -> tuple:
+    """ETag fort et date de dernière écriture (UTC) des collections d'une réponse"""
+    epoque, versions = await asyncio.gather(
+        epoque_synchronisation(),
+        db.versions_collections.find({"_id": {"$in": list(collections)}}).to_list(None)
+    )
+    par_collection = {version["_id"]: version for version in versions}
+    etat = ".".join(str(par_collection.get(nom, {}).get("version", 0)) for nom in collections)
+    dates = [version["date_modification"] for version in versions if version.get("date_modification")]
+    return f'"{epoque}.{etat}"', max(dates) if dates else None
+
+def requete_non_modifiee(request: Request, etag: str, derniere_modification: Optional[datetime]) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match prime sur If-Modified-Since (RFC 9110)
+        # Comparaison faible : la compression rend l'ETag faible (W/) sans changer les données
+        return if_none_match.strip() == "*" or etag in [
+            valeur.strip().removeprefix("W/") for valeur in if_none_match.split(",")
+        ]
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and derniere_modification is not None:
+        try:
+            return derniere_modification.replace(microsecond=0) <= parsedate_to_datetime(if_modified_since).replace(tzinfo=None)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def get_conditionnel(*collections: str):
+    """Dépendance des routes de référence : 304 sans requête ni sérialisation si rien n'a changé
+
+    À déclarer après l'authentification pour qu'un 401 passe avant le 304.
+    """
+    async def verifier(request: Request, response: Response):
+        etag, derniere_modification = await version_collections(collections)
+        entetes = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        # Date à la seconde : omise tant qu'une autre écriture peut tomber dans la même seconde
+        if derniere_modification is not None and derniere_modification < datetime.utcnow() - timedelta(seconds=1):
+            entetes["Last-Modified"] = format_datetime(derniere_modification.replace(tzinfo=timezone.utc), usegmt=True)
+        if requete_non_modifiee(request, etag, derniere_modification):
+            raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers=entetes)
+        response.headers.update(entetes)
+    return verifier
+
+# ===== PROPAGATION DES NOMS DÉNORMALISÉS =====
+
+# Pour chaque collection source : (collection cible, clé étrangère, champ nom dénormalisé)
+CHAMPS_DENORMALISES = {
+    "entrepots": [("outils", "entrepot_id", "entrepot_nom")],
+    "clients": [
+        ("factures", "client_id", "client_nom"),
+        ("devis", "client_id", "client_nom"),
+        ("opportunites", "client_id", "client_nom"),
+        ("commandes", "client_id", "client_nom")
+    ],
+    "outils": [("affectations_outils", "outil_id", "outil_nom")],
+    "users": [("affectations_outils", "technicien_id", "technicien_nom")]
+}
+
+PROPAGATION_BATCH_SIZE = int(os.environ.get('PROPAGATION_BATCH_SIZE', '500'))
+RECONCILIATION_INTERVAL_HEURES = float(os.environ.get('RECONCILIATION_INTERVAL_HEURES', '0'))
+
+def nom_denormalise(source: str, document: dict) -> Optional[str]:
+    """Retourne le nom tel qu'il est recopié dans les documents liés"""
+    if source == "users":
+        return f"{document.get('prenom', '')} {document.get('nom', '')}"
+    return document.get("nom")
+
+def identifiants_document(document: dict) -> List[str]:
+    """Retourne les identifiants possibles (UUID et ObjectId) d'un document"""
+    identifiants = []
+    if document.get("id"):
+        identifiants.append(document["id"])
+    if document.get("_id") is not None and str(document["_id"]) not in identifiants:
+        identifiants.append(str(document["_id"]))
+    return identifiants
+
+async def propager_nom_cible(collection: str, cle: str, champ: str, identifiants: List[str], nom: str, propagation_id: Optional[str] = None) -> int:
+    """Met à jour par lots le nom dénormalisé dans une collection cible"""
+    filtre = {cle: {"$in": identifiants}, champ: {"$ne": nom}}
+    total = 0
+
+    while True:
+        lot = [doc["_id"] async for doc in db[collection].find(filtre, {"_id": 1}).limit(PROPAGATION_BATCH_SIZE)]
+        if not lot:
+            break
+
+        result = await db[collection].update_many({"_id": {"$in": lot}}, {"$set": {champ: nom}})
+        total += result.modified_count
+
+        if propagation_id and result.modified_count:
+            await db.propagations_noms.update_one(
+                {"id": propagation_id},
+                {"$inc": {
+                    "documents_mis_a_jour": result.modified_count,
+                    f"cibles.{collection}.{champ}": result.modified_count
+                }}
+            )
+
+        # Lot incomplet ou modifié en parallèle : plus rien à corriger
+        if len(lot) < PROPAGATION_BATCH_SIZE or result.modified_count == 0:
+            break
+
+    return total
+
+@travail_de_fond("propagation_noms")
+async def executer_propagation(propagation_id: str, source: str, identifiants: List[str], nom: str):
+    """Propage un renommage vers toutes les collections qui recopient le nom"""
+    await db.propagations_noms.update_one(
+        {"id": propagation_id},
+        {"$set": {"statut": "en_cours", "date_debut": datetime.now(), "documents_mis_a_jour": 0, "cibles": {}}}
+    )
+
+    try:
+        for collection, cle, champ in CHAMPS_DENORMALISES[source]:
+            await propager_nom_cible(collection, cle, champ, identifiants, nom, propagation_id)
+
+        await db.propagations_noms.update_one(
+            {"id": propagation_id},
+            {"$set": {"statut": "termine", "date_fin": datetime.now()}}
+        )
+    except Exception as e:
+        await db.propagations_noms.update_one(
+            {"id": propagation_id},
+            {"$set": {"statut": statut_echec(), "erreur": str(e), "date_fin": datetime.now()}}
+        )
+        raise
+
+async def planifier_propagation_nom(source: str, document: dict) -> Optional[str]:
+    """Enregistre une propagation de nom et la lance en tâche de fond"""
+    nom = nom_denormalise(source, document)
+    identifiants = identifiants_document(document)
+    if not nom or not identifiants:
+        return None
+
+    propagation = {
+        "id": str(uuid.uuid4()),
+        "type": "propagation",
+        "source": source,
+        "source_ids": identifiants,
+        "nom": nom,
+        "statut": "en_attente",
+        "documents_mis_a_jour": 0,
+        "cibles": {},
+        "date_creation": datetime.now()
+    }
+    await db.propagations_noms.insert_one(propagation)
+
+    await planifier_travail("propagation_noms", {
+        "propagation_id": propagation["id"], "source": source, "identifiants": identifiants, "nom": nom
+    })
+    return propagation["id"]
+
+@travail_de_fond("reconciliation_noms")
+async def reconcilier_noms_denormalises(reconciliation_id: Optional[str] = None, periodique: bool = False) -> dict:
+    """Parcourt les collections sources et corrige les noms dénormalisés divergents"""
+    if periodique:
+        # Le créneau suivant est enregistré d'abord : un échec n'interrompt pas la série
+        await planifier_reconciliation_periodique()
+    # Identifiant fixe fourni par l'appelant : une reprise poursuit le même suivi
+    reconciliation_id = reconciliation_id or str(uuid.uuid4())
+    await db.propagations_noms.update_one(
+        {"id": reconciliation_id},
+        {"$setOnInsert": {
+            "type": "reconciliation",
+            "statut": "en_attente",
+            "documents_mis_a_jour": 0,
+            "cibles": {},
+            "date_creation": datetime.now()
+        }},
+        upsert=True
+    )
+
+    await db.propagations_noms.update_one(
+        {"id": reconciliation_id},
+        {"$set": {"statut": "en_cours", "date_debut": datetime.now()}}
+    )
+
+    total = 0
+    sources_verifiees = 0
+    try:
+        for source, cibles in CHAMPS_DENORMALISES.items():
+            async for document in db[source].find({}, {"_id": 1, "id": 1, "nom": 1, "prenom": 1}):
+                nom = nom_denormalise(source, document)
+                identifiants = identifiants_document(document)
+                if not nom or not identifiants:
+                    continue
+                sources_verifiees += 1
+                for collection, cle, champ in cibles:
+                    total += await propager_nom_cible(collection, cle, champ, identifiants, nom, reconciliation_id)
+
+        await db.propagations_noms.update_one(
+            {"id": reconciliation_id},
+            {"$set": {"statut": "termine", "sources_verifiees": sources_verifiees, "date_fin": datetime.now()}}
+        )
+    except Exception as e:
+        await db.propagations_noms.update_one(
+            {"id": reconciliation_id},
+            {"$set": {"statut": statut_echec(), "erreur": str(e), "date_fin": datetime.now()}}
+        )
+        raise
+
+    return {"id": reconciliation_id, "documents_corriges": total, "sources_verifiees": sources_verifiees}
+
+async def planifier_reconciliation_periodique():
+    """Enregistre la réconciliation du prochain créneau de RECONCILIATION_INTERVAL_HEURES
+
+    L'identifiant dérive du créneau : plusieurs processus API (ou une reprise) ne
+    l'enregistrent qu'une fois, et le worker qui l'exécute planifie le suivant.
+    """
+    intervalle = RECONCILIATION_INTERVAL_HEURES * 3600
+    creneau = int(time.time() // intervalle) + 1
+    identifiant = str(uuid.uuid5(uuid.NAMESPACE_URL, f"facturapp:reconciliation_noms:{creneau}"))
+    try:
+        await planifier_travail(
+            "reconciliation_noms", {"reconciliation_id": identifiant, "periodique": True},
+            identifiant=identifiant, disponible_a=datetime.utcfromtimestamp(creneau * intervalle)
+        )
+    except DuplicateKeyError:
+        pass
+
+async def init_indexes():
+    """Crée les index utilisés par les requêtes fréquentes, en parallèle"""
+    # Avant tout index : create_index créerait la collection sans sa compression
+    await asyncio.gather(*(creer_collection_seaux(collection) for collection, _ in JOURNAUX_MOUVEMENTS.values()))
+    creations = [
+        # Clés étrangères ciblées par la propagation des noms
+        db[collection].create_index(cle)
+        for cibles in CHAMPS_DENORMALISES.values()
+        for collection, cle, champ in cibles
+    ]
+    creations += [
+        db.propagations_noms.create_index([("date_creation", -1)]),
+        db.propagations_noms.create_index("id", unique=True),
+        db.sauvegardes.create_index("id", unique=True),
+        db.sauvegardes.create_index([("date_creation", -1)]),
+        db.jobs.create_index("id", unique=True),
+        # Réservation : travaux prêts par type, puis baux expirés
+        db.jobs.create_index([("statut", 1), ("type", 1), ("disponible_a", 1)]),
+        db.jobs.create_index([("statut", 1), ("bail_expire", 1)]),
+        db.jobs.create_index("date_fin", expireAfterSeconds=JOBS_RETENTION_JOURS * 24 * 3600),
+        db.imports.create_index("id", unique=True),
+        db.imports.create_index([("date_creation", -1)]),
+        # Dédoublonnage des imports en masse
+        db.clients.create_index("email"),
+        db.produits.create_index("nom"),
+        # Recherche de l'utilisateur par email à chaque requête authentifiée
+        db.users.create_index("email"),
+        # Seaux de limitation des connexions partagés entre workers
+        db.limitation_connexions.create_index("expire_a", expireAfterSeconds=0),
+        # Synchronisation incrémentale : documents modifiés et suppressions depuis un jeton
+        *(db[collection].create_index("date_modification") for collection in COLLECTIONS_SYNCHRONISEES),
+        db.suppressions.create_index([("entite", 1), ("date_suppression", 1)]),
+        db.suppressions.create_index("date_suppression", expireAfterSeconds=SYNC_RETENTION_JOURS * 24 * 3600),
+        db.profils_requetes.create_index("id"),
+        # Historique des mouvements : seaux d'un élément du plus récent au plus ancien, puis par période
+        *(db[collection].create_index([(champ, 1), ("mois", -1)]) for collection, champ in JOURNAUX_MOUVEMENTS.values()),
+        *(db[collection].create_index("mois") for collection, _ in JOURNAUX_MOUVEMENTS.values()),
+        db.profils_requetes.create_index(
+            "date_creation", expireAfterSeconds=PROFILE_RETENTION_JOURS * 24 * 3600
+        ),
+    ]
+    await asyncio.gather(*creations)
+
+# ===== ÉTAT PARTAGÉ ENTRE WORKERS =====
+
+def workers_ligne_commande(argv: List[str]) -> int:
+    """Workers demandés par --workers (uvicorn, gunicorn) ou -w (gunicorn)
+
+    Les workers uvicorn (multiprocessing spawn) et gunicorn (fork) héritent de la
+    ligne de commande du processus parent : chacun sait qu'il n'est pas seul.
+    """
+    for position, argument in enumerate(argv):
+        valeur = None
+        if argument.startswith("--workers="):
+            valeur = argument.split("=", 1)[1]
+        elif argument in ("--workers", "-w") and position + 1 < len(argv):
+            valeur = argv[position + 1]
+        if valeur is not None and valeur.isdigit():
+            return int(valeur)
+    return 1
+
+# Plusieurs workers (uvicorn --workers, gunicorn ou plusieurs réplicas) : détectés par la ligne
+# de commande, WEB_CONCURRENCY (gunicorn) ou UVICORN_WORKERS ; MULTI_WORKERS force le profil
+# pour les réplicas, invisibles depuis un processus
+WEB_CONCURRENCY = max(
+    int(os.environ.get('WEB_CONCURRENCY', '1')),
+    int(os.environ.get('UVICORN_WORKERS', '1')),
+    workers_ligne_commande(sys.argv),
+)
+MULTI_WORKERS = WEB_CONCURRENCY > 1 or os.environ.get('MULTI_WORKERS', '').lower() in ('1', 'true', 'oui')
+# Délai maximal avant qu'un worker voie un taux modifié par un autre
+TAUX_CHANGE_RAFRAICHISSEMENT_SECONDES = float(os.environ.get('TAUX_CHANGE_RAFRAICHISSEMENT_SECONDES', '30'))
+
+log_deploiement = logging.getLogger("facturapp.deploiement")
+
+# État volontairement propre à chaque processus : sans incidence sur les résultats,
+# mais ces vues ne couvrent que le worker qui répond
+ETAT_LOCAL_WORKER = {
+    "metriques": "/metrics expose les compteurs du seul worker interrogé",
+    "journal": "/api/parametres/logs ne lit que le tampon du worker courant",
+    "requetes_lentes": "/api/parametres/requetes-lentes ne couvre que le worker courant",
+    "calculs_partages": "statistiques et rapports ne sont mutualisés qu'entre requêtes d'un même worker",
+}
+
+async def taux_change_actif() -> Optional[float]:
+    """Dernier taux USD -> FC actif en base, sans passer par le cache du worker"""
+    taux = await db.taux_change.find_one({"actif": True}, {"taux": 1}, sort=[("date_creation", -1)])
+    return taux.get("taux") if taux else None
+
+async def charger_taux_change():
+    """Recharge le cache local depuis le dernier taux actif en base"""
+    taux = await taux_change_actif()
+    if taux:
+        TAUX_CHANGE["USD_TO_FC"] = taux
+        TAUX_CHANGE["FC_TO_USD"] = 1.0 / taux
+
+async def enregistrer_taux_change(nouveau_taux: float) -> dict:
+    """Persiste un nouveau taux actif ; les autres workers le chargent au prochain rafraîchissement"""
+    # Désactiver l'ancien taux
+    await db.taux_change.update_many({"actif": True}, {"$set": {"actif": False}})
     
+    # Créer le nouveau taux
+    taux = {
+        "id": str(uuid.uuid4()),
+        "devise_base": "USD",
+        "devise_cible": "FC",
+        "taux": nouveau_taux,
+        "date_creation": datetime.now(),
+        "actif": True
+    }
+    await db.taux_change.insert_one(taux)
+    
+    # Mettre à jour le cache du worker courant sans attendre
+    TAUX_CHANGE["USD_TO_FC"] = nouveau_taux
+    TAUX_CHANGE["FC_TO_USD"] = 1.0 / nouveau_taux
+    return taux
+
+async def boucle_rafraichissement_taux():
+    """Resynchronise périodiquement le cache local du taux avec MongoDB"""
+    while True:
+        await asyncio.sleep(TAUX_CHANGE_RAFRAICHISSEMENT_SECONDES)
+        try:
+            await charger_taux_change()
+        except Exception as e:
+            log_deploiement.warning("Rafraîchissement du taux de change impossible: %s", e)
+
+def verifier_configuration_workers():
+    """Refuse un démarrage multi-workers tant qu'un état doit être partagé mais reste local"""
+    if SECRET_KEY_EPHEMERE and APP_MODE not in ("demo", "test"):
+        raise RuntimeError("SECRET_KEY doit être définie en mode production (secret partagé par tous les workers)")
+    if not MULTI_WORKERS:
+        if SECRET_KEY_EPHEMERE:
+            log_deploiement.warning("SECRET_KEY non définie: les sessions seront invalidées au redémarrage")
+        return
+
+    problemes = []
+    if SECRET_KEY_EPHEMERE:
+        problemes.append("SECRET_KEY doit être définie et identique sur tous les workers")
+    elif len(SECRET_KEY) < 32:
+        problemes.append("SECRET_KEY doit contenir au moins 32 caractères")
+    if TAUX_CHANGE_RAFRAICHISSEMENT_SECONDES <= 0:
+        problemes.append("TAUX_CHANGE_RAFRAICHISSEMENT_SECONDES doit être positif pour partager le taux de change")
+    if problemes:
+        raise RuntimeError("Configuration multi-workers invalide: " + "; ".join(problemes))
+
+    for etat, consequence in ETAT_LOCAL_WORKER.items():
+        log_deploiement.info("État local au worker (%s): %s", etat, consequence)
+    log_deploiement.info("Profil multi-workers actif (pid %d)", os.getpid())
+
+# ===== DÉMARRAGE =====
+
+# production : aucune donnée de démonstration, compte admin créé uniquement si ADMIN_PASSWORD est défini
+# demo : clients, produits et comptes de démonstration insérés dans les collections vides
+# test : comme demo, sans tâche de fond (réconciliation des noms)
+MODES_DEMARRAGE = ("production", "demo", "test")
+APP_MODE = os.environ.get('APP_MODE', 'demo').lower()
+ADMIN_EMAIL = os.environ.get('ADMIN_EMAIL', 'admin@facturapp.rdc')
+ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD')
+
+log_demarrage = logging.getLogger("facturapp.demarrage")
+
+def identifiant_amorcage(collection: str, cle: str) -> str:
+    """Identifiant stable d'un document d'amorçage, identique sur tous les workers"""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"facturapp/{collection}/{cle}"))
+
+async def collection_vide(collection: str) -> bool:
+    return await db[collection].find_one({}, {"_id": 1}) is None
+
+async def amorcer_collection(collection: str, documents: List[dict], cle: str) -> int:
+    """Insère les documents par upserts groupés si la collection est vide
+
+    Le _id de chaque document est dérivé de sa clé naturelle : deux workers qui
+    démarrent en même temps convergent vers les mêmes documents au lieu de les
+    dupliquer, et relancer l'amorçage ne modifie rien.
+    """
+    if not documents or not await collection_vide(collection):
+        return 0
+
+    operations = []
+    maintenant = datetime.now()
+    for document in documents:
+        identifiant = identifiant_amorcage(collection, document[cle])
+        operations.append(UpdateOne(
+            {"_id": identifiant},
+            {"$setOnInsert": {**document, "id": identifiant, "date_modification": maintenant}},
+            upsert=True
+        ))
+    try:
+        resultat = await db[collection].bulk_write(operations, ordered=False)
+        return resultat.upserted_count
+    except BulkWriteError as e:
+        # Clé dupliquée : un autre worker amorce la même collection au même moment
+        if any(erreur.get("code") != 11000 for erreur in e.details.get("writeErrors", [])):
+            raise
+        return e.details.get("nUpserted", 0)
+
+async def init_demo_data():
+    """Insère les données de démonstration dans les collections encore vides"""
+    maintenant = datetime.now()
+
     # Taux de change par défaut
     taux_change = {
-        "id": str(uuid.uuid4()),
         "devise_base": "USD",
         "devise_cible": "FC",
         "taux": 2800.0,
-        "date_creation": datetime.now(),
+        "date_creation": maintenant,
         "actif": True
     }
-    await db.taux_change.insert_one(taux_change)
     
     # Clients de démonstration
     demo_clients = [
         {
-            "id": str(uuid.uuid4()),
             "nom": "Entreprise ABC",
             "email": "contact@abc.com",
             "telephone": "+243 81 234 5678",
@@ -698,10 +2912,9 @@ async def init_demo_data():
             "code_postal": "12345",
             "pays": "RDC",
             "devise_preferee": "USD",
-            "date_creation": datetime.now()
+            "date_creation": maintenant
         },
         {
-            "id": str(uuid.uuid4()),
             "nom": "SARL Congo Digital",
             "email": "info@congodigital.cd",
             "telephone": "+243 99 876 5432",
@@ -710,14 +2923,13 @@ async def init_demo_data():
             "code_postal": "54321",
             "pays": "RDC",
             "devise_preferee": "FC",
-            "date_creation": datetime.now()
+            "date_creation": maintenant
         }
     ]
     
     # Produits de démonstration avec stock
     demo_produits = [
         {
-            "id": str(uuid.uuid4()),
             "nom": "Développement site web",
             "description": "Création de site web sur mesure",
             "prix_usd": 2500.0,
@@ -726,10 +2938,9 @@ async def init_demo_data():
             "tva": 16.0,
             "actif": True,
             "gestion_stock": False,
-            "date_creation": datetime.now()
+            "date_creation": maintenant
         },
         {
-            "id": str(uuid.uuid4()),
             "nom": "Maintenance mensuelle",
             "description": "Maintenance et mise à jour du site",
             "prix_usd": 150.0,
@@ -738,10 +2949,9 @@ async def init_demo_data():
             "tva": 16.0,
             "actif": True,
             "gestion_stock": False,
-            "date_creation": datetime.now()
+            "date_creation": maintenant
         },
         {
-            "id": str(uuid.uuid4()),
             "nom": "Formation utilisateur",
             "description": "Formation à l'utilisation du site",
             "prix_usd": 80.0,
@@ -753,10 +2963,9 @@ async def init_demo_data():
             "stock_actuel": 50,
             "stock_minimum": 10,
             "stock_maximum": 100,
-            "date_creation": datetime.now()
+            "date_creation": maintenant
         },
         {
-            "id": str(uuid.uuid4()),
             "nom": "Ordinateur portable",
             "description": "Ordinateur portable Dell Inspiron",
             "prix_usd": 800.0,
@@ -768,84 +2977,267 @@ async def init_demo_data():
             "stock_actuel": 25,
             "stock_minimum": 5,
             "stock_maximum": 50,
-            "date_creation": datetime.now()
+            "date_creation": maintenant
         }
     ]
     
-    await db.clients.insert_many(demo_clients)
-    await db.produits.insert_many(demo_produits)
+    crees = await asyncio.gather(
+        amorcer_collection("taux_change", [taux_change], "devise_cible"),
+        amorcer_collection("clients", demo_clients, "email"),
+        amorcer_collection("produits", demo_produits, "nom")
+    )
+    if any(crees):
+        log_demarrage.info(
+            "Données de démonstration insérées: %d taux, %d clients, %d produits", *crees
+        )
 
-@app.on_event("startup")
-async def startup_event():
-    await init_demo_data()
-    await init_admin_user()
+async def init_admin_user(mode: str = "demo"):
+    """Crée les comptes initiaux si aucun utilisateur n'existe"""
+    # Vérifier avant de hasher : bcrypt coûte plusieurs centaines de ms par mot de passe
+    if not await collection_vide("users"):
+        return
 
-async def init_admin_user():
-    """Crée un utilisateur administrateur par défaut s'il n'existe pas"""
-    # Utilisateurs de démonstration
-    demo_users = [
-        {
-            "email": "admin@facturapp.rdc",
+    if mode == "production":
+        if not ADMIN_PASSWORD:
+            log_demarrage.warning(
+                "Aucun utilisateur en base: définir ADMIN_PASSWORD pour créer le compte %s", ADMIN_EMAIL
+            )
+            return
+        comptes = [{
+            "email": ADMIN_EMAIL,
             "nom": "Administrateur",
             "prenom": "Système",
             "role": "admin",
-            "password": "admin123"
-        },
-        {
-            "email": "manager@demo.com",
-            "nom": "Manager",
-            "prenom": "Demo",
-            "role": "manager",
-            "password": "manager123"
-        },
-        {
-            "email": "comptable@demo.com",
-            "nom": "Comptable",
-            "prenom": "Demo",
-            "role": "comptable",
-            "password": "comptable123"
-        },
-        {
-            "email": "user@demo.com",
-            "nom": "Utilisateur",
-            "prenom": "Demo",
-            "role": "utilisateur",
-            "password": "user123"
-        },
+            "password": ADMIN_PASSWORD
+        }]
+    else:
+        # Utilisateurs de démonstration
+        comptes = [
+            {
+                "email": "admin@facturapp.rdc",
+                "nom": "Administrateur",
+                "prenom": "Système",
+                "role": "admin",
+                "password": "admin123"
+            },
+            {
+                "email": "manager@demo.com",
+                "nom": "Manager",
+                "prenom": "Demo",
+                "role": "manager",
+                "password": "manager123"
+            },
+            {
+                "email": "comptable@demo.com",
+                "nom": "Comptable",
+                "prenom": "Demo",
+                "role": "comptable",
+                "password": "comptable123"
+            },
+            {
+                "email": "user@demo.com",
+                "nom": "Utilisateur",
+                "prenom": "Demo",
+                "role": "utilisateur",
+                "password": "user123"
+            },
+            {
+                "email": "support@facturapp.rdc",
+                "nom": "Support",
+                "prenom": "Technique",
+                "role": "support",
+                "password": "support123"
+            }
+        ]
+
+    # bcrypt libère le GIL : les hashes sont calculés en parallèle hors de la boucle
+    hashes = await asyncio.gather(*(asyncio.to_thread(hash_password, c["password"]) for c in comptes))
+    maintenant = datetime.now()
+    users = [
         {
-            "email": "support@facturapp.rdc",
-            "nom": "Support",
-            "prenom": "Technique",
-            "role": "support",
-            "password": "support123"
+            "email": compte["email"],
+            "nom": compte["nom"],
+            "prenom": compte["prenom"],
+            "role": compte["role"],
+            "is_active": True,
+            "hashed_password": hashed,
+            "date_creation": maintenant,
+            "derniere_connexion": None
         }
+        for compte, hashed in zip(comptes, hashes)
     ]
-    
-    for user_data in demo_users:
-        existing_user = await db.users.find_one({"email": user_data["email"]})
-        
-        if not existing_user:
-            user = {
-                "id": str(uuid.uuid4()),
-                "email": user_data["email"],
-                "nom": user_data["nom"],
-                "prenom": user_data["prenom"],
-                "role": user_data["role"],
-                "is_active": True,
-                "hashed_password": hash_password(user_data["password"]),
-                "date_creation": datetime.now(),
-                "derniere_connexion": None
-            }
-            await db.users.insert_one(user)
-            print(f"✅ Utilisateur {user_data['role']} créé: {user_data['email']} / mot de passe: {user_data['password']}")
+    if await amorcer_collection("users", users, "email"):
+        log_auth.info("Utilisateurs initiaux créés: %s", ", ".join(c["email"] for c in comptes))
+
+async def prechauffer():
+    """Ouvre la connexion MongoDB et charge le backend bcrypt avant la première requête"""
+    await db.command("ping")
+    await asyncio.to_thread(pwd_context.dummy_verify)
+
+@app.on_event("startup")
+async def startup_event():
+    if APP_MODE not in MODES_DEMARRAGE:
+        raise RuntimeError(f"APP_MODE invalide: {APP_MODE} (attendu: {', '.join(MODES_DEMARRAGE)})")
+    verifier_configuration_workers()
+    # Arrêté par un lifespan précédent du même processus
+    log_listener.start()
+    debut = time.perf_counter()
+
+    async def amorcer():
+        if APP_MODE in ("demo", "test"):
+            await asyncio.gather(init_demo_data(), init_admin_user(APP_MODE))
+        else:
+            await init_admin_user(APP_MODE)
+        await charger_taux_change()
+
+    await asyncio.gather(init_indexes(), amorcer(), prechauffer(), normaliser_emails_clients())
+    
+    if RECONCILIATION_INTERVAL_HEURES > 0 and APP_MODE != "test":
+        await planifier_reconciliation_periodique()
+    if TAUX_CHANGE_RAFRAICHISSEMENT_SECONDES > 0:
+        asyncio.create_task(boucle_rafraichissement_taux())
+    if JOBS_WORKER_INTEGRE:
+        global worker_integre
+        worker_integre = WorkerTravaux()
+        asyncio.create_task(worker_integre.boucle())
+    journal_mouvements.demarrer()
+    tampon_ecritures.demarrer()
+
+    log_demarrage.info("Démarrage en mode %s terminé en %.0f ms", APP_MODE, (time.perf_counter() - debut) * 1000)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if worker_integre is not None:
+        await worker_integre.arreter()
+    await journal_mouvements.arreter()
+    await tampon_ecritures.arreter()
+    # Vider la file de logs avant l'arrêt du processus
+    log_listener.stop()
+
+# ===== LIMITATION DES CONNEXIONS =====
+
+# Seaux à jetons : la capacité est la rafale tolérée, puis un jeton toutes les RECHARGE secondes
+CONNEXION_IP_CAPACITE = int(os.environ.get('CONNEXION_IP_CAPACITE', '20'))
+CONNEXION_IP_RECHARGE_SECONDES = float(os.environ.get('CONNEXION_IP_RECHARGE_SECONDES', '3'))
+CONNEXION_COMPTE_CAPACITE = int(os.environ.get('CONNEXION_COMPTE_CAPACITE', '10'))
+CONNEXION_COMPTE_RECHARGE_SECONDES = float(os.environ.get('CONNEXION_COMPTE_RECHARGE_SECONDES', '30'))
+# Vérifications bcrypt simultanées : au-delà, les tentatives attendent au lieu d'occuper tous les cœurs
+BCRYPT_CONCURRENCE = int(os.environ.get('BCRYPT_CONCURRENCE', str(os.cpu_count() or 2)))
+
+metriques.decrire("login_attempts_total", "counter", "Tentatives de connexion par résultat")
+metriques.decrire("login_throttled_total", "counter", "Tentatives de connexion refusées par limitation, par portée (ip, compte)")
+metriques.decrire("login_password_check_seconds", "histogram", "Durée des vérifications bcrypt, attente comprise")
+
+class SeauxJetons:
+    """Seaux à jetons en mémoire, propres au worker : filtrent les rafales sans aller en base"""
+
+    def __init__(self, capacite: int, recharge_secondes: float):
+        self.capacite = capacite
+        self.recharge_secondes = recharge_secondes
+        self.seaux: Dict[str, tuple] = {}
+
+    def prendre(self, cle: str) -> float:
+        """Prend un jeton : 0 si accordé, sinon secondes avant le prochain jeton"""
+        maintenant = time.monotonic()
+        if len(self.seaux) > 10000:
+            self._purger(maintenant)
+        jetons, dernier = self.seaux.get(cle, (self.capacite, maintenant))
+        jetons = min(self.capacite, jetons + (maintenant - dernier) / self.recharge_secondes)
+        if jetons >= 1:
+            self.seaux[cle] = (jetons - 1, maintenant)
+            return 0.0
+        self.seaux[cle] = (jetons, maintenant)
+        return (1 - jetons) * self.recharge_secondes
+
+    def _purger(self, maintenant: float):
+        # Un seau de nouveau plein équivaut à un seau absent
+        for cle in [cle for cle, (jetons, dernier) in self.seaux.items()
+                    if jetons + (maintenant - dernier) / self.recharge_secondes >= self.capacite]:
+            del self.seaux[cle]
+
+seaux_connexion = {
+    "ip": SeauxJetons(CONNEXION_IP_CAPACITE, CONNEXION_IP_RECHARGE_SECONDES),
+    "compte": SeauxJetons(CONNEXION_COMPTE_CAPACITE, CONNEXION_COMPTE_RECHARGE_SECONDES),
+}
+
+async def prendre_jeton_partage(cle: str, capacite: int, recharge_secondes: float) -> float:
+    """Même seau dans MongoDB, partagé par les workers : recharge et prise en une mise à jour atomique"""
+    maintenant = datetime.utcnow()
+    ecoule = {"$divide": [{"$subtract": [maintenant, {"$ifNull": ["$date_maj", maintenant]}]}, 1000]}
+    seau = await db.limitation_connexions.find_one_and_update(
+        {"_id": cle},
+        [
+            {"$set": {
+                "jetons": {"$min": [capacite, {"$add": [{"$ifNull": ["$jetons", capacite]}, {"$divide": [ecoule, recharge_secondes]}]}]},
+                "date_maj": maintenant
+            }},
+            {"$set": {"accorde": {"$gte": ["$jetons", 1]}}},
+            {"$set": {
+                "jetons": {"$cond": ["$accorde", {"$subtract": ["$jetons", 1]}, "$jetons"]},
+                # Purge (index TTL) une fois le seau revenu plein
+                "expire_a": maintenant + timedelta(seconds=capacite * recharge_secondes)
+            }},
+        ],
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return 0.0 if seau["accorde"] else (1 - seau["jetons"]) * recharge_secondes
+
+async def limiter_tentative(portee: str, cle: str):
+    seaux = seaux_connexion[portee]
+    attente = seaux.prendre(cle)
+    if not attente and MULTI_WORKERS:
+        attente = await prendre_jeton_partage(f"{portee}:{cle}", seaux.capacite, seaux.recharge_secondes)
+    if attente:
+        secondes = max(1, int(attente + 0.999))
+        metriques.inc("login_throttled_total", {"scope": portee})
+        log_auth.warning("Connexion limitée (%s %s), réessai dans %ds", portee, cle, secondes)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Trop de tentatives de connexion, réessayez dans {secondes} s",
+            headers={"Retry-After": str(secondes)}
+        )
+
+semaphore_bcrypt = asyncio.Semaphore(BCRYPT_CONCURRENCE)
+# Moyenne glissante d'une vérification bcrypt, reproduite pour les comptes inconnus
+duree_bcrypt = {"moyenne": None}
+
+async def verifier_mot_de_passe(mot_de_passe: str, hashed_password: Optional[str]) -> bool:
+    """Vérifie hors de la boucle asyncio, sous le sémaphore bcrypt
+
+    Compte inconnu (ou sans mot de passe) : aucun calcul bcrypt, mais la même attente
+    qu'une vérification réelle, pour ne pas révéler quels emails existent.
+    """
+    debut = time.perf_counter()
+    async with semaphore_bcrypt:
+        if duree_bcrypt["moyenne"] is None:
+            # Étalonnage au premier appel du worker
+            hash_etalon = await asyncio.to_thread(hash_password, secrets.token_urlsafe(16))
+            debut_etalonnage = time.perf_counter()
+            await asyncio.to_thread(verify_password, secrets.token_urlsafe(16), hash_etalon)
+            duree_bcrypt["moyenne"] = time.perf_counter() - debut_etalonnage
+        if hashed_password:
+            debut_verification = time.perf_counter()
+            valide = await asyncio.to_thread(verify_password, mot_de_passe, hashed_password)
+            duree_bcrypt["moyenne"] = 0.9 * duree_bcrypt["moyenne"] + 0.1 * (time.perf_counter() - debut_verification)
+        else:
+            await asyncio.sleep(duree_bcrypt["moyenne"])
+            valide = False
+    metriques.observe("login_password_check_seconds", time.perf_counter() - debut)
+    return valide
 
 # Routes d'authentification
 @app.post("/api/auth/login", response_model=Token)
-async def login(user_data: UserLogin):
+async def login(user_data: UserLogin, request: Request):
     """Connexion utilisateur"""
+    # Limitation avant toute lecture en base ou vérification bcrypt
+    await limiter_tentative("ip", request.client.host if request.client else "inconnue")
+    await limiter_tentative("compte", user_data.email.strip().lower())
+
     user = await get_user_by_email(user_data.email)
     
-    if not user or not verify_password(user_data.password, user["hashed_password"]):
+    if not await verifier_mot_de_passe(user_data.password, user.get("hashed_password") if user else None):
+        metriques.inc("login_attempts_total", {"result": "failure" if user else "unknown_user"})
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Email ou mot de passe incorrect",
@@ -857,12 +3249,10 @@ async def login(user_data: UserLogin):
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Compte utilisateur désactivé"
         )
+    metriques.inc("login_attempts_total", {"result": "success"})
     
-    # Mettre à jour la dernière connexion
-    await db.users.update_one(
-        {"email": user_data.email},
-        {"$set": {"derniere_connexion": datetime.now()}}
-    )
+    # Mettre à jour la dernière connexion (écriture différée : le jeton part sans l'attendre)
+    tampon_ecritures.differer("users", {"email": user_data.email}, {"derniere_connexion": datetime.now()})
     
     access_token = create_access_token(data={"sub": user["email"]})
     
@@ -965,23 +3355,31 @@ async def update_user(
             detail="Aucune donnée à mettre à jour"
         )
     
-    result = await db.users.update_one(
+    # Document avant modification : le nom n'est propagé que s'il change
+    user_avant = await db.users.find_one_and_update(
         {"$or": [{"id": user_id}, {"_id": user_id}]},
-        {"$set": update_data}
+        {"$set": update_data},
+        return_document=ReturnDocument.BEFORE
     )
     
-    if result.matched_count == 0:
+    if not user_avant:
         try:
-            result = await db.users.update_one(
+            user_avant = await db.users.find_one_and_update(
                 {"_id": ObjectId(user_id)},
-                {"$set": update_data}
+                {"$set": update_data},
+                return_document=ReturnDocument.BEFORE
             )
         except:
             pass
     
-    if result.matched_count == 0:
+    if not user_avant:
         raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
     
+    # Répercuter le nom du technicien sur ses affectations
+    user_maj = {**user_avant, **update_data}
+    if nom_denormalise("users", user_maj) != nom_denormalise("users", user_avant):
+        await planifier_propagation_nom("users", user_maj)
+    
     # Récupérer l'utilisateur mis à jour
     return await get_user(user_id, current_user)
 
@@ -1026,7 +3424,7 @@ async def reset_password_request(reset_data: PasswordReset):
     )
     
     # En production, vous enverriez cet email. Ici on le retourne pour demo
-    print(f"🔐 Token de réinitialisation pour {reset_data.email}: {reset_token}")
+    log_auth.debug("Token de réinitialisation pour %s: %s", reset_data.email, reset_token)
     
     return {"message": "Si l'email existe, un lien de réinitialisation a été envoyé"}
 
@@ -1061,7 +3459,7 @@ async def reset_password_confirm(reset_data: PasswordResetConfirm):
 
 # Routes Taux de change
 @app.get("/api/taux-change", response_model=TauxChange)
-async def get_taux_change():
+async def get_taux_change(_conditionnel: None = Depends(get_conditionnel("taux_change"))):
     taux = await db.taux_change.find_one({"actif": True}, sort=[("date_creation", -1)])
     if not taux:
         # Créer un taux par défaut
@@ -1084,30 +3482,62 @@ async def get_taux_change():
 @app.put("/api/taux-change", response_model=TauxChange)
 async def update_taux_change(nouveau_taux: float, current_user: dict = Depends(admin_support())):
     """Mettre à jour le taux de change - Admin et Support uniquement"""
-    # Désactiver l'ancien taux
-    await db.taux_change.update_many({"actif": True}, {"$set": {"actif": False}})
-    
-    # Créer le nouveau taux
-    taux = {
-        "id": str(uuid.uuid4()),
-        "devise_base": "USD",
-        "devise_cible": "FC",
-        "taux": nouveau_taux,
-        "date_creation": datetime.now(),
-        "actif": True
-    }
-    
-    await db.taux_change.insert_one(taux)
-    
-    # Mettre à jour le cache
-    TAUX_CHANGE["USD_TO_FC"] = nouveau_taux
-    TAUX_CHANGE["FC_TO_USD"] = 1.0 / nouveau_taux
-    
+    taux = await enregistrer_taux_change(nouveau_taux)
     return TauxChange(**taux)
 
+@travail_de_fond("recalcul_prix")
+async def recalculer_prix_fc(taux: float) -> dict:
+    """Recalcule par lots le prix FC des produits et services à partir de leur prix USD"""
+    mis_a_jour = {}
+    for collection in ("produits", "services"):
+        total = 0
+        operations = []
+        async for document in db[collection].find({"prix_usd": {"$type": "number"}}, {"_id": 1, "prix_usd": 1}):
+            prix_fc = convertir_devise(document["prix_usd"], "USD", "FC", taux)
+            operations.append(UpdateOne(
+                {"_id": document["_id"], "prix_fc": {"$ne": prix_fc}},
+                {"$set": {"prix_fc": prix_fc, "date_modification": datetime.now()}}
+            ))
+            if len(operations) >= PROPAGATION_BATCH_SIZE:
+                total += (await db[collection].bulk_write(operations, ordered=False)).modified_count
+                operations = []
+        if operations:
+            total += (await db[collection].bulk_write(operations, ordered=False)).modified_count
+        mis_a_jour[collection] = total
+    log_taux.info("Prix FC recalculés au taux %s: %s", taux, mis_a_jour)
+    return {"taux": taux, "documents_mis_a_jour": mis_a_jour}
+
+@app.post("/api/taux-change/recalculer-prix")
+async def lancer_recalcul_prix(current_user: dict = Depends(admin_support())):
+    """Recalculer les prix FC au taux actif, en tâche de fond - Admin et Support uniquement"""
+    taux = await db.taux_change.find_one({"actif": True}, sort=[("date_creation", -1)])
+    valeur = taux["taux"] if taux else TAUX_CHANGE["USD_TO_FC"]
+    job_id = await planifier_travail("recalcul_prix", {"taux": valeur})
+    return {"message": "Recalcul des prix lancé", "job_id": job_id, "taux": valeur}
+
+def normaliser_email(email: str) -> str:
+    """Forme stockée des emails clients : le dédoublonnage (import) compare à l'identique"""
+    return email.strip().lower()
+
+async def normaliser_emails_clients() -> int:
+    """Migration des clients enregistrés avant la normalisation ; sans effet ensuite"""
+    maintenant = datetime.now()
+    operations = [
+        UpdateOne({"_id": client["_id"]}, horodater_modification({"$set": {"email": normaliser_email(client["email"])}}, maintenant))
+        async for client in db.clients.find({"email": {"$regex": r"[A-Z]|^\s|\s$"}}, {"email": 1})
+    ]
+    if not operations:
+        return 0
+    resultat = await db.clients.bulk_write(operations, ordered=False)
+    log_demarrage.info("Emails normalisés pour %d clients", resultat.modified_count)
+    return resultat.modified_count
+
 # Routes Clients (Manager et Admin)
 @app.get("/api/clients", response_model=List[Client])
-async def get_clients(current_user: dict = Depends(all_authenticated())):
+async def get_clients(
+    current_user: dict = Depends(all_authenticated()),
+    _conditionnel: None = Depends(get_conditionnel("clients"))
+):
     """Récupérer tous les clients - Tous les utilisateurs authentifiés"""
     clients = []
     async for client in db.clients.find():
@@ -1122,6 +3552,7 @@ async def create_client(client: Client, current_user: dict = Depends(manager_and
     """Créer un client - Manager et Admin uniquement"""
     client.id = str(uuid.uuid4())
     client.date_creation = datetime.now()
+    client.email = normaliser_email(client.email)
     client_dict = client.dict()
     await db.clients.insert_one(client_dict)
     return client
@@ -1129,30 +3560,37 @@ async def create_client(client: Client, current_user: dict = Depends(manager_and
 @app.put("/api/clients/{client_id}", response_model=Client)
 async def update_client(client_id: str, client: Client, current_user: dict = Depends(manager_and_admin())):
     client.id = client_id
+    client.email = normaliser_email(client.email)
     client_dict = client.dict()
     if "_id" in client_dict:
         del client_dict["_id"]
     
-    # Chercher par id ou _id
-    result = await db.clients.update_one(
+    # Chercher par id ou _id ; document avant modification pour comparer le nom
+    client_avant = await db.clients.find_one_and_update(
         {"$or": [{"id": client_id}, {"_id": client_id}]},
-        {"$set": client_dict}
+        {"$set": client_dict},
+        return_document=ReturnDocument.BEFORE
     )
     
-    if result.matched_count == 0:
+    if not client_avant:
         # Si pas trouvé, essayer de convertir l'ID MongoDB
         try:
             from bson import ObjectId
-            result = await db.clients.update_one(
+            client_avant = await db.clients.find_one_and_update(
                 {"_id": ObjectId(client_id)},
-                {"$set": client_dict}
+                {"$set": client_dict},
+                return_document=ReturnDocument.BEFORE
             )
         except:
             pass
     
-    if result.matched_count == 0:
+    if not client_avant:
         raise HTTPException(status_code=404, detail="Client non trouvé")
     
+    # Répercuter le nom sur les factures, devis, opportunités et commandes
+    if nom_denormalise("clients", client_dict) != nom_denormalise("clients", client_avant):
+        await planifier_propagation_nom("clients", client_dict)
+    
     return client
 
 @app.delete("/api/clients/{client_id}")
@@ -1175,31 +3613,40 @@ async def delete_client(client_id: str, current_user: dict = Depends(manager_and
     return {"message": "Client supprimé"}
 
 # Routes Produits (Manager et Admin, sauf consultation pour tous)
+def produit_compatible(produit: dict, taux_usd_fc: float) -> dict:
+    """Complète les anciens produits (prix unique, prix FC manquant au taux donné)"""
+    # Assurer la compatibilité avec les anciens produits
+    if "prix_usd" not in produit and "prix" in produit:
+        produit["prix_usd"] = produit["prix"]
+    
+    # Calculer le prix FC si pas défini
+    if "prix_fc" not in produit or produit["prix_fc"] is None:
+        if "prix_usd" in produit:
+            produit["prix_fc"] = convertir_devise(produit["prix_usd"], "USD", "FC", taux_usd_fc)
+        else:
+            produit["prix_fc"] = 0
+            
+    # Assurer que prix_usd existe
+    if "prix_usd" not in produit:
+        produit["prix_usd"] = produit.get("prix", 0)
+    return produit
+
 @app.get("/api/produits", response_model=List[Produit])
-async def get_produits(current_user: dict = Depends(all_authenticated())):
+async def get_produits(
+    current_user: dict = Depends(all_authenticated()),
+    # Prix FC calculés avec le taux courant pour les anciens produits
+    _conditionnel: None = Depends(get_conditionnel("produits", "taux_change"))
+):
     """Récupérer tous les produits - Tous les utilisateurs authentifiés"""
+    # Taux lu en base, comme la version de taux_change dans l'ETag : le cache du worker
+    # peut avoir jusqu'à TAUX_CHANGE_RAFRAICHISSEMENT_SECONDES de retard
+    taux = await taux_change_actif() or TAUX_CHANGE["USD_TO_FC"]
     produits = []
     async for produit in db.produits.find():
         produit["id"] = str(produit["_id"]) if "_id" in produit else produit.get("id")
         if "_id" in produit:
             del produit["_id"]
-        
-        # Assurer la compatibilité avec les anciens produits
-        if "prix_usd" not in produit and "prix" in produit:
-            produit["prix_usd"] = produit["prix"]
-        
-        # Calculer le prix FC si pas défini
-        if "prix_fc" not in produit or produit["prix_fc"] is None:
-            if "prix_usd" in produit:
-                produit["prix_fc"] = convertir_devise(produit["prix_usd"], "USD", "FC", TAUX_CHANGE["USD_TO_FC"])
-            else:
-                produit["prix_fc"] = 0
-                
-        # Assurer que prix_usd existe
-        if "prix_usd" not in produit:
-            produit["prix_usd"] = produit.get("prix", 0)
-            
-        produits.append(Produit(**produit))
+        produits.append(Produit(**produit_compatible(produit, taux)))
     return produits
 
 @app.get("/api/produits/{produit_id}", response_model=Produit)
@@ -1213,22 +3660,7 @@ async def get_produit(produit_id: str, current_user: dict = Depends(all_authenti
     if "_id" in produit:
         del produit["_id"]
     
-    # Assurer la compatibilité avec les anciens produits
-    if "prix_usd" not in produit and "prix" in produit:
-        produit["prix_usd"] = produit["prix"]
-    
-    # Calculer le prix FC si pas défini
-    if "prix_fc" not in produit or produit["prix_fc"] is None:
-        if "prix_usd" in produit:
-            produit["prix_fc"] = convertir_devise(produit["prix_usd"], "USD", "FC", TAUX_CHANGE["USD_TO_FC"])
-        else:
-            produit["prix_fc"] = 0
-            
-    # Assurer que prix_usd existe
-    if "prix_usd" not in produit:
-        produit["prix_usd"] = produit.get("prix", 0)
-    
-    return Produit(**produit)
+    return Produit(**produit_compatible(produit, await taux_change_actif() or TAUX_CHANGE["USD_TO_FC"]))
 
 @app.post("/api/produits", response_model=Produit)
 async def create_produit(produit: Produit, current_user: dict = Depends(manager_and_admin())):
@@ -1402,7 +3834,7 @@ async def update_stock(produit_id: str, request: dict, current_user: dict = Depe
         "date_mouvement": datetime.now()
     }
     
-    await db.mouvements_stock.insert_one(mouvement)
+    await journal_mouvements.journaliser("mouvements_stock", mouvement)
     
     response = {
         "message": f"Stock mis à jour: {operation} {quantite} unités",
@@ -1419,29 +3851,9 @@ async def update_stock(produit_id: str, request: dict, current_user: dict = Depe
 
 @app.get("/api/produits/{produit_id}/mouvements")
 async def get_mouvements_stock(produit_id: str):
-    mouvements = []
-    # Chercher par id ou _id
-    async for mouvement in db.mouvements_stock.find({
-        "$or": [{"produit_id": produit_id}, {"produit_id": str(produit_id)}]
-    }).sort("date_mouvement", -1):
-        mouvement["id"] = str(mouvement["_id"]) if "_id" in mouvement else mouvement.get("id")
-        if "_id" in mouvement:
-            del mouvement["_id"]
-        mouvements.append(mouvement)
-    
-    # Si aucun mouvement trouvé avec l'ID donné, essayer de chercher par ObjectId
-    if not mouvements:
-        try:
-            from bson import ObjectId
-            async for mouvement in db.mouvements_stock.find({"produit_id": ObjectId(produit_id)}).sort("date_mouvement", -1):
-                mouvement["id"] = str(mouvement["_id"]) if "_id" in mouvement else mouvement.get("id")
-                if "_id" in mouvement:
-                    del mouvement["_id"]
-                mouvements.append(mouvement)
-        except:
-            pass
-    
-    return mouvements
+    # Chercher par id ou, pour les anciens mouvements, par ObjectId
+    cles = [produit_id] + ([ObjectId(produit_id)] if ObjectId.is_valid(produit_id) else [])
+    return await historique_mouvements("mouvements_stock", cles)
 
 # Routes Factures (Comptable, Manager et Admin)
 @app.get("/api/factures", response_model=List[Facture])
@@ -1488,6 +3900,7 @@ async def create_facture(facture: Facture, current_user: dict = Depends(comptabl
     
     # Vérifier et mettre à jour les stocks SEULEMENT si la facture n'est pas encore créée
     stocks_mis_a_jour = []
+    mouvements = []
     try:
         for ligne in facture.lignes:
             produit = await db.produits.find_one({"id": ligne.produit_id})
@@ -1523,7 +3936,7 @@ async def create_facture(facture: Facture, current_user: dict = Depends(comptabl
                     "motif": f"Vente - Facture {facture.numero}",
                     "date_mouvement": datetime.now()
                 }
-                await db.mouvements_stock.insert_one(mouvement)
+                mouvements.append(mouvement)
                 
                 stocks_mis_a_jour.append({
                     "produit_id": ligne.produit_id,
@@ -1534,12 +3947,13 @@ async def create_facture(facture: Facture, current_user: dict = Depends(comptabl
         # Sauvegarder la facture
         facture_dict = facture.dict()
         await db.factures.insert_one(facture_dict)
+        # Mouvements de toutes les lignes en une seule écriture du journal
+        await journal_mouvements.journaliser("mouvements_stock", *mouvements)
         
-        print(f"✅ Facture {facture.numero} créée avec succès")
-        if stocks_mis_a_jour:
-            print(f"📦 Stocks mis à jour pour {len(stocks_mis_a_jour)} produit(s)")
-            for stock_info in stocks_mis_a_jour:
-                print(f"   - Produit {stock_info['produit_id']}: {stock_info['ancien_stock']} → {stock_info['nouveau_stock']}")
+        log_facture.info(
+            "Facture %s créée avec succès", facture.numero,
+            extra={"facture_id": facture.id, "stocks_mis_a_jour": stocks_mis_a_jour}
+        )
         
         return facture
         
@@ -1584,7 +3998,7 @@ async def update_facture(facture_id: str, facture: Facture):
     return facture
 
 @app.post("/api/factures/{facture_id}/envoyer")
-async def envoyer_facture(facture_id: str, background_tasks: BackgroundTasks, current_user: dict = Depends(comptable_manager_admin())):
+async def envoyer_facture(facture_id: str, current_user: dict = Depends(comptable_manager_admin())):
     """Envoyer une facture - Comptable, Manager et Admin"""
     # Utiliser la même logique de recherche que les autres fonctions
     facture = await db.factures.find_one({"$or": [{"id": facture_id}, {"_id": facture_id}]})
@@ -1601,7 +4015,7 @@ async def envoyer_facture(facture_id: str, background_tasks: BackgroundTasks, cu
         raise HTTPException(status_code=404, detail="Facture non trouvée")
     
     # Simulation d'envoi email
-    background_tasks.add_task(simulate_email_send, facture["client_email"], facture["numero"])
+    await planifier_travail("email", {"email": facture["client_email"], "numero_facture": facture["numero"]})
     
     # Mettre à jour le statut - utiliser le même ID que celui trouvé
     if "_id" in facture and not facture.get("id"):
@@ -1640,11 +4054,9 @@ async def simulate_payment(request: dict, current_user: dict = Depends(comptable
             pass
     
     if not facture:
-        print(f"❌ PAIEMENT SIMULÉ - Facture avec ID {facture_id} non trouvée")
+        log_paiement.warning("Paiement simulé - facture %s non trouvée", facture_id)
         raise HTTPException(status_code=404, detail="Facture non trouvée")
     
-    print(f"✅ PAIEMENT SIMULÉ - Facture trouvée: {facture.get('numero', 'N/A')}")
-    
     # Créer un enregistrement de paiement simulé
     paiement = {
         "id": str(uuid.uuid4()),
@@ -1665,9 +4077,14 @@ async def simulate_payment(request: dict, current_user: dict = Depends(comptable
     # Simulation du lien de paiement Stripe
     payment_url = f"https://checkout.stripe.com/pay/cs_test_simulate_{facture_id}"
     
-    print(f"💳 PAIEMENT SIMULÉ - Création du lien de paiement pour la facture {facture['numero']}")
-    print(f"   Montant: {facture['total_ttc_usd']} USD / {facture['total_ttc_fc']} FC")
-    print(f"   Devise: {devise_paiement}")
+    log_paiement.info(
+        "Paiement simulé - lien de paiement créé pour la facture %s", facture["numero"],
+        extra={
+            "montant_usd": facture["total_ttc_usd"],
+            "montant_fc": facture["total_ttc_fc"],
+            "devise": devise_paiement
+        }
+    )
     
     return {
         "payment_url": payment_url,
@@ -1680,8 +4097,6 @@ async def simulate_payment(request: dict, current_user: dict = Depends(comptable
 @app.post("/api/factures/{facture_id}/payer")
 async def marquer_payee(facture_id: str, paiement_id: Optional[str] = None, current_user: dict = Depends(comptable_manager_admin())):
     """Marquer une facture comme payée - Comptable, Manager et Admin"""
-    print(f"🔍 MARQUAGE PAYÉE - Tentative de marquage pour ID: {facture_id}")
-    
     # D'abord, vérifier si la facture existe avec find_one (même logique que simulate_payment)
     facture = await db.factures.find_one({"$or": [{"id": facture_id}, {"_id": facture_id}]})
     
@@ -1690,15 +4105,11 @@ async def marquer_payee(facture_id: str, paiement_id: Optional[str] = None, curr
         try:
             from bson import ObjectId
             facture = await db.factures.find_one({"_id": ObjectId(facture_id)})
-            print(f"✅ MARQUAGE PAYÉE - Facture trouvée avec ObjectId: {facture_id}")
         except Exception as e:
-            print(f"❌ MARQUAGE PAYÉE - Erreur ObjectId: {e}")
-            pass
-    else:
-        print(f"✅ MARQUAGE PAYÉE - Facture trouvée avec requête $or: {facture.get('numero', 'N/A')}")
+            log_facture.debug("Marquage payée - identifiant %s non convertible en ObjectId: %s", facture_id, e)
     
     if not facture:
-        print(f"❌ MARQUAGE PAYÉE - Facture avec ID {facture_id} non trouvée")
+        log_facture.warning("Marquage payée - facture %s non trouvée", facture_id)
         raise HTTPException(status_code=404, detail="Facture non trouvée")
     
     # Maintenant, marquer la facture comme payée en utilisant le même ID que celui trouvé
@@ -1709,25 +4120,21 @@ async def marquer_payee(facture_id: str, paiement_id: Optional[str] = None, curr
             {"_id": facture["_id"]},
             {"$set": {"statut": "payee", "date_paiement": datetime.now()}}
         )
-        print(f"🔄 MARQUAGE PAYÉE - Mise à jour avec _id MongoDB: {facture['_id']}")
     else:
         # Facture trouvée avec ID UUID
         result = await db.factures.update_one(
             {"id": facture["id"]},
             {"$set": {"statut": "payee", "date_paiement": datetime.now()}}
         )
-        print(f"🔄 MARQUAGE PAYÉE - Mise à jour avec ID UUID: {facture['id']}")
     
     if result.matched_count == 0:
-        print(f"❌ MARQUAGE PAYÉE - Aucune facture mise à jour malgré la présence")
+        log_facture.error("Marquage payée - aucune facture mise à jour pour %s", facture_id)
         raise HTTPException(status_code=404, detail="Erreur lors de la mise à jour de la facture")
     
-    print(f"✅ MARQUAGE PAYÉE - Facture {facture.get('numero', 'N/A')} marquée comme payée")
+    log_facture.info("Facture %s marquée comme payée", facture.get("numero", "N/A"))
     
     # Si aucun paiement_id n'est fourni, créer un enregistrement de paiement manuel
     if not paiement_id:
-        print(f"💳 MARQUAGE PAYÉE - Création d'un enregistrement de paiement manuel")
-        
         # Créer un enregistrement de paiement pour l'historique
         paiement_manuel = {
             "id": str(uuid.uuid4()),
@@ -1744,7 +4151,7 @@ async def marquer_payee(facture_id: str, paiement_id: Optional[str] = None, curr
         }
         
         await db.paiements.insert_one(paiement_manuel)
-        print(f"✅ MARQUAGE PAYÉE - Enregistrement de paiement créé avec ID: {paiement_manuel['id']}")
+        log_paiement.info("Paiement manuel %s enregistré pour la facture %s", paiement_manuel["id"], facture["numero"])
     else:
         # Mettre à jour le statut du paiement existant
         paiement_result = await db.paiements.update_one(
@@ -1767,8 +4174,6 @@ async def marquer_payee(facture_id: str, paiement_id: Optional[str] = None, curr
 @app.post("/api/factures/{facture_id}/annuler")
 async def annuler_facture(facture_id: str, motif: str = Query(..., description="Motif de l'annulation"), current_user: dict = Depends(comptable_manager_admin())):
     """Annuler une facture - Comptable, Manager et Admin"""
-    print(f"🚫 ANNULATION FACTURE - Tentative d'annulation pour ID: {facture_id}, Motif: {motif}")
-    
     # Vérifier si la facture existe
     facture = await db.factures.find_one({"$or": [{"id": facture_id}, {"_id": facture_id}]})
     
@@ -1791,6 +4196,7 @@ async def annuler_facture(facture_id: str, motif: str = Query(..., description="
     
     # Restaurer les stocks si nécessaire
     if facture.get("statut") in ["brouillon", "envoyee"] and facture.get("lignes"):
+        mouvements = []
         for ligne in facture["lignes"]:
             produit = await db.produits.find_one({"id": ligne["produit_id"]})
             if produit and produit.get("gestion_stock", False):
@@ -1811,7 +4217,8 @@ async def annuler_facture(facture_id: str, motif: str = Query(..., description="
                     "motif": f"Annulation facture {facture.get('numero', 'N/A')} - {motif}",
                     "date_mouvement": datetime.now()
                 }
-                await db.mouvements_stock.insert_one(mouvement)
+                mouvements.append(mouvement)
+        await journal_mouvements.journaliser("mouvements_stock", *mouvements)
     
     # Mettre à jour le statut de la facture
     update_data = {
@@ -1835,15 +4242,13 @@ async def annuler_facture(facture_id: str, motif: str = Query(..., description="
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Erreur lors de l'annulation de la facture")
     
-    print(f"✅ ANNULATION FACTURE - Facture {facture.get('numero', 'N/A')} annulée avec succès")
+    log_facture.info("Facture %s annulée", facture.get("numero", "N/A"), extra={"motif": motif})
     
     return {"message": "Facture annulée avec succès"}
 
 @app.delete("/api/factures/{facture_id}")
 async def supprimer_facture(facture_id: str, motif: str = Query(..., description="Motif de la suppression"), current_user: dict = Depends(comptable_manager_admin())):
     """Supprimer une facture - Comptable, Manager et Admin"""
-    print(f"🗑️ SUPPRESSION FACTURE - Tentative de suppression pour ID: {facture_id}, Motif: {motif}")
-    
     # Vérifier si la facture existe
     facture = await db.factures.find_one({"$or": [{"id": facture_id}, {"_id": facture_id}]})
     
@@ -1863,6 +4268,7 @@ async def supprimer_facture(facture_id: str, motif: str = Query(..., description
     
     # Restaurer les stocks si nécessaire
     if facture.get("statut") in ["brouillon", "envoyee", "annulee"] and facture.get("lignes"):
+        mouvements = []
         for ligne in facture["lignes"]:
             produit = await db.produits.find_one({"id": ligne["produit_id"]})
             if produit and produit.get("gestion_stock", False):
@@ -1885,7 +4291,8 @@ async def supprimer_facture(facture_id: str, motif: str = Query(..., description
                         "motif": f"Suppression facture {facture.get('numero', 'N/A')} - {motif}",
                         "date_mouvement": datetime.now()
                     }
-                    await db.mouvements_stock.insert_one(mouvement)
+                    mouvements.append(mouvement)
+        await journal_mouvements.journaliser("mouvements_stock", *mouvements)
     
     # Sauvegarder la facture dans un historique de suppression
     facture_archive = {
@@ -1909,7 +4316,7 @@ async def supprimer_facture(facture_id: str, motif: str = Query(..., description
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Erreur lors de la suppression de la facture")
     
-    print(f"✅ SUPPRESSION FACTURE - Facture {facture.get('numero', 'N/A')} supprimée avec succès")
+    log_facture.info("Facture %s supprimée", facture.get("numero", "N/A"), extra={"motif": motif})
     
     return {"message": "Facture supprimée avec succès"}
 
@@ -2028,8 +4435,6 @@ async def convertir_devis_facture(devis_id: str, current_user: dict = Depends(ma
 @app.delete("/api/devis/{devis_id}")
 async def supprimer_devis(devis_id: str, motif: str = Query(..., description="Motif de la suppression"), current_user: dict = Depends(manager_and_admin())):
     """Supprimer un devis - Manager et Admin"""
-    print(f"🗑️ SUPPRESSION DEVIS - Tentative de suppression pour ID: {devis_id}, Motif: {motif}")
-    
     # Vérifier si le devis existe
     devis = await db.devis.find_one({"$or": [{"id": devis_id}, {"_id": devis_id}]})
     
@@ -2066,7 +4471,7 @@ async def supprimer_devis(devis_id: str, motif: str = Query(..., description="Mo
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Erreur lors de la suppression du devis")
     
-    print(f"✅ SUPPRESSION DEVIS - Devis {devis.get('numero', 'N/A')} supprimé avec succès")
+    log_devis.info("Devis %s supprimé", devis.get("numero", "N/A"), extra={"motif": motif})
     
     return {"message": "Devis supprimé avec succès"}
 
@@ -2113,6 +4518,7 @@ async def get_opportunites(
     return opportunites
 
 @app.get("/api/opportunites/filtres")
+@partage(ttl=10)
 async def get_opportunites_filtres(current_user: dict = Depends(manager_and_admin())):
     """Récupérer les options de filtrage pour les opportunités"""
     
@@ -2330,22 +4736,23 @@ async def update_commande_statut(commande_id: str, statut: str, current_user: di
 
 # STATISTIQUES VENTE
 @app.get("/api/vente/stats", response_model=VenteStats)
+@partage()
 async def get_vente_stats(current_user: dict = Depends(manager_and_admin())):
     """Récupérer les statistiques de vente - Manager et Admin"""
     
     # Statistiques générales
-    total_devis = await db.devis.count_documents({})
-    total_devis_acceptes = await db.devis.count_documents({"statut": "accepte"})
+    total_devis = await db_rapports.devis.count_documents({})
+    total_devis_acceptes = await db_rapports.devis.count_documents({"statut": "accepte"})
     taux_conversion_devis = (total_devis_acceptes / total_devis * 100) if total_devis > 0 else 0
     
-    total_opportunites = await db.opportunites.count_documents({})
-    opportunites_en_cours = await db.opportunites.count_documents({"etape": {"$nin": ["ferme_gagne", "ferme_perdu"]}})
+    total_opportunites = await db_rapports.opportunites.count_documents({})
+    opportunites_en_cours = await db_rapports.opportunites.count_documents({"etape": {"$nin": ["ferme_gagne", "ferme_perdu"]}})
     
-    total_commandes = await db.commandes.count_documents({})
-    commandes_en_cours = await db.commandes.count_documents({"statut": {"$nin": ["livree", "annulee"]}})
+    total_commandes = await db_rapports.commandes.count_documents({})
+    commandes_en_cours = await db_rapports.commandes.count_documents({"statut": {"$nin": ["livree", "annulee"]}})
     
     # Valeur du pipeline
-    pipeline_cursor = db.opportunites.find({"etape": {"$nin": ["ferme_gagne", "ferme_perdu"]}})
+    pipeline_cursor = db_rapports.opportunites.find({"etape": {"$nin": ["ferme_gagne", "ferme_perdu"]}})
     valeur_pipeline_usd = 0
     valeur_pipeline_fc = 0
     
@@ -2357,7 +4764,7 @@ async def get_vente_stats(current_user: dict = Depends(manager_and_admin())):
     now = datetime.now()
     debut_mois = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     
-    devis_mois = db.devis.find({"statut": "accepte", "date_acceptation": {"$gte": debut_mois}})
+    devis_mois = db_rapports.devis.find({"statut": "accepte", "date_acceptation": {"$gte": debut_mois}})
     ca_devis_mois_usd = 0
     ca_devis_mois_fc = 0
     
@@ -2365,7 +4772,7 @@ async def get_vente_stats(current_user: dict = Depends(manager_and_admin())):
         ca_devis_mois_usd += devis.get("total_ttc_usd", 0)
         ca_devis_mois_fc += devis.get("total_ttc_fc", 0)
     
-    commandes_mois = db.commandes.find({"statut": "livree", "date_livraison_reelle": {"$gte": debut_mois}})
+    commandes_mois = db_rapports.commandes.find({"statut": "livree", "date_livraison_reelle": {"$gte": debut_mois}})
     ca_commandes_mois_usd = 0
     ca_commandes_mois_fc = 0
     
@@ -2431,8 +4838,6 @@ async def get_paiements(page: int = Query(1, ge=1), limit: int = Query(10, ge=1,
 @app.delete("/api/paiements/{paiement_id}")
 async def supprimer_paiement(paiement_id: str, motif: str = Query(..., description="Motif de la suppression"), current_user: dict = Depends(comptable_manager_admin())):
     """Supprimer un paiement - Comptable, Manager et Admin"""
-    print(f"🗑️ SUPPRESSION PAIEMENT - Tentative de suppression pour ID: {paiement_id}, Motif: {motif}")
-    
     # Vérifier si le paiement existe
     paiement = await db.paiements.find_one({"$or": [{"id": paiement_id}, {"_id": paiement_id}]})
     
@@ -2487,22 +4892,24 @@ async def supprimer_paiement(paiement_id: str, motif: str = Query(..., descripti
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Erreur lors de la suppression du paiement")
     
-    print(f"✅ SUPPRESSION PAIEMENT - Paiement {paiement.get('reference_paiement', 'N/A')} supprimé avec succès")
+    log_paiement.info("Paiement %s supprimé", paiement.get("id") or str(paiement.get("_id")), extra={"motif": motif})
     
     return {"message": "Paiement supprimé avec succès"}
 
 # Simulation des intégrations
+@travail_de_fond("email")
 async def simulate_email_send(email: str, numero_facture: str):
     """Simule l'envoi d'email"""
-    print(f"📧 EMAIL SIMULÉ - Envoi de la facture {numero_facture} à {email}")
+    log_email.info("Email simulé - envoi de la facture %s à %s", numero_facture, email)
 
 # Route Statistics
 @app.get("/api/stats", response_model=StatsResponse)
+@partage()
 async def get_stats(current_user: dict = Depends(all_authenticated())):
     """Récupérer les statistiques - Tous les utilisateurs authentifiés"""
-    total_clients = await db.clients.count_documents({})
-    total_produits = await db.produits.count_documents({"actif": True})
-    total_factures = await db.factures.count_documents({})
+    total_clients = await db_rapports.clients.count_documents({})
+    total_produits = await db_rapports.produits.count_documents({"actif": True})
+    total_factures = await db_rapports.factures.count_documents({})
     
     # Calculer le CA mensuel et annuel
     now = datetime.now()
@@ -2510,14 +4917,14 @@ async def get_stats(current_user: dict = Depends(all_authenticated())):
     debut_annee = now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
     
     factures_mois = []
-    async for facture in db.factures.find({
+    async for facture in db_rapports.factures.find({
         "statut": "payee",
         "date_paiement": {"$gte": debut_mois}
     }):
         factures_mois.append(facture)
     
     factures_annee = []
-    async for facture in db.factures.find({
+    async for facture in db_rapports.factures.find({
         "statut": "payee",
         "date_paiement": {"$gte": debut_annee}
     }):
@@ -2530,7 +4937,7 @@ async def get_stats(current_user: dict = Depends(all_authenticated())):
     
     # Factures impayées
     factures_impayees = []
-    async for facture in db.factures.find({"statut": {"$in": ["envoyee", "brouillon"]}}):
+    async for facture in db_rapports.factures.find({"statut": {"$in": ["envoyee", "brouillon"]}}):
         factures_impayees.append(facture)
     
     nb_impayees = len(factures_impayees)
@@ -2538,7 +4945,7 @@ async def get_stats(current_user: dict = Depends(all_authenticated())):
     montant_impaye_fc = sum(f.get("total_ttc_fc", 0) for f in factures_impayees)
     
     # Produits en stock bas
-    produits_stock_bas = await db.produits.count_documents({
+    produits_stock_bas = await db_rapports.produits.count_documents({
         "gestion_stock": True,
         "$expr": {"$lt": ["$stock_actuel", "$stock_minimum"]}
     })
@@ -2576,7 +4983,7 @@ async def create_test_movement(produit_id: str):
         "date_mouvement": datetime.now()
     }
     
-    await db.mouvements_stock.insert_one(mouvement)
+    await journal_mouvements.journaliser("mouvements_stock", mouvement)
     return {"message": "Mouvement de test créé", "mouvement": mouvement}
 
 @app.post("/api/paiements/{paiement_id}/valider")
@@ -2702,7 +5109,10 @@ async def update_app_config(config: dict, current_user: dict = Depends(support_o
         raise HTTPException(status_code=500, detail=f"Erreur lors de la mise à jour de la configuration: {str(e)}")
 
 @app.get("/api/config")
-async def get_app_config(current_user: dict = Depends(support_only())):
+async def get_app_config(
+    current_user: dict = Depends(support_only()),
+    _conditionnel: None = Depends(get_conditionnel("app_config"))
+):
     """Récupérer la configuration de l'application - Support seulement"""
     try:
         # Récupérer la configuration générale
@@ -2779,6 +5189,13 @@ async def change_user_role(user_id: str, role_data: dict, current_user: dict = D
 async def health_check():
     return {"status": "healthy", "message": "Application de facturation opérationnelle"}
 
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics(request: Request):
+    """Exposer les métriques au format Prometheus"""
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Jeton de métriques invalide")
+    return PlainTextResponse(metriques.exposer(), media_type="text/plain; version=0.0.4")
+
 # ===== ENDPOINTS SÉPARÉS POUR GESTION UTILISATEURS ET PARAMÈTRES =====
 
 # Les endpoints /api/users sont maintenant gérés avec les permissions admin_support() ci-dessus
@@ -2824,9 +5241,8 @@ async def update_taux_change(taux_data: dict, current_user: dict = Depends(suppo
         if not nouveau_taux or nouveau_taux <= 0:
             raise HTTPException(status_code=400, detail="Taux de change invalide")
         
-        # Mettre à jour le taux global
-        TAUX_CHANGE["USD_TO_FC"] = float(nouveau_taux)
-        TAUX_CHANGE["FC_TO_USD"] = 1.0 / float(nouveau_taux)
+        # Mettre à jour le taux partagé (auparavant seul le cache du worker changeait)
+        await enregistrer_taux_change(float(nouveau_taux))
         
         # Enregistrer l'historique (optionnel)
         await db.taux_change_history.insert_one({
@@ -2863,64 +5279,1526 @@ async def system_health(current_user: dict = Depends(support_only())):
                 "api": "operational",
                 "auth": "operational"
             },
+            "deploiement": {
+                "multi_workers": MULTI_WORKERS,
+                "pid": os.getpid(),
+                "taux_change_actuel": TAUX_CHANGE["USD_TO_FC"]
+            },
             "version": "1.0.0"
         }
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la vérification de santé: {str(e)}")
 
-@app.post("/api/parametres/backup")
-async def create_backup(current_user: dict = Depends(support_only())):
-    """Créer une sauvegarde du système - Support seulement"""
+async def expliquer_requete_lente(entree: dict) -> dict:
+    """Exécute explain("executionStats") sur la dernière occurrence d'une requête lente"""
+    commande = entree.get("_commande_brute")
+    if not commande or entree["commande"] not in COMMANDES_EXPLICABLES:
+        return {"erreur": "Commande non explicable"}
+
+    a_expliquer = {
+        cle: valeur for cle, valeur in commande.items()
+        if not cle.startswith("$") and cle not in CHAMPS_HORS_EXPLAIN
+    }
     try:
-        # Simulation de sauvegarde
-        backup_info = {
-            "filename": f"facturapp_backup_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.json",
-            "timestamp": datetime.utcnow(),
-            "created_by": current_user.get("email"),
-            "size": "estimated 2.5 MB",
-            "status": "success"
-        }
-        
+        resultat = await db.command({"explain": a_expliquer, "verbosity": "executionStats"})
+        return analyser_plan(resultat)
+    except Exception as e:
+        return {"erreur": str(e)}
+
+@app.get("/api/parametres/requetes-lentes")
+async def get_requetes_lentes(
+    top: int = Query(20, ge=1, le=200),
+    expliquer: int = Query(5, ge=0, le=50, description="Nombre de requêtes à analyser avec explain"),
+    current_user: dict = Depends(support_only())
+):
+    """Requêtes MongoDB les plus lentes avec plan d'exécution - Support seulement"""
+    entrees = capteur_requetes_lentes.pires(top)
+    
+    for entree in entrees[:expliquer]:
+        if entree["plan"] is None:
+            entree["plan"] = await expliquer_requete_lente(entree)
+    
+    requetes = []
+    for entree in entrees:
+        requete = {k: v for k, v in entree.items() if not k.startswith("_")}
+        requete["duree_moyenne_ms"] = round(entree["duree_totale_ms"] / entree["occurrences"], 2)
+        requetes.append(requete)
+    
+    return {
+        "seuil_ms": capteur_requetes_lentes.seuil_ms,
+        "actif": capteur_requetes_lentes.actif,
+        "requetes": requetes
+    }
+
+@app.delete("/api/parametres/requetes-lentes")
+async def reinitialiser_requetes_lentes(current_user: dict = Depends(support_only())):
+    """Réinitialiser les statistiques de requêtes lentes - Support seulement"""
+    capteur_requetes_lentes.reinitialiser()
+    return {"message": "Statistiques de requêtes lentes réinitialisées"}
+
+@app.get("/api/parametres/profils")
+async def get_profils(limit: int = Query(50, ge=1, le=200), current_user: dict = Depends(support_only())):
+    """Lister les profils de requêtes enregistrés - Support seulement"""
+    profils = []
+    async for profil in db.profils_requetes.find({}, {"_id": 0, "rapport": 0}).sort("date_creation", -1).limit(limit):
+        profils.append(profil)
+    return {"profils": profils}
+
+@app.get("/api/parametres/profils/{profil_id}")
+async def get_profil(profil_id: str, current_user: dict = Depends(support_only())):
+    """Récupérer un profil de requête avec son rapport - Support seulement"""
+    profil = await db.profils_requetes.find_one({"id": profil_id}, {"_id": 0})
+    if not profil:
+        raise HTTPException(status_code=404, detail="Profil non trouvé")
+    if profil.get("format") == "html":
+        return HTMLResponse(profil["rapport"])
+    return profil
+
+# ===== SAUVEGARDE ET RESTAURATION =====
+
+BACKUP_DIR = os.environ.get('BACKUP_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sauvegardes'))
+BACKUP_FORMAT = os.environ.get('BACKUP_FORMAT', 'bson')  # bson ou ndjson
+BACKUP_COMPRESSION = os.environ.get('BACKUP_COMPRESSION', 'gzip')  # gzip, zstd ou aucune
+BACKUP_BATCH_SIZE = int(os.environ.get('BACKUP_BATCH_SIZE', '1000'))
+BACKUP_PARALLELISME = int(os.environ.get('BACKUP_PARALLELISME', '2'))
+RESTORE_INSERTS_PARALLELES = int(os.environ.get('RESTORE_INSERTS_PARALLELES', '4'))
+
+EXTENSIONS_FORMAT = {"bson": ".bson", "ndjson": ".ndjson"}
+EXTENSIONS_COMPRESSION = {"gzip": ".gz", "zstd": ".zst", "aucune": ""}
+# Suivi des travaux de sauvegarde : ne se sauvegarde pas lui-même, pas plus que les états
+# techniques (synchronisation des clients, versions, limitation des connexions) : une
+# restauration change l'époque de synchronisation de toute façon
+COLLECTIONS_HORS_SAUVEGARDE = {"sauvegardes", "synchronisation", "suppressions", "versions_collections", "limitation_connexions"}
+OPTIONS_INDEX_RESTAURABLES = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression", "collation")
+
+log_sauvegarde = logging.getLogger("facturapp.sauvegarde")
+
+class FluxHache:
+    """Fichier en écriture qui calcule au fil de l'eau la taille et le SHA-256 de ce qu'il reçoit"""
+
+    def __init__(self, chemin: str):
+        self.fichier = open(chemin, "wb")
+        self.sha256 = hashlib.sha256()
+        self.octets = 0
+
+    def write(self, donnees) -> int:
+        self.sha256.update(donnees)
+        self.octets += len(donnees)
+        return self.fichier.write(donnees)
+
+    def flush(self):
+        self.fichier.flush()
+
+    def close(self):
+        self.fichier.close()
+
+def verifier_options_sauvegarde(format_sauvegarde: str, compression: str):
+    if format_sauvegarde not in EXTENSIONS_FORMAT:
+        raise HTTPException(status_code=400, detail=f"Format de sauvegarde inconnu: {format_sauvegarde}")
+    if compression not in EXTENSIONS_COMPRESSION:
+        raise HTTPException(status_code=400, detail=f"Compression inconnue: {compression}")
+    if compression == "zstd" and zstandard is None:
+        raise HTTPException(status_code=400, detail="Compression zstd indisponible (paquet zstandard non installé)")
+
+def ouvrir_ecriture_compressee(flux: FluxHache, compression: str):
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=flux, mode="wb", compresslevel=6)
+    if compression == "zstd":
+        return zstandard.ZstdCompressor(level=3).stream_writer(flux, closefd=False)
+    return flux
+
+def ouvrir_lecture_compressee(chemin: str, compression: str):
+    if compression == "gzip":
+        return gzip.open(chemin, "rb")
+    if compression == "zstd":
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(chemin, "rb"), closefd=True))
+    return open(chemin, "rb")
+
+def ecrire_lot(sortie, lot: list, format_sauvegarde: str):
+    """Encode et compresse un lot de documents (exécuté hors de la boucle d'événements)"""
+    if format_sauvegarde == "bson":
+        sortie.write(b"".join(
+            document.raw if isinstance(document, RawBSONDocument) else bson.encode(document)
+            for document in lot
+        ))
+    else:
+        sortie.write("".join(
+            json_util.dumps(document, json_options=json_util.RELAXED_JSON_OPTIONS) + "\n"
+            for document in lot
+        ).encode("utf-8"))
+
+def fermer_ecriture(sortie, flux: FluxHache):
+    if sortie is not flux:
+        sortie.close()
+    flux.close()
+
+def somme_sha256(chemin: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(chemin, "rb") as fichier:
+        for bloc in iter(lambda: fichier.read(1024 * 1024), b""):
+            sha256.update(bloc)
+    return sha256.hexdigest()
+
+class LecteurSauvegarde:
+    """Relit un fichier de sauvegarde par lots bornés (méthodes bloquantes, à appeler dans un thread)"""
+
+    def __init__(self, chemin: str, format_sauvegarde: str, compression: str):
+        self.entree = ouvrir_lecture_compressee(chemin, compression)
+        if format_sauvegarde == "bson":
+            self.documents = bson.decode_file_iter(self.entree)
+        else:
+            self.documents = (json_util.loads(ligne) for ligne in self.entree if ligne.strip())
+
+    def lire_lot(self, taille: int) -> list:
+        lot = []
+        for document in self.documents:
+            lot.append(document)
+            if len(lot) >= taille:
+                break
+        return lot
+
+    def fermer(self):
+        self.entree.close()
+
+def description_index(index_information: dict) -> List[dict]:
+    """Index secondaires d'une collection, sous une forme recréable par create_index"""
+    index = []
+    for nom, info in index_information.items():
+        if nom == "_id_":
+            continue
+        index.append({
+            "nom": nom,
+            "cles": [[champ, sens] for champ, sens in info["key"]],
+            "options": {option: info[option] for option in OPTIONS_INDEX_RESTAURABLES if option in info}
+        })
+    return index
+
+class EcrivainSegment:
+    """Écrit un fichier compressé par lots, l'encodage se faisant dans un thread
+
+    Un lot s'écrit pendant que l'appelant prépare le suivant : au plus deux
+    lots sont en mémoire, quelle que soit la taille de la collection.
+    """
+
+    def __init__(self, chemin: str, format_sauvegarde: str, compression: str):
+        self.chemin = chemin
+        self.format = format_sauvegarde
+        self.compression = compression
+        self.flux = None
+        self.sortie = None
+        self.lot = []
+        self.ecriture = None
+        self.documents = 0
+
+    async def ouvrir(self):
+        self.flux = await asyncio.to_thread(FluxHache, self.chemin)
+        self.sortie = ouvrir_ecriture_compressee(self.flux, self.compression)
+
+    async def ajouter(self, document) -> bool:
+        """Ajoute un document ; retourne True quand un lot vient d'être envoyé à l'écriture"""
+        self.lot.append(document)
+        if len(self.lot) < BACKUP_BATCH_SIZE:
+            return False
+        await self._envoyer()
+        return True
+
+    async def _envoyer(self):
+        if self.ecriture:
+            await self.ecriture
+        lot, self.lot = self.lot, []
+        self.ecriture = asyncio.create_task(asyncio.to_thread(ecrire_lot, self.sortie, lot, self.format))
+        self.documents += len(lot)
+
+    async def fermer(self) -> dict:
+        try:
+            if self.lot:
+                await self._envoyer()
+            if self.ecriture:
+                await self.ecriture
+        finally:
+            if self.ecriture and not self.ecriture.done():
+                await asyncio.wait([self.ecriture])
+            await asyncio.to_thread(fermer_ecriture, self.sortie, self.flux)
         return {
-            "message": "Sauvegarde créée avec succès",
-            "backup": backup_info
+            "fichier": os.path.basename(self.chemin),
+            "documents": self.documents,
+            "octets": self.flux.octets,
+            "sha256": self.flux.sha256.hexdigest()
         }
-    
+
+async def sauvegarder_collection(sauvegarde_id: str, nom: str, dossier: str, format_sauvegarde: str, compression: str) -> dict:
+    """Copie une collection dans un fichier compressé"""
+    fichier = nom + EXTENSIONS_FORMAT[format_sauvegarde] + EXTENSIONS_COMPRESSION[compression]
+    segment = EcrivainSegment(os.path.join(dossier, fichier), format_sauvegarde, compression)
+    await segment.ouvrir()
+
+    collection = db[nom]
+    if format_sauvegarde == "bson":
+        # Documents bruts : les octets BSON sont recopiés sans décodage ni réencodage
+        collection = collection.with_options(codec_options=CodecOptions(document_class=RawBSONDocument))
+
+    derniere_progression = time.monotonic()
+    try:
+        async for document in collection.find({}, batch_size=BACKUP_BATCH_SIZE):
+            if await segment.ajouter(document) and time.monotonic() - derniere_progression >= 1:
+                derniere_progression = time.monotonic()
+                await db.sauvegardes.update_one(
+                    {"id": sauvegarde_id},
+                    {"$set": {f"progression.{nom}": segment.documents}}
+                )
+    finally:
+        resultat = await segment.fermer()
+
+    await db.sauvegardes.update_one(
+        {"id": sauvegarde_id},
+        {"$set": {f"progression.{nom}": resultat["documents"]}, "$inc": {"documents_traites": resultat["documents"]}}
+    )
+    resultat["index"] = description_index(await db[nom].index_information())
+    return resultat
+
+def ecrire_manifeste(dossier: str, manifeste: dict):
+    # Écriture atomique : un manifeste présent signale une sauvegarde complète
+    temporaire = os.path.join(dossier, "manifest.json.tmp")
+    with open(temporaire, "w", encoding="utf-8") as fichier:
+        fichier.write(json_util.dumps(manifeste, indent=2, ensure_ascii=False, json_options=json_util.RELAXED_JSON_OPTIONS))
+    os.replace(temporaire, os.path.join(dossier, "manifest.json"))
+
+def lire_manifeste(dossier: str) -> dict:
+    with open(os.path.join(dossier, "manifest.json"), encoding="utf-8") as fichier:
+        return json_util.loads(fichier.read())
+
+def collections_sauvegardables(noms: List[str]) -> List[str]:
+    return sorted(nom for nom in noms if not nom.startswith("system.") and nom not in COLLECTIONS_HORS_SAUVEGARDE)
+
+@travail_de_fond("sauvegarde")
+async def executer_sauvegarde(sauvegarde_id: str):
+    """Tâche de fond : sauvegarde toutes les collections et écrit le manifeste"""
+    sauvegarde = await db.sauvegardes.find_one({"id": sauvegarde_id})
+    dossier = os.path.join(BACKUP_DIR, sauvegarde["nom"])
+    format_sauvegarde, compression = sauvegarde["format"], sauvegarde["compression"]
+    try:
+        await asyncio.to_thread(os.makedirs, dossier, exist_ok=True)
+        # Position prise avant l'instantané : le premier incrément rejoue ce qui a bougé pendant la copie
+        point_reprise = await point_reprise_actuel()
+        noms = collections_sauvegardables(await db.list_collection_names())
+        estimations = await asyncio.gather(*(db[nom].estimated_document_count() for nom in noms))
+        await db.sauvegardes.update_one(
+            {"id": sauvegarde_id},
+            {"$set": {
+                "statut": "en_cours",
+                "date_debut": datetime.utcnow(),
+                "documents_estimes": sum(estimations),
+                # Remise à zéro si le travail est repris après l'arrêt d'un worker
+                "documents_traites": 0,
+                "progression": {}
+            }}
+        )
+
+        semaphore = asyncio.Semaphore(BACKUP_PARALLELISME)
+
+        async def sauvegarder(nom):
+            async with semaphore:
+                return nom, await sauvegarder_collection(sauvegarde_id, nom, dossier, format_sauvegarde, compression)
+
+        collections = dict(await asyncio.gather(*(sauvegarder(nom) for nom in noms)))
+        manifeste = {
+            "id": sauvegarde_id,
+            "nom": sauvegarde["nom"],
+            "base": DB_NAME,
+            "format": format_sauvegarde,
+            "compression": compression,
+            "point_reprise": {"mode": point_reprise["mode"], "date": point_reprise["date"]},
+            "date_creation": sauvegarde["date_creation"],
+            "date_fin": datetime.utcnow(),
+            "collections": collections
+        }
+        await asyncio.to_thread(ecrire_manifeste, dossier, manifeste)
+
+        await db.sauvegardes.update_one(
+            {"id": sauvegarde_id},
+            {"$set": {
+                "statut": "termine",
+                "date_fin": manifeste["date_fin"],
+                "point_reprise": point_reprise,
+                "collections": {nom: {"documents": c["documents"], "octets": c["octets"]} for nom, c in collections.items()},
+                "octets": sum(c["octets"] for c in collections.values())
+            }}
+        )
+        log_sauvegarde.info("Sauvegarde %s terminée: %d collections", sauvegarde["nom"], len(collections))
+    except Exception as e:
+        log_sauvegarde.exception("Échec de la sauvegarde %s", sauvegarde["nom"])
+        await db.sauvegardes.update_one(
+            {"id": sauvegarde_id},
+            {"$set": {"statut": statut_echec(), "erreur": str(e), "date_fin": datetime.utcnow()}}
+        )
+        raise
+
+# ===== SAUVEGARDES INCRÉMENTALES =====
+
+# Marge appliquée aux filigranes : horloges décalées et écritures en vol au moment de la capture
+FILIGRANE_MARGE_SECONDES = int(os.environ.get('FILIGRANE_MARGE_SECONDES', '300'))
+# Champs de date consultés en mode filigrane (sans replica set) ; date_modification et
+# date_creation par défaut. Les suppressions et les modifications qui ne touchent aucun
+# de ces champs ne sont visibles qu'avec le flux de changements.
+CHAMPS_FILIGRANE = {
+    "factures": ["date_modification", "date_creation", "date_paiement"],
+    "paiements": ["date_modification", "date_paiement"],
+    # Seaux d'historique : date_modification avance à chaque écriture, migration comprise
+    # (fin reste la date du dernier mouvement, ancienne pour un seau migré)
+    "mouvements_stock_seaux": ["date_modification", "fin"],
+    "mouvements_outils_seaux": ["date_modification", "fin"],
+    "affectations_outils": ["date_modification", "date_affectation", "date_retour_effective"],
+    "devis": ["date_modification", "date_creation", "date_acceptation"],
+    "commandes": ["date_modification", "date_creation", "date_livraison_reelle"],
+    "users": ["date_modification", "date_creation", "derniere_connexion"],
+}
+TYPES_CHANGEMENTS = ["insert", "update", "replace", "delete", "drop"]
+CODE_FLUX_INDISPONIBLE = 40573  # change streams réservés aux replica sets
+CODE_HISTORIQUE_PERDU = 286  # point de reprise sorti de l'oplog
+
+async def point_reprise_actuel() -> dict:
+    """Position courante des changements, d'où partira le prochain incrément"""
+    try:
+        async with db.watch([{"$match": {"operationType": {"$in": TYPES_CHANGEMENTS}}}]) as flux:
+            await flux.try_next()
+            return {"mode": "flux", "jeton": flux.resume_token, "date": datetime.now()}
+    except OperationFailure as e:
+        # Serveur autonome : pas de flux de changements, repli sur les filigranes
+        if e.code != CODE_FLUX_INDISPONIBLE:
+            raise
+    return {"mode": "filigrane", "date": datetime.now()}
+
+def evenement_depuis_changement(changement: dict) -> dict:
+    """Réduit un événement du flux de changements à ce qu'il faut pour le rejouer"""
+    operation = changement["operationType"]
+    horodatage = changement.get("wallTime") or changement["clusterTime"].as_datetime()
+    # Heure locale du serveur, comme les dates métier et le paramètre jusqu_a de la restauration
+    horodatage = horodatage.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+    evenement = {"ts": horodatage, "cle": changement.get("documentKey")}
+    if operation in ("insert", "replace"):
+        evenement.update(op="r", doc=changement["fullDocument"])
+    elif operation == "update":
+        description = changement["updateDescription"]
+        evenement.update(op="u", maj={
+            "$set": description.get("updatedFields") or {},
+            "$unset": {champ: "" for champ in description.get("removedFields") or []},
+            "tronques": [[t["field"], t["newSize"]] for t in description.get("truncatedArrays") or []]
+        })
+    elif operation == "delete":
+        evenement["op"] = "d"
+    else:
+        # drop : la collection est vidée à cet instant
+        evenement["op"] = "x"
+    return evenement
+
+async def capturer_flux(increment_id: str, dossier: str, compression: str, depuis: dict) -> tuple:
+    """Lit le flux de changements depuis le point de reprise jusqu'à l'instant présent"""
+    segments = {}
+    # Borne haute : les changements postérieurs au lancement iront dans l'incrément suivant
+    borne = (await db.command("ping")).get("operationTime")
+    pipeline = [{"$match": {
+        "operationType": {"$in": TYPES_CHANGEMENTS},
+        "ns.coll": {"$nin": sorted(COLLECTIONS_HORS_SAUVEGARDE)}
+    }}]
+    jeton = depuis["jeton"]
+    try:
+        async with db.watch(pipeline, resume_after=jeton, batch_size=BACKUP_BATCH_SIZE) as flux:
+            while True:
+                changement = await flux.try_next()
+                if changement is None:
+                    jeton = flux.resume_token
+                    break
+                if borne and changement["clusterTime"] > borne:
+                    break
+                nom = changement["ns"]["coll"]
+                if nom.startswith("system."):
+                    jeton = changement["_id"]
+                    continue
+                if nom not in segments:
+                    segments[nom] = EcrivainSegment(
+                        os.path.join(dossier, f"{nom}.delta.bson{EXTENSIONS_COMPRESSION[compression]}"),
+                        "bson", compression
+                    )
+                    await segments[nom].ouvrir()
+                await segments[nom].ajouter(evenement_depuis_changement(changement))
+                jeton = changement["_id"]
+    except OperationFailure as e:
+        for segment in segments.values():
+            await segment.fermer()
+        if e.code == CODE_HISTORIQUE_PERDU:
+            raise ValueError("Point de reprise sorti de l'oplog : une nouvelle sauvegarde complète est nécessaire")
+        raise
+
+    collections = {}
+    for nom, segment in segments.items():
+        collections[nom] = await segment.fermer()
+    await db.sauvegardes.update_one(
+        {"id": increment_id},
+        {"$set": {"progression": {nom: c["documents"] for nom, c in collections.items()}},
+         "$inc": {"documents_traites": sum(c["documents"] for c in collections.values())}}
+    )
+    return collections, {"mode": "flux", "jeton": jeton, "date": datetime.now()}
+
+async def capturer_filigranes(increment_id: str, dossier: str, compression: str, depuis: dict) -> tuple:
+    """Sans flux de changements : recopie les documents dont une date dépasse le filigrane précédent"""
+    fin = datetime.now()
+    filigrane = depuis["date"] - timedelta(seconds=FILIGRANE_MARGE_SECONDES)
+    noms = collections_sauvegardables(await db.list_collection_names())
+    semaphore = asyncio.Semaphore(BACKUP_PARALLELISME)
+
+    async def capturer(nom):
+        champs = CHAMPS_FILIGRANE.get(nom, ["date_modification", "date_creation"])
+        requete = {"$or": [{champ: {"$gt": filigrane}} for champ in champs]}
+        async with semaphore:
+            segment = EcrivainSegment(
+                os.path.join(dossier, f"{nom}.delta.bson{EXTENSIONS_COMPRESSION[compression]}"),
+                "bson", compression
+            )
+            await segment.ouvrir()
+            try:
+                async for document in db[nom].find(requete, batch_size=BACKUP_BATCH_SIZE):
+                    await segment.ajouter({"op": "r", "ts": fin, "cle": {"_id": document["_id"]}, "doc": document})
+            finally:
+                resultat = await segment.fermer()
+            await db.sauvegardes.update_one(
+                {"id": increment_id},
+                {"$set": {f"progression.{nom}": resultat["documents"]}, "$inc": {"documents_traites": resultat["documents"]}}
+            )
+            return nom, resultat
+
+    collections = {nom: resultat for nom, resultat in await asyncio.gather(*(capturer(nom) for nom in noms)) if resultat["documents"]}
+    # Les segments vides ne sont pas conservés
+    for nom in set(noms) - set(collections):
+        chemin = os.path.join(dossier, f"{nom}.delta.bson{EXTENSIONS_COMPRESSION[compression]}")
+        await asyncio.to_thread(os.remove, chemin)
+    return collections, {"mode": "filigrane", "date": fin}
+
+@travail_de_fond("increment")
+async def executer_increment(increment_id: str):
+    """Tâche de fond : enregistre les changements survenus depuis le maillon précédent"""
+    increment = await db.sauvegardes.find_one({"id": increment_id})
+    parent = await db.sauvegardes.find_one({"id": increment["parent_id"]})
+    dossier = os.path.join(BACKUP_DIR, increment["nom"])
+    try:
+        await asyncio.to_thread(os.makedirs, dossier, exist_ok=True)
+        depuis = parent["point_reprise"]
+        await db.sauvegardes.update_one(
+            {"id": increment_id},
+            {"$set": {
+                "statut": "en_cours",
+                "date_debut": datetime.utcnow(),
+                "mode_capture": depuis["mode"],
+                "documents_traites": 0,
+                "progression": {}
+            }}
+        )
+        if depuis["mode"] == "flux":
+            collections, point_reprise = await capturer_flux(increment_id, dossier, increment["compression"], depuis)
+        else:
+            collections, point_reprise = await capturer_filigranes(increment_id, dossier, increment["compression"], depuis)
+
+        manifeste = {
+            "id": increment_id,
+            "type": "increment",
+            "nom": increment["nom"],
+            "base_id": increment["base_id"],
+            "parent_id": increment["parent_id"],
+            "base": DB_NAME,
+            "format": "bson",
+            "compression": increment["compression"],
+            "mode": depuis["mode"],
+            "depuis": depuis.get("date"),
+            "jusqu_a": point_reprise["date"],
+            "date_creation": increment["date_creation"],
+            "date_fin": datetime.utcnow(),
+            "collections": collections
+        }
+        await asyncio.to_thread(ecrire_manifeste, dossier, manifeste)
+        await db.sauvegardes.update_one(
+            {"id": increment_id},
+            {"$set": {
+                "statut": "termine",
+                "date_fin": manifeste["date_fin"],
+                "depuis": manifeste["depuis"],
+                "jusqu_a": manifeste["jusqu_a"],
+                "point_reprise": point_reprise,
+                "collections": {nom: {"documents": c["documents"], "octets": c["octets"]} for nom, c in collections.items()},
+                "octets": sum(c["octets"] for c in collections.values())
+            }}
+        )
+        log_sauvegarde.info(
+            "Incrément %s terminé (%s): %d changements",
+            increment["nom"], depuis["mode"], sum(c["documents"] for c in collections.values())
+        )
+    except Exception as e:
+        log_sauvegarde.exception("Échec de l'incrément %s", increment["nom"])
+        await db.sauvegardes.update_one(
+            {"id": increment_id},
+            {"$set": {"statut": statut_echec(), "erreur": str(e), "date_fin": datetime.utcnow()}}
+        )
+        raise
+
+def operations_evenement(evenement: dict) -> list:
+    """Traduit un événement enregistré en opérations d'écriture idempotentes"""
+    cle = evenement["cle"]
+    if evenement["op"] == "r":
+        return [ReplaceOne(cle, evenement["doc"], upsert=True)]
+    if evenement["op"] == "d":
+        return [DeleteOne(cle)]
+    maj = evenement["maj"]
+    operations = []
+    if maj.get("tronques"):
+        # Tronquer avant d'appliquer les nouveaux éléments, comme dans l'oplog
+        operations.append(UpdateOne(cle, {"$push": {
+            champ: {"$each": [], "$slice": taille} for champ, taille in maj["tronques"]
+        }}))
+    modification = {operateur: maj[operateur] for operateur in ("$set", "$unset") if maj.get(operateur)}
+    if modification:
+        operations.append(UpdateOne(cle, modification))
+    return operations
+
+async def rejouer_segment(nom: str, chemin: str, compression: str, jusqu_a: Optional[datetime]) -> int:
+    """Rejoue dans l'ordre les événements d'un segment, jusqu'à jusqu_a le cas échéant"""
+    lecteur = await asyncio.to_thread(LecteurSauvegarde, chemin, "bson", compression)
+    evenements = 0
+    try:
+        while True:
+            lot = await asyncio.to_thread(lecteur.lire_lot, BACKUP_BATCH_SIZE)
+            if not lot:
+                break
+            operations = []
+            arret = False
+            for evenement in lot:
+                if jusqu_a and evenement["ts"] > jusqu_a:
+                    arret = True
+                    break
+                evenements += 1
+                if evenement["op"] == "x":
+                    if operations:
+                        await db[nom].bulk_write(operations, ordered=True)
+                        operations = []
+                    # Collection vidée : sans pierres tombales ni $in de tous ses _id. La restauration
+                    # change l'époque de synchronisation, les clients rechargent tout
+                    await db.collection_brute(nom).delete_many({})
+                else:
+                    operations.extend(operations_evenement(evenement))
+            if operations:
+                # Ordonné : plusieurs événements peuvent viser le même document
+                await db[nom].bulk_write(operations, ordered=True)
+            if arret:
+                break
+    finally:
+        await asyncio.to_thread(lecteur.fermer)
+    return evenements
+
+async def rejouer_increment(restauration_id: str, increment: dict, collections: Optional[List[str]], jusqu_a: Optional[datetime]):
+    dossier = os.path.join(BACKUP_DIR, increment["nom"])
+    manifeste = await asyncio.to_thread(lire_manifeste, dossier)
+    noms = [nom for nom in sorted(manifeste["collections"]) if not collections or nom in collections]
+    semaphore = asyncio.Semaphore(BACKUP_PARALLELISME)
+
+    async def rejouer(nom):
+        description = manifeste["collections"][nom]
+        chemin = os.path.join(dossier, description["fichier"])
+        if await asyncio.to_thread(somme_sha256, chemin) != description["sha256"]:
+            raise ValueError(f"Somme de contrôle invalide pour {increment['nom']}/{description['fichier']}")
+        async with semaphore:
+            return await rejouer_segment(nom, chemin, manifeste["compression"], jusqu_a)
+
+    evenements = sum(await asyncio.gather(*(rejouer(nom) for nom in noms)))
+    await db.sauvegardes.update_one(
+        {"id": restauration_id},
+        {"$inc": {"documents_traites": evenements}, "$set": {f"increments_rejoues.{increment['id']}": evenements}}
+    )
+
+async def inserer_lot_restauration(nom: str, lot: list, mode: str):
+    try:
+        await db[nom].insert_many(lot, ordered=False)
+    except BulkWriteError as e:
+        # En fusion, les documents déjà présents (même _id) sont conservés
+        erreurs = e.details.get("writeErrors", [])
+        if mode != "fusionner" or any(erreur.get("code") != 11000 for erreur in erreurs):
+            raise
+
+async def restaurer_collection(restauration_id: str, nom: str, dossier: str, manifeste: dict, mode: str) -> int:
+    """Recharge une collection par lots, plusieurs insert_many en vol"""
+    description = manifeste["collections"][nom]
+    chemin = os.path.join(dossier, description["fichier"])
+    if await asyncio.to_thread(somme_sha256, chemin) != description["sha256"]:
+        raise ValueError(f"Somme de contrôle invalide pour {description['fichier']}")
+
+    if mode == "remplacer":
+        # Les index sont recréés après le chargement, plus rapide qu'une insertion indexée
+        await db[nom].drop()
+        if nom in {collection for collection, _ in JOURNAUX_MOUVEMENTS.values()}:
+            await creer_collection_seaux(nom)
+
+    lecteur = await asyncio.to_thread(LecteurSauvegarde, chemin, manifeste["format"], manifeste["compression"])
+    en_vol = set()
+    documents = 0
+    try:
+        while True:
+            lot = await asyncio.to_thread(lecteur.lire_lot, BACKUP_BATCH_SIZE)
+            if not lot:
+                break
+            if len(en_vol) >= RESTORE_INSERTS_PARALLELES:
+                terminees, en_vol = await asyncio.wait(en_vol, return_when=asyncio.FIRST_COMPLETED)
+                for tache in terminees:
+                    tache.result()
+            en_vol.add(asyncio.create_task(inserer_lot_restauration(nom, lot, mode)))
+            documents += len(lot)
+        if en_vol:
+            for tache in asyncio.as_completed(en_vol):
+                await tache
+    finally:
+        await asyncio.to_thread(lecteur.fermer)
+
+    for index in description.get("index", []):
+        await db[nom].create_index([tuple(cle) for cle in index["cles"]], name=index["nom"], **index["options"])
+
+    await db.sauvegardes.update_one(
+        {"id": restauration_id},
+        {"$set": {f"progression.{nom}": documents}, "$inc": {"documents_traites": documents}}
+    )
+    return documents
+
+@travail_de_fond("restauration")
+async def executer_restauration(restauration_id: str):
+    """Tâche de fond : restaure tout ou partie d'une sauvegarde, puis rejoue ses incréments"""
+    restauration = await db.sauvegardes.find_one({"id": restauration_id})
+    dossier = os.path.join(BACKUP_DIR, restauration["nom"])
+    try:
+        manifeste = await asyncio.to_thread(lire_manifeste, dossier)
+        noms = [nom for nom in restauration.get("collections") or sorted(manifeste["collections"]) if nom in manifeste["collections"]]
+        await db.sauvegardes.update_one(
+            {"id": restauration_id},
+            {"$set": {
+                "statut": "en_cours",
+                "date_debut": datetime.utcnow(),
+                "documents_estimes": sum(manifeste["collections"][nom]["documents"] for nom in noms),
+                "documents_traites": 0,
+                "progression": {},
+                "increments_rejoues": {}
+            }}
+        )
+
+        semaphore = asyncio.Semaphore(BACKUP_PARALLELISME)
+
+        async def restaurer(nom):
+            async with semaphore:
+                return await restaurer_collection(restauration_id, nom, dossier, manifeste, restauration["mode"])
+
+        await asyncio.gather(*(restaurer(nom) for nom in noms))
+
+        # Les incréments se rejouent un par un, dans l'ordre de la chaîne
+        increments = restauration.get("increments") or []
+        for increment_id in increments:
+            increment = await db.sauvegardes.find_one({"id": increment_id})
+            await rejouer_increment(restauration_id, increment, restauration.get("collections"), restauration.get("jusqu_a"))
+
+        await db.sauvegardes.update_one(
+            {"id": restauration_id},
+            {"$set": {"statut": "termine", "date_fin": datetime.utcnow()}}
+        )
+        log_sauvegarde.info(
+            "Restauration de %s terminée: %d collections, %d incréments",
+            restauration["nom"], len(noms), len(increments)
+        )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erreur lors de la création de la sauvegarde: {str(e)}")
+        log_sauvegarde.exception("Échec de la restauration de %s", restauration["nom"])
+        await db.sauvegardes.update_one(
+            {"id": restauration_id},
+            {"$set": {"statut": statut_echec(), "erreur": str(e), "date_fin": datetime.utcnow()}}
+        )
+        raise
+    finally:
+        # Même interrompue, une restauration a pu remplacer des documents sans mettre à jour
+        # date_modification : les clients doivent tout recharger
+        await changer_epoque_synchronisation()
+
+class RestaurationRequest(BaseModel):
+    collections: Optional[List[str]] = None  # Toutes les collections de la sauvegarde par défaut
+    mode: str = "remplacer"  # remplacer, fusionner
+    jusqu_a: Optional[datetime] = None  # Point dans le temps (heure locale du serveur) ; fin de la chaîne par défaut
+
+async def dernier_maillon(base_id: str) -> dict:
+    """Dernier maillon terminé de la chaîne : la sauvegarde complète ou son incrément le plus récent"""
+    dernier = await db.sauvegardes.find_one(
+        {"type": "increment", "base_id": base_id, "statut": "termine"},
+        sort=[("date_creation", -1)]
+    )
+    return dernier or await db.sauvegardes.find_one({"id": base_id})
+
+async def chaine_increments(base_id: str, jusqu_a_id: Optional[str] = None) -> List[dict]:
+    """Incréments terminés d'une sauvegarde complète, du plus ancien au plus récent"""
+    chaine = []
+    async for increment in db.sauvegardes.find(
+        {"type": "increment", "base_id": base_id, "statut": "termine"}
+    ).sort("date_creation", 1):
+        chaine.append(increment)
+        if increment["id"] == jusqu_a_id:
+            break
+    return chaine
+
+@app.post("/api/parametres/backup")
+async def create_backup(
+    format: str = Query(None, description="bson ou ndjson"),
+    compression: str = Query(None, description="gzip, zstd ou aucune"),
+    incremental: bool = Query(False, description="Seulement les changements depuis la dernière sauvegarde"),
+    current_user: dict = Depends(support_only())
+):
+    """Lancer une sauvegarde complète ou incrémentale en tâche de fond - Support seulement"""
+    format_sauvegarde = format or BACKUP_FORMAT
+    compression = compression or BACKUP_COMPRESSION
+    verifier_options_sauvegarde(format_sauvegarde, compression)
+
+    maintenant = datetime.utcnow()
+    if incremental:
+        # Les segments d'incrément sont toujours en BSON : types et événements sans perte
+        base = await db.sauvegardes.find_one(
+            {"type": "sauvegarde", "statut": "termine", "point_reprise": {"$exists": True}},
+            sort=[("date_creation", -1)]
+        )
+        if not base:
+            raise HTTPException(status_code=400, detail="Aucune sauvegarde complète de référence")
+        if await db.sauvegardes.find_one({"type": "increment", "base_id": base["id"], "statut": {"$in": ["en_attente", "en_cours"]}}):
+            raise HTTPException(status_code=409, detail="Un incrément est déjà en cours pour cette sauvegarde")
+        parent = await dernier_maillon(base["id"])
+        increment = {
+            "id": str(uuid.uuid4()),
+            "type": "increment",
+            "base_id": base["id"],
+            "parent_id": parent["id"],
+            "nom": f"facturapp_incr_{maintenant.strftime('%Y%m%d_%H%M%S')}_{secrets.token_hex(3)}",
+            "format": "bson",
+            "compression": compression,
+            "statut": "en_attente",
+            "progression": {},
+            "documents_traites": 0,
+            "cree_par": current_user.get("email"),
+            "date_creation": maintenant
+        }
+        await db.sauvegardes.insert_one(increment)
+        await planifier_travail("increment", {"increment_id": increment["id"]})
+        return {
+            "message": "Sauvegarde incrémentale lancée",
+            "backup": {
+                "id": increment["id"],
+                "filename": increment["nom"],
+                "timestamp": maintenant,
+                "created_by": increment["cree_par"],
+                "format": "bson",
+                "compression": compression,
+                "incremental": True,
+                "base_id": base["id"],
+                "parent_id": parent["id"],
+                "status": increment["statut"]
+            }
+        }
+
+    sauvegarde = {
+        "id": str(uuid.uuid4()),
+        "type": "sauvegarde",
+        "nom": f"facturapp_backup_{maintenant.strftime('%Y%m%d_%H%M%S')}_{secrets.token_hex(3)}",
+        "format": format_sauvegarde,
+        "compression": compression,
+        "statut": "en_attente",
+        "progression": {},
+        "documents_traites": 0,
+        "cree_par": current_user.get("email"),
+        "date_creation": maintenant
+    }
+    await db.sauvegardes.insert_one(sauvegarde)
+    await planifier_travail("sauvegarde", {"sauvegarde_id": sauvegarde["id"]})
+
+    return {
+        "message": "Sauvegarde lancée",
+        "backup": {
+            "id": sauvegarde["id"],
+            "filename": sauvegarde["nom"],
+            "timestamp": maintenant,
+            "created_by": sauvegarde["cree_par"],
+            "format": format_sauvegarde,
+            "compression": compression,
+            "status": sauvegarde["statut"]
+        }
+    }
+
+@app.get("/api/parametres/backups")
+async def get_backups(limit: int = Query(50, ge=1, le=500), current_user: dict = Depends(support_only())):
+    """Lister les sauvegardes et restaurations - Support seulement"""
+    travaux = []
+    async for travail in db.sauvegardes.find({}, {"_id": 0}).sort("date_creation", -1).limit(limit):
+        travaux.append(travail)
+    return {"sauvegardes": travaux}
+
+@app.get("/api/parametres/backups/{sauvegarde_id}")
+async def get_backup(sauvegarde_id: str, current_user: dict = Depends(support_only())):
+    """Suivre une sauvegarde ou une restauration - Support seulement"""
+    travail = await db.sauvegardes.find_one({"id": sauvegarde_id}, {"_id": 0})
+    if not travail:
+        raise HTTPException(status_code=404, detail="Sauvegarde non trouvée")
+    if travail["type"] in ("sauvegarde", "increment") and travail["statut"] == "termine":
+        try:
+            travail["manifeste"] = await asyncio.to_thread(lire_manifeste, os.path.join(BACKUP_DIR, travail["nom"]))
+        except OSError:
+            travail["manifeste"] = None
+    return travail
+
+@app.post("/api/parametres/backups/{sauvegarde_id}/restaurer")
+async def restore_backup(
+    sauvegarde_id: str,
+    demande: RestaurationRequest = RestaurationRequest(),
+    current_user: dict = Depends(support_only())
+):
+    """Restaurer une sauvegarde en tâche de fond - Support seulement
+
+    Sur un incrément, la sauvegarde complète de référence est rechargée puis les
+    incréments sont rejoués jusqu'à celui demandé (ou jusqu'à jusqu_a).
+    """
+    cible = await db.sauvegardes.find_one({"id": sauvegarde_id, "type": {"$in": ["sauvegarde", "increment"]}})
+    if not cible:
+        raise HTTPException(status_code=404, detail="Sauvegarde non trouvée")
+    if cible["statut"] != "termine":
+        raise HTTPException(status_code=400, detail="Seule une sauvegarde terminée peut être restaurée")
+    if demande.mode not in ("remplacer", "fusionner"):
+        raise HTTPException(status_code=400, detail="Mode invalide (remplacer ou fusionner)")
+
+    if cible["type"] == "increment":
+        sauvegarde = await db.sauvegardes.find_one({"id": cible["base_id"], "statut": "termine"})
+        if not sauvegarde:
+            raise HTTPException(status_code=400, detail="Sauvegarde complète de référence introuvable")
+        increments = await chaine_increments(sauvegarde["id"], cible["id"])
+    else:
+        sauvegarde = cible
+        # Sans cible précise, un point dans le temps s'appuie sur toute la chaîne
+        increments = await chaine_increments(sauvegarde["id"]) if demande.jusqu_a else []
+    if demande.jusqu_a and demande.jusqu_a.tzinfo:
+        demande.jusqu_a = demande.jusqu_a.astimezone().replace(tzinfo=None)
+    if demande.jusqu_a:
+        if not sauvegarde.get("point_reprise") or demande.jusqu_a < sauvegarde["point_reprise"]["date"]:
+            raise HTTPException(status_code=400, detail="Point dans le temps antérieur à la sauvegarde complète")
+        # Inutile de lire les incréments qui commencent après le point demandé
+        increments = [i for i in increments if i["depuis"] is None or i["depuis"] <= demande.jusqu_a]
+
+    connues = set(sauvegarde.get("collections", {}))
+    for increment in increments:
+        connues |= set(increment.get("collections", {}))
+    inconnues = set(demande.collections or []) - connues
+    if inconnues:
+        raise HTTPException(status_code=400, detail=f"Collections absentes de la sauvegarde: {', '.join(sorted(inconnues))}")
+
+    restauration = {
+        "id": str(uuid.uuid4()),
+        "type": "restauration",
+        "sauvegarde_id": sauvegarde_id,
+        "nom": sauvegarde["nom"],
+        "mode": demande.mode,
+        "collections": demande.collections,
+        "increments": [increment["id"] for increment in increments],
+        "jusqu_a": demande.jusqu_a,
+        "statut": "en_attente",
+        "progression": {},
+        "documents_traites": 0,
+        "cree_par": current_user.get("email"),
+        "date_creation": datetime.utcnow()
+    }
+    await db.sauvegardes.insert_one(restauration)
+    await planifier_travail("restauration", {"restauration_id": restauration["id"]})
+    restauration.pop("_id", None)
+    return {"message": "Restauration lancée", "restauration": restauration}
 
 @app.get("/api/parametres/logs")
-async def get_system_logs(current_user: dict = Depends(support_only())):
-    """Obtenir les logs système - Support seulement"""
+async def get_system_logs(
+    limit: int = Query(100, ge=1, le=1000),
+    level: Optional[str] = Query(None, description="Niveau minimum (DEBUG, INFO, WARNING, ERROR)"),
+    module: Optional[str] = Query(None, description="Filtrer par module (AUTH, FACTURE, ...)"),
+    request_id: Optional[str] = Query(None, description="Filtrer par identifiant de requête"),
+    current_user: dict = Depends(support_only())
+):
+    """Obtenir les logs système récents - Support seulement"""
     try:
-        # Simulation des logs système
+        niveau_minimum = logging.getLevelName(level.upper()) if level else logging.NOTSET
+        if not isinstance(niveau_minimum, int):
+            raise HTTPException(status_code=400, detail="Niveau de log invalide")
+        
         logs = [
-            {
-                "timestamp": datetime.utcnow().isoformat(),
-                "level": "INFO",
-                "message": f"Authentification réussie pour {current_user.get('email')}",
-                "module": "AUTH"
-            },
-            {
-                "timestamp": (datetime.utcnow() - timedelta(minutes=5)).isoformat(),
-                "level": "INFO",
-                "message": "Nouvelle facture créée",
-                "module": "FACTURE"
-            },
-            {
-                "timestamp": (datetime.utcnow() - timedelta(minutes=10)).isoformat(),
-                "level": "INFO",
-                "message": "Mise à jour du taux de change",
-                "module": "PARAMETRES"
-            }
+            entree for entree in reversed(log_tampon.recentes())
+            if logging.getLevelName(entree["level"]) >= niveau_minimum
+            and (not module or entree["module"] == module.upper())
+            and (not request_id or entree.get("request_id") == request_id)
         ]
         
-        return {"logs": logs}
+        return {"logs": logs[:limit], "capacite": LOG_BUFFER_SIZE}
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la récupération des logs: {str(e)}")
 
+@app.get("/api/parametres/propagations")
+async def get_propagations(limit: int = Query(50, ge=1, le=500), current_user: dict = Depends(admin_support())):
+    """Lister les propagations de noms et réconciliations récentes - Admin et Support"""
+    propagations = []
+    async for propagation in db.propagations_noms.find({}, {"_id": 0}).sort("date_creation", -1).limit(limit):
+        propagations.append(propagation)
+    return {"propagations": propagations}
+
+@app.get("/api/parametres/propagations/{propagation_id}")
+async def get_propagation(propagation_id: str, current_user: dict = Depends(admin_support())):
+    """Suivre l'avancement d'une propagation de noms - Admin et Support"""
+    propagation = await db.propagations_noms.find_one({"id": propagation_id}, {"_id": 0})
+    if not propagation:
+        raise HTTPException(status_code=404, detail="Propagation non trouvée")
+    return propagation
+
+@app.post("/api/parametres/reconciliation-noms")
+async def lancer_reconciliation_noms(current_user: dict = Depends(admin_support())):
+    """Lancer la réconciliation des noms dénormalisés - Admin et Support"""
+    reconciliation = {
+        "id": str(uuid.uuid4()),
+        "type": "reconciliation",
+        "statut": "en_attente",
+        "documents_mis_a_jour": 0,
+        "cibles": {},
+        "lance_par": current_user.get("email"),
+        "date_creation": datetime.now()
+    }
+    await db.propagations_noms.insert_one(reconciliation)
+
+    await planifier_travail("reconciliation_noms", {"reconciliation_id": reconciliation["id"]})
+
+    return {"message": "Réconciliation des noms lancée", "reconciliation_id": reconciliation["id"]}
+
+@app.get("/api/parametres/jobs")
+async def get_jobs(
+    statut: Optional[str] = Query(None, description="en_attente, en_cours, termine ou erreur"),
+    type: Optional[str] = Query(None, description="Type de travail"),
+    limit: int = Query(50, ge=1, le=500),
+    current_user: dict = Depends(admin_support())
+):
+    """Lister les travaux de fond et la file d'attente par type - Admin et Support"""
+    filtre = {}
+    if statut:
+        filtre["statut"] = statut
+    if type:
+        filtre["type"] = type
+    travaux = [travail async for travail in db.jobs.find(filtre, {"_id": 0}).sort("date_creation", -1).limit(limit)]
+    file_attente = {}
+    async for groupe in db.jobs.aggregate([
+        {"$match": {"statut": {"$in": ["en_attente", "en_cours"]}}},
+        {"$group": {"_id": {"type": "$type", "statut": "$statut"}, "nombre": {"$sum": 1}}}
+    ]):
+        file_attente.setdefault(groupe["_id"]["type"], {})[groupe["_id"]["statut"]] = groupe["nombre"]
+    return {"jobs": travaux, "file_attente": file_attente, "worker_integre": JOBS_WORKER_INTEGRE}
+
+@app.get("/api/parametres/jobs/{job_id}")
+async def get_job(job_id: str, current_user: dict = Depends(admin_support())):
+    """Suivre un travail de fond - Admin et Support"""
+    travail = await db.jobs.find_one({"id": job_id}, {"_id": 0})
+    if not travail:
+        raise HTTPException(status_code=404, detail="Travail non trouvé")
+    return travail
+
+# ===== IMPORT EN MASSE =====
+
+IMPORT_DIR = os.environ.get('IMPORT_DIR', os.path.join(tempfile.gettempdir(), 'facturapp_imports'))
+IMPORT_TAILLE_LOT = int(os.environ.get('IMPORT_TAILLE_LOT', '1000'))
+IMPORT_TAILLE_MAX_MO = int(os.environ.get('IMPORT_TAILLE_MAX_MO', '200'))
+# Au-delà, les erreurs sont seulement comptées
+IMPORT_ERREURS_MAX = int(os.environ.get('IMPORT_ERREURS_MAX', '1000'))
+
+# Entités importables : modèle de validation et clé de dédoublonnage
+ENTITES_IMPORT = {
+    "clients": {"modele": Client, "cle": "email"},
+    "produits": {"modele": Produit, "cle": "nom"},
+}
+FORMATS_IMPORT = ("csv", "ndjson")
+MODES_IMPORT = ("ignorer", "mettre_a_jour")  # doublons ignorés ou mis à jour
+# En CSV, les listes (marques, modeles) sont séparées par des barres verticales
+SEPARATEUR_LISTES_CSV = "|"
+
+log_import = logging.getLogger("facturapp.import")
+
+def format_import(format_demande: Optional[str], content_type: str) -> str:
+    if format_demande:
+        if format_demande not in FORMATS_IMPORT:
+            raise HTTPException(status_code=400, detail=f"Format d'import inconnu: {format_demande} (csv ou ndjson)")
+        return format_demande
+    if "csv" in content_type:
+        return "csv"
+    if "ndjson" in content_type or "jsonl" in content_type:
+        return "ndjson"
+    raise HTTPException(status_code=400, detail="Format d'import à préciser (paramètre format=csv ou ndjson)")
+
+class LecteurImport:
+    """Lit le fichier reçu ligne à ligne (CSV ou NDJSON) et le rend par lots numérotés"""
+
+    def __init__(self, chemin: str, format_import: str):
+        # utf-8-sig : les exports Excel commencent par un BOM
+        self.fichier = open(chemin, "r", encoding="utf-8-sig", newline="")
+        self.format = format_import
+        self.numero = 0
+        if format_import == "csv":
+            entete = self.fichier.readline()
+            self.fichier.seek(0)
+            # Excel en français sépare par des points-virgules
+            delimiteur = ";" if entete.count(";") > entete.count(",") else ","
+            self.lecteur = csv.DictReader(self.fichier, delimiter=delimiteur)
+
+    def lire_lot(self, taille: int) -> list:
+        """Liste de (numéro de ligne, données, erreur de lecture)"""
+        lot = []
+        if self.format == "csv":
+            for ligne in self.lecteur:
+                donnees = {
+                    champ.strip(): valeur.strip()
+                    for champ, valeur in ligne.items()
+                    if champ and isinstance(valeur, str) and valeur.strip() != ""
+                }
+                for champ in ("marques", "modeles"):
+                    if champ in donnees:
+                        donnees[champ] = [v.strip() for v in donnees[champ].split(SEPARATEUR_LISTES_CSV) if v.strip()]
+                lot.append((self.lecteur.line_num, donnees, None))
+                if len(lot) >= taille:
+                    break
+            return lot
+        for ligne in self.fichier:
+            self.numero += 1
+            if not ligne.strip():
+                continue
+            try:
+                donnees = json.loads(ligne)
+                if not isinstance(donnees, dict):
+                    raise ValueError("objet JSON attendu")
+                lot.append((self.numero, donnees, None))
+            except ValueError as e:
+                lot.append((self.numero, None, f"JSON invalide: {e}"))
+            if len(lot) >= taille:
+                break
+        return lot
+
+    def fermer(self):
+        self.fichier.close()
+
+def message_validation(erreur: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(p) for p in detail['loc']) or 'ligne'}: {detail['msg']}" for detail in erreur.errors()
+    )
+
+def valider_lot_import(entite: str, lot: list, maintenant: datetime) -> tuple:
+    """Valide un lot hors de la boucle d'événements
+
+    Renvoie les documents (numéro de ligne, document, champs fournis par la ligne) et les erreurs.
+    """
+    modele = ENTITES_IMPORT[entite]["modele"]
+    documents, erreurs = [], []
+    for numero, donnees, erreur in lot:
+        if erreur:
+            erreurs.append({"ligne": numero, "erreur": erreur})
+            continue
+        try:
+            objet = modele(**donnees)
+        except ValidationError as e:
+            erreurs.append({"ligne": numero, "erreur": message_validation(e)})
+            continue
+        document = objet.dict()
+        fournis = set(objet.dict(exclude_unset=True)) - {"id", "date_creation"}
+        document["id"] = document.get("id") or str(uuid.uuid4())
+        document["date_creation"] = document.get("date_creation") or maintenant
+        if entite == "clients":
+            document["email"] = normaliser_email(document["email"])
+        else:
+            document["nom"] = document["nom"].strip()
+            if document.get("prix_fc") is None:
+                document["prix_fc"] = convertir_devise(document["prix_usd"], "USD", "FC", TAUX_CHANGE["USD_TO_FC"])
+                fournis.add("prix_fc")
+        documents.append((numero, document, fournis))
+    return documents, erreurs
+
+async def ecrire_lot_import(entite: str, documents: list, mode: str) -> dict:
+    """Écriture non ordonnée : insert_many pour les nouveautés, upserts en mise à jour"""
+    collection = db[entite]
+    cle = ENTITES_IMPORT[entite]["cle"]
+    if mode == "ignorer":
+        existants = set()
+        async for existant in collection.find({cle: {"$in": [d[cle] for d, _ in documents]}}, {cle: 1, "_id": 0}):
+            existants.add(existant[cle])
+        nouveaux = [d for d, _ in documents if d[cle] not in existants]
+        if nouveaux:
+            await collection.insert_many(nouveaux, ordered=False)
+        return {"inseres": len(nouveaux), "doublons": len(documents) - len(nouveaux)}
+
+    operations = []
+    for document, fournis in documents:
+        # Seules les colonnes présentes écrasent l'existant ; les valeurs par défaut ne servent qu'à la création
+        modification = {champ: valeur for champ, valeur in document.items() if champ in fournis}
+        modification["date_modification"] = datetime.now()
+        creation = {champ: valeur for champ, valeur in document.items() if champ not in fournis and champ != "date_modification"}
+        operations.append(UpdateOne({cle: document[cle]}, {"$set": modification, "$setOnInsert": creation}, upsert=True))
+    resultat = await collection.bulk_write(operations, ordered=False)
+    return {"inseres": resultat.upserted_count, "mis_a_jour": resultat.matched_count}
+
+@travail_de_fond("import")
+async def executer_import(import_id: str, chemin: str):
+    """Tâche de fond : valide par lots puis écrit, un lot en écriture pendant la validation du suivant"""
+    travail = await db.imports.find_one({"id": import_id})
+    entite, mode = travail["entite"], travail["mode"]
+    cle = ENTITES_IMPORT[entite]["cle"]
+    compteurs = {"lignes_lues": 0, "inseres": 0, "mis_a_jour": 0, "doublons": 0, "erreurs_total": 0}
+    erreurs = []
+    vues = set()
+    debut = time.perf_counter()
+    lecteur = None
+    ecriture = None
+    reprise = False
+
+    async def attendre_ecriture():
+        if ecriture is not None:
+            for compteur, valeur in (await ecriture).items():
+                compteurs[compteur] += valeur
+
+    try:
+        await db.imports.update_one({"id": import_id}, {"$set": {"statut": "en_cours", "date_debut": datetime.now()}})
+        lecteur = await asyncio.to_thread(LecteurImport, chemin, travail["format"])
+        while True:
+            lot = await asyncio.to_thread(lecteur.lire_lot, IMPORT_TAILLE_LOT)
+            if not lot:
+                break
+            documents, erreurs_lot = await asyncio.to_thread(valider_lot_import, entite, lot, datetime.now())
+            # Doublons à l'intérieur du fichier : la première occurrence l'emporte
+            uniques = []
+            for numero, document, fournis in documents:
+                if document[cle] in vues:
+                    compteurs["doublons"] += 1
+                else:
+                    vues.add(document[cle])
+                    uniques.append((document, fournis))
+            compteurs["lignes_lues"] += len(lot)
+            compteurs["erreurs_total"] += len(erreurs_lot)
+            erreurs.extend(erreurs_lot[:max(0, IMPORT_ERREURS_MAX - len(erreurs))])
+
+            await attendre_ecriture()
+            ecriture = asyncio.create_task(ecrire_lot_import(entite, uniques, mode)) if uniques else None
+            await db.imports.update_one({"id": import_id}, {"$set": {**compteurs, "erreurs": erreurs}})
+        await attendre_ecriture()
+        ecriture = None
+
+        duree = time.perf_counter() - debut
+        await db.imports.update_one(
+            {"id": import_id},
+            {"$set": {
+                **compteurs,
+                "erreurs": erreurs,
+                "statut": "termine",
+                "date_fin": datetime.now(),
+                "duree_secondes": round(duree, 3),
+                "lignes_par_seconde": round(compteurs["lignes_lues"] / duree, 1) if duree else None
+            }}
+        )
+        log_import.info(
+            "Import %s de %s terminé: %d lignes, %d insérées, %d mises à jour, %d doublons, %d erreurs en %.1fs",
+            import_id, entite, compteurs["lignes_lues"], compteurs["inseres"], compteurs["mis_a_jour"],
+            compteurs["doublons"], compteurs["erreurs_total"], duree
+        )
+    except Exception as e:
+        log_import.exception("Échec de l'import %s de %s", import_id, entite)
+        if ecriture is not None:
+            ecriture.cancel()
+        statut = statut_echec()
+        reprise = statut != "erreur"
+        await db.imports.update_one(
+            {"id": import_id},
+            {"$set": {**compteurs, "erreurs": erreurs, "statut": statut, "erreur": str(e), "date_fin": datetime.now()}}
+        )
+        raise
+    finally:
+        if lecteur is not None:
+            await asyncio.to_thread(lecteur.fermer)
+        # Le fichier reste disponible pour la tentative suivante
+        if not reprise:
+            try:
+                await asyncio.to_thread(os.remove, chemin)
+            except FileNotFoundError:
+                pass
+
+@app.post("/api/import/{entite}")
+async def importer(
+    entite: str,
+    request: Request,
+    format: str = Query(None, description="csv ou ndjson (déduit du Content-Type sinon)"),
+    doublons: str = Query("ignorer", description="ignorer ou mettre_a_jour"),
+    current_user: dict = Depends(manager_and_admin())
+):
+    """Importer des clients ou des produits en masse (CSV ou NDJSON dans le corps) - Manager et Admin
+
+    Le corps est recopié au fil de l'eau dans un fichier temporaire, puis traité
+    en tâche de fond. Les doublons sont repérés par email (clients) ou par nom
+    (produits), dans le fichier comme en base.
+    """
+    if entite not in ENTITES_IMPORT:
+        raise HTTPException(status_code=404, detail=f"Import non disponible pour '{entite}' (clients ou produits)")
+    if doublons not in MODES_IMPORT:
+        raise HTTPException(status_code=400, detail="Mode de doublons invalide (ignorer ou mettre_a_jour)")
+    format_fichier = format_import(format, request.headers.get("content-type", ""))
+
+    import_id = str(uuid.uuid4())
+    await asyncio.to_thread(os.makedirs, IMPORT_DIR, exist_ok=True)
+    chemin = os.path.join(IMPORT_DIR, f"{import_id}.{format_fichier}")
+    taille_max = IMPORT_TAILLE_MAX_MO * 1024 * 1024
+    octets = 0
+    fichier = await asyncio.to_thread(open, chemin, "wb")
+    try:
+        async for morceau in request.stream():
+            octets += len(morceau)
+            if octets > taille_max:
+                raise HTTPException(status_code=413, detail=f"Fichier trop volumineux (maximum {IMPORT_TAILLE_MAX_MO} Mo)")
+            await asyncio.to_thread(fichier.write, morceau)
+    except BaseException:
+        await asyncio.to_thread(fichier.close)
+        await asyncio.to_thread(os.remove, chemin)
+        raise
+    await asyncio.to_thread(fichier.close)
+    if octets == 0:
+        await asyncio.to_thread(os.remove, chemin)
+        raise HTTPException(status_code=400, detail="Fichier d'import vide")
+
+    travail = {
+        "id": import_id,
+        "entite": entite,
+        "format": format_fichier,
+        "mode": doublons,
+        "octets": octets,
+        "statut": "en_attente",
+        "lignes_lues": 0,
+        "erreurs": [],
+        "cree_par": current_user.get("email"),
+        "date_creation": datetime.now()
+    }
+    await db.imports.insert_one(travail)
+    await planifier_travail("import", {"import_id": import_id, "chemin": chemin})
+    travail.pop("_id", None)
+    return {"message": "Import lancé", "import": travail}
+
+@app.get("/api/imports")
+async def get_imports(limit: int = Query(50, ge=1, le=500), current_user: dict = Depends(manager_and_admin())):
+    """Lister les imports récents, sans le détail des erreurs - Manager et Admin"""
+    travaux = []
+    async for travail in db.imports.find({}, {"_id": 0, "erreurs": 0}).sort("date_creation", -1).limit(limit):
+        travaux.append(travail)
+    return {"imports": travaux}
+
+@app.get("/api/imports/{import_id}")
+async def get_import(import_id: str, current_user: dict = Depends(manager_and_admin())):
+    """Suivre un import : compteurs, débit et erreurs ligne par ligne - Manager et Admin"""
+    travail = await db.imports.find_one({"id": import_id}, {"_id": 0})
+    if not travail:
+        raise HTTPException(status_code=404, detail="Import non trouvé")
+    return travail
+
+# ===== SYNCHRONISATION INCRÉMENTALE =====
+
+# Au-delà, les pierres tombales sont purgées : un jeton plus ancien impose un rechargement complet
+SYNC_RETENTION_JOURS = int(os.environ.get('SYNC_RETENTION_JOURS', '30'))
+# Recouvrement entre deux synchronisations : écritures en vol et horloges des workers.
+# Un document peut donc revenir deux fois, le client le remplace simplement.
+SYNC_MARGE_SECONDES = float(os.environ.get('SYNC_MARGE_SECONDES', '5'))
+
+log_sync = logging.getLogger("facturapp.sync")
+
+ROLES_LECTURE_COMMUNE = ["admin", "manager", "comptable", "utilisateur", "support"]
+ROLES_OUTILS = ["technicien", "manager", "admin"]
+
+# Entité exposée -> collection, rôles autorisés (ceux des routes de liste) et modèle de réponse
+ENTITES_SYNCHRO = {
+    "clients": {"collection": "clients", "roles": ROLES_LECTURE_COMMUNE, "modele": Client},
+    "produits": {"collection": "produits", "roles": ROLES_LECTURE_COMMUNE, "modele": Produit,
+                 "preparer": lambda produit: produit_compatible(produit, TAUX_CHANGE["USD_TO_FC"])},
+    "taux_change": {"collection": "taux_change", "roles": ROLES_LECTURE_COMMUNE, "modele": TauxChange},
+    "factures": {"collection": "factures", "roles": ["admin", "manager", "comptable"], "modele": Facture},
+    "paiements": {"collection": "paiements", "roles": ["admin", "manager", "comptable"], "modele": None},
+    "devis": {"collection": "devis", "roles": ["admin", "manager"], "modele": Devis},
+    "opportunites": {"collection": "opportunites", "roles": ["admin", "manager"], "modele": None},
+    "commandes": {"collection": "commandes", "roles": ["admin", "manager"], "modele": Commande},
+    "users": {"collection": "users", "roles": ["admin", "support"], "modele": User},
+    "outils": {"collection": "outils", "roles": ROLES_OUTILS, "modele": Outil},
+    "affectations": {"collection": "affectations_outils", "roles": ROLES_OUTILS, "modele": AffectationOutil},
+    "entrepots": {"collection": "entrepots", "roles": ROLES_OUTILS, "modele": Entrepot},
+}
+
+async def epoque_synchronisation() -> str:
+    """Époque courante : elle change quand les données sont remplacées en bloc (restauration)"""
+    epoque = await db.synchronisation.find_one({"_id": "epoque"})
+    return epoque["valeur"] if epoque else "0"
+
+async def changer_epoque_synchronisation():
+    """Invalide tous les jetons : chaque client rechargera ses données au prochain appel"""
+    await db.synchronisation.update_one(
+        {"_id": "epoque"},
+        {"$set": {"valeur": secrets.token_hex(4), "date_modification": datetime.now()}},
+        upsert=True
+    )
+
+def encoder_jeton_synchro(epoque: str, instant: datetime) -> str:
+    return f"{epoque}.{int(instant.timestamp() * 1000)}"
+
+def decoder_jeton_synchro(jeton: str) -> tuple:
+    try:
+        epoque, millisecondes = jeton.split(".")
+        return epoque, datetime.fromtimestamp(int(millisecondes) / 1000)
+    except (ValueError, OverflowError, OSError):
+        raise HTTPException(status_code=400, detail="Jeton de synchronisation invalide")
+
+def document_synchronise(entite: str, document: dict) -> dict:
+    """Même forme que les routes de liste : id = _id en chaîne, modèle de réponse appliqué"""
+    configuration = ENTITES_SYNCHRO[entite]
+    document["id"] = str(document.pop("_id")) if "_id" in document else document.get("id")
+    document.pop("hashed_password", None)
+    if configuration.get("preparer"):
+        document = configuration["preparer"](document)
+    if configuration["modele"] is not None:
+        try:
+            return jsonable_encoder(configuration["modele"](**document))
+        except ValidationError as e:
+            log_sync.warning("Document %s/%s non conforme au modèle: %s", entite, document["id"], e)
+    return jsonable_encoder(document, custom_encoder={ObjectId: str})
+
+def entites_visibles(current_user: dict, demandees: Optional[str]) -> List[str]:
+    role = current_user.get("role", "utilisateur")
+    visibles = [nom for nom, configuration in ENTITES_SYNCHRO.items() if role in configuration["roles"]]
+    if demandees:
+        visibles = [nom for nom in visibles if nom in {e.strip() for e in demandees.split(",")}]
+    return visibles
+
+@app.get("/api/sync/jeton")
+async def get_jeton_synchronisation(current_user: dict = Depends(get_current_user)):
+    """Jeton à prendre avant un chargement complet, pour ne rien manquer de ce qui s'écrit pendant"""
+    return {"token": encoder_jeton_synchro(await epoque_synchronisation(), datetime.now())}
+
+@app.get("/api/sync")
+async def synchroniser(
+    since: Optional[str] = Query(None, description="Jeton renvoyé par la synchronisation précédente"),
+    entites: Optional[str] = Query(None, description="Entités séparées par des virgules (toutes celles du rôle par défaut)"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Documents créés, modifiés ou supprimés depuis le jeton, pour les entités visibles par le rôle
+
+    Sans jeton, avec un jeton d'une autre époque ou plus ancien que la rétention des
+    suppressions, la réponse est complète ("complet": true) et remplace l'état du client.
+    """
+    maintenant = datetime.now()
+    epoque = await epoque_synchronisation()
+    complet = True
+    depuis = None
+    if since:
+        epoque_jeton, instant = decoder_jeton_synchro(since)
+        if epoque_jeton == epoque and instant > maintenant - timedelta(days=SYNC_RETENTION_JOURS):
+            complet = False
+            depuis = instant - timedelta(seconds=SYNC_MARGE_SECONDES)
+
+    noms = entites_visibles(current_user, entites)
+
+    async def charger(entite: str) -> tuple:
+        configuration = ENTITES_SYNCHRO[entite]
+        filtre = {}
+        if entite == "affectations" and current_user.get("role") == "technicien":
+            # Comme GET /api/affectations : un technicien ne voit que ses propres affectations
+            filtre["technicien_id"] = current_user["id"]
+        if depuis is not None:
+            filtre["date_modification"] = {"$gte": depuis}
+        modifies = [
+            document_synchronise(entite, document)
+            async for document in db[configuration["collection"]].find(filtre)
+        ]
+        supprimes = []
+        if depuis is not None:
+            supprimes = [
+                suppression["id"]
+                async for suppression in db.suppressions.find(
+                    {"entite": configuration["collection"], "date_suppression": {"$gte": depuis}}, {"id": 1}
+                )
+            ]
+        return entite, {"modifies": modifies, "supprimes": supprimes}
+
+    resultats = dict(await asyncio.gather(*(charger(nom) for nom in noms)))
+    return {
+        "token": encoder_jeton_synchro(epoque, maintenant),
+        "complet": complet,
+        "entites": resultats
+    }
+
+# ===== CHARGEMENT INITIAL =====
+
+log_bootstrap = logging.getLogger("facturapp.bootstrap")
+
+@app.get("/api/bootstrap")
+async def get_bootstrap(
+    page_paiements: int = Query(1, ge=1),
+    limit_paiements: int = Query(10, ge=1, le=100),
+    client_id: str = Query(None, description="Filtre des opportunités"),
+    etape: str = Query(None, description="Filtre des opportunités"),
+    priorite: str = Query(None, description="Filtre des opportunités"),
+    commercial_id: str = Query(None, description="Filtre des opportunités"),
+    search: str = Query(None, description="Filtre des opportunités"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Données du tableau de bord en un seul appel, selon le rôle
+
+    Mêmes sections que les routes de liste, calculées en parallèle avec une seule
+    authentification. Le jeton de synchronisation est pris avant les lectures :
+    GET /api/sync?since=<token> rattrape ce qui s'est écrit pendant.
+    Une section en échec est omise et son erreur figure dans "erreurs".
+    """
+    debut = time.perf_counter()
+    role = current_user.get("role", "utilisateur")
+    token = encoder_jeton_synchro(await epoque_synchronisation(), datetime.now())
+
+    sections = {
+        "clients": (ROLES_LECTURE_COMMUNE, lambda: get_clients(current_user=current_user)),
+        "produits": (ROLES_LECTURE_COMMUNE, lambda: get_produits(current_user=current_user)),
+        # Statistiques et options de filtre : calculs partagés entre connexions simultanées
+        "stats": (ROLES_LECTURE_COMMUNE, lambda: get_stats(current_user=current_user)),
+        "taux_change": (ROLES_LECTURE_COMMUNE, get_taux_change),
+        "factures": (["admin", "manager", "comptable"], lambda: get_factures(current_user=current_user)),
+        "paiements": (["admin", "manager", "comptable"], lambda: get_paiements(
+            page=page_paiements, limit=limit_paiements, current_user=current_user
+        )),
+        "devis": (["admin", "manager"], lambda: get_devis(current_user=current_user)),
+        "opportunites": (["admin", "manager"], lambda: get_opportunites(
+            client_id=client_id, etape=etape, priorite=priorite, commercial_id=commercial_id,
+            search=search, current_user=current_user
+        )),
+        "opportunites_filtres": (["admin", "manager"], lambda: get_opportunites_filtres(current_user=current_user)),
+        "commandes": (["admin", "manager"], lambda: get_commandes(current_user=current_user)),
+        "vente_stats": (["admin", "manager"], lambda: get_vente_stats(current_user=current_user)),
+        "users": (["admin", "support"], lambda: get_users(current_user=current_user)),
+        "outils": (ROLES_OUTILS, lambda: get_outils(current_user=current_user)),
+        "affectations": (ROLES_OUTILS, lambda: get_affectations(current_user=current_user)),
+        "entrepots": (ROLES_OUTILS, lambda: get_entrepots(current_user=current_user)),
+        "parametres": (["support"], lambda: get_parametres(current_user=current_user)),
+    }
+
+    async def charger(nom: str, calcul) -> tuple:
+        try:
+            return nom, jsonable_encoder(await calcul()), None
+        except HTTPException as e:
+            return nom, None, e.detail
+        except Exception as e:
+            log_bootstrap.exception("Section %s du chargement initial en échec", nom)
+            return nom, None, str(e)
+
+    resultats = await asyncio.gather(*(
+        charger(nom, calcul) for nom, (roles, calcul) in sections.items() if role in roles
+    ))
+    log_bootstrap.debug("Chargement initial %s en %.0f ms", role, (time.perf_counter() - debut) * 1000)
+    return {
+        "token": token,
+        "role": role,
+        "sections": {nom: valeur for nom, valeur, erreur in resultats if erreur is None},
+        "erreurs": {nom: erreur for nom, valeur, erreur in resultats if erreur is not None}
+    }
+
 # ===== ROUTES GESTION D'OUTILS =====
 
 @app.get("/api/outils", response_model=List[Outil])
@@ -2983,7 +6861,7 @@ async def create_outil(outil: OutilCreate, current_user: dict = Depends(manager_
                 "date_mouvement": datetime.now(),
                 "fait_par": current_user["email"]
             }
-            await db.mouvements_outils.insert_one(mouvement)
+            await journal_mouvements.journaliser("mouvements_outils", mouvement)
         
         nouveau_outil["id"] = str(nouveau_outil["_id"]) if "_id" in nouveau_outil else nouveau_outil.get("id")
         if "_id" in nouveau_outil:
@@ -3041,6 +6919,20 @@ async def update_outil(outil_id: str, outil_data: OutilCreate, current_user: dic
             nouvelle_dispo = outil_existant.get("quantite_disponible", 0) + difference
             outil_update["quantite_disponible"] = max(0, nouvelle_dispo)
         
+        # Garder le nom d'entrepôt dénormalisé aligné si l'outil change d'entrepôt
+        if outil_update.get("entrepot_id") != outil_existant.get("entrepot_id"):
+            entrepot_nom = None
+            if outil_update.get("entrepot_id"):
+                entrepot = await db.entrepots.find_one({"id": outil_update["entrepot_id"]})
+                if not entrepot:
+                    try:
+                        entrepot = await db.entrepots.find_one({"_id": ObjectId(outil_update["entrepot_id"])})
+                    except:
+                        pass
+                if entrepot:
+                    entrepot_nom = entrepot["nom"]
+            outil_update["entrepot_nom"] = entrepot_nom
+        
         result = await db.outils.update_one(
             {"$or": [{"id": outil_id}, {"_id": outil_id}]},
             {"$set": outil_update}
@@ -3063,6 +6955,10 @@ async def update_outil(outil_id: str, outil_data: OutilCreate, current_user: dic
             except:
                 pass
         
+        # Répercuter le nouveau nom sur les affectations
+        if outil_update["nom"] != outil_existant.get("nom"):
+            await planifier_propagation_nom("outils", outil_maj)
+        
         outil_maj["id"] = str(outil_maj["_id"]) if "_id" in outil_maj else outil_maj.get("id")
         if "_id" in outil_maj:
             del outil_maj["_id"]
@@ -3172,7 +7068,7 @@ async def approvisionner_outil(outil_id: str, approvisionnement: Approvisionneme
             "date_mouvement": datetime.now(),
             "fait_par": current_user["email"]
         }
-        await db.mouvements_outils.insert_one(mouvement)
+        await journal_mouvements.journaliser("mouvements_outils", mouvement)
         
         return {
             "message": "Outil approvisionné avec succès",
@@ -3284,7 +7180,7 @@ async def affecter_outil(outil_id: str, affectation: AffectationOutilCreate, cur
             "date_mouvement": datetime.now(),
             "fait_par": current_user["email"]
         }
-        await db.mouvements_outils.insert_one(mouvement)
+        await journal_mouvements.journaliser("mouvements_outils", mouvement)
         
         nouvelle_affectation["id"] = str(nouvelle_affectation["_id"]) if "_id" in nouvelle_affectation else nouvelle_affectation.get("id")
         if "_id" in nouvelle_affectation:
@@ -3363,7 +7259,7 @@ async def retourner_outil(affectation_id: str, retour: RetourOutil, current_user
             "date_mouvement": datetime.now(),
             "fait_par": current_user["email"]
         }
-        await db.mouvements_outils.insert_one(mouvement)
+        await journal_mouvements.journaliser("mouvements_outils", mouvement)
         
         return {
             "message": "Outil retourné avec succès",
@@ -3380,14 +7276,7 @@ async def retourner_outil(affectation_id: str, retour: RetourOutil, current_user
 async def get_mouvements_outil(outil_id: str, current_user: dict = Depends(technicien_manager_admin())):
     """Récupérer l'historique des mouvements d'un outil"""
     try:
-        mouvements = []
-        cursor = db.mouvements_outils.find({"outil_id": outil_id}).sort("date_mouvement", -1)
-        async for mouvement in cursor:
-            mouvement["id"] = str(mouvement["_id"]) if "_id" in mouvement else mouvement.get("id")
-            if "_id" in mouvement:
-                del mouvement["_id"]
-            mouvements.append(mouvement)
-        
+        mouvements = await historique_mouvements("mouvements_outils", [outil_id])
         return {"mouvements": mouvements}
         
     except Exception as e:
@@ -3396,7 +7285,10 @@ async def get_mouvements_outil(outil_id: str, current_user: dict = Depends(techn
 # ===== ROUTES GESTION D'ENTREPÔTS =====
 
 @app.get("/api/entrepots", response_model=List[Entrepot])
-async def get_entrepots(current_user: dict = Depends(technicien_manager_admin())):
+async def get_entrepots(
+    current_user: dict = Depends(technicien_manager_admin()),
+    _conditionnel: None = Depends(get_conditionnel("entrepots"))
+):
     """Récupérer tous les entrepôts - Technicien, Manager et Admin"""
     try:
         entrepots = []
@@ -3462,21 +7354,24 @@ async def update_entrepot(entrepot_id: str, entrepot_data: EntrepotCreate, curre
         entrepot_update = entrepot_data.dict()
         entrepot_update["date_modification"] = datetime.now()
         
-        result = await db.entrepots.update_one(
+        # Document avant modification : le nom n'est propagé que s'il change
+        entrepot_avant = await db.entrepots.find_one_and_update(
             {"$or": [{"id": entrepot_id}, {"_id": entrepot_id}]},
-            {"$set": entrepot_update}
+            {"$set": entrepot_update},
+            return_document=ReturnDocument.BEFORE
         )
         
-        if result.matched_count == 0:
+        if not entrepot_avant:
             try:
-                result = await db.entrepots.update_one(
+                entrepot_avant = await db.entrepots.find_one_and_update(
                     {"_id": ObjectId(entrepot_id)},
-                    {"$set": entrepot_update}
+                    {"$set": entrepot_update},
+                    return_document=ReturnDocument.BEFORE
                 )
             except:
                 pass
                 
-        if result.matched_count == 0:
+        if not entrepot_avant:
             raise HTTPException(status_code=404, detail="Entrepôt non trouvé")
         
         # Récupérer l'entrepôt mis à jour
@@ -3487,6 +7382,10 @@ async def update_entrepot(entrepot_id: str, entrepot_data: EntrepotCreate, curre
             except:
                 pass
         
+        # Répercuter le nom sur les outils stockés dans l'entrepôt
+        if entrepot_update["nom"] != entrepot_avant.get("nom"):
+            await planifier_propagation_nom("entrepots", entrepot_maj)
+        
         entrepot_maj["id"] = str(entrepot_maj["_id"]) if "_id" in entrepot_maj else entrepot_maj.get("id")
         if "_id" in entrepot_maj:
             del entrepot_maj["_id"]
@@ -3531,6 +7430,7 @@ async def delete_entrepot(entrepot_id: str, current_user: dict = Depends(manager
 # ===== ROUTES RAPPORTS OUTILS =====
 
 @app.get("/api/outils/rapports/mouvements")
+@partage()
 async def get_rapport_mouvements_outils(
     date_debut: Optional[str] = None,
     date_fin: Optional[str] = None,
@@ -3542,6 +7442,7 @@ async def get_rapport_mouvements_outils(
     try:
         # Construire les filtres
         filters = {}
+        seaux = {}
         
         # Filtre par dates
         if date_debut and date_fin:
@@ -3552,6 +7453,8 @@ async def get_rapport_mouvements_outils(
                     "$gte": debut,
                     "$lte": fin.replace(hour=23, minute=59, second=59)
                 }
+                # Seuls les seaux des mois de la période sont lus
+                seaux["mois"] = {"$gte": debut.strftime("%Y-%m"), "$lte": fin.strftime("%Y-%m")}
             except ValueError:
                 raise HTTPException(status_code=400, detail="Format de date invalide. Utilisez YYYY-MM-DD")
         
@@ -3564,8 +7467,13 @@ async def get_rapport_mouvements_outils(
         if type_mouvement:
             filters["type_mouvement"] = type_mouvement
         
-        # Pipeline d'agrégation pour joindre avec les outils et entrepôts
-        pipeline = [
+        # Pipeline d'agrégation : mouvements des seaux retenus, joints aux outils et entrepôts
+        etapes_seaux = [
+            {"$match": seaux},
+            {"$unwind": "$mouvements"},
+            {"$replaceRoot": {"newRoot": "$mouvements"}},
+        ]
+        pipeline = etapes_seaux + [
             {"$match": filters},
             {
                 "$lookup": {
@@ -3590,10 +7498,10 @@ async def get_rapport_mouvements_outils(
         
         # Appliquer le filtre d'entrepôt si spécifié
         if entrepot_id:
-            pipeline.insert(2, {"$match": {"outil_info.entrepot_id": entrepot_id}})
+            pipeline.insert(len(etapes_seaux) + 2, {"$match": {"outil_info.entrepot_id": entrepot_id}})
         
         mouvements = []
-        cursor = db.mouvements_outils.aggregate(pipeline)
+        cursor = db_rapports.mouvements_outils_seaux.aggregate(pipeline)
         
         async for mouvement in cursor:
             mouvement_data = {
@@ -3635,6 +7543,7 @@ async def get_rapport_mouvements_outils(
         raise HTTPException(status_code=500, detail=f"Erreur lors de la génération du rapport: {str(e)}")
 
 @app.get("/api/outils/rapports/stock-par-entrepot")
+@partage()
 async def get_rapport_stock_entrepots(current_user: dict = Depends(technicien_manager_admin())):
     """Rapport des stocks par entrepôt"""
     try:
@@ -3670,7 +7579,7 @@ async def get_rapport_stock_entrepots(current_user: dict = Depends(technicien_ma
         ]
         
         stocks_par_entrepot = []
-        cursor = db.outils.aggregate(pipeline)
+        cursor = db_rapports.outils.aggregate(pipeline)
         
         async for stock in cursor:
             stock_data = {
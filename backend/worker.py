@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Worker des travaux de fond FacturApp, à lancer à part du serveur API
+
+Exécute les travaux enregistrés dans la collection jobs (emails, propagations
+de noms, sauvegardes, restaurations, imports, recalculs de prix). Plusieurs
+workers peuvent tourner en même temps, sur une ou plusieurs machines : chaque
+travail est réservé par un seul d'entre eux. BACKUP_DIR et IMPORT_DIR doivent
+être partagés avec le serveur API.
+
+Côté API, désactiver le worker intégré pour que le traitement par lots ne
+partage plus le processus qui sert les requêtes :
+    JOBS_WORKER_INTEGRE=false uvicorn server:app --host 0.0.0.0 --port 8001
+
+Exemples :
+    python worker.py
+    python worker.py --types sauvegarde restauration increment
+"""
+
+import argparse
+import asyncio
+import signal
+
+import server
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Worker des travaux de fond FacturApp")
+    parser.add_argument("--types", nargs="+", choices=sorted(server.GESTIONNAIRES_TRAVAUX), default=None,
+                        help="Types de travaux pris en charge (tous par défaut)")
+    parser.add_argument("--delai-arret", type=float, default=30,
+                        help="Secondes laissées aux travaux en cours à l'arrêt")
+    return parser.parse_args(argv)
+
+
+async def main():
+    args = parse_args()
+    await asyncio.gather(server.init_indexes(), server.charger_taux_change())
+    if server.TAUX_CHANGE_RAFRAICHISSEMENT_SECONDES > 0:
+        asyncio.create_task(server.boucle_rafraichissement_taux())
+
+    worker = server.WorkerTravaux(args.types)
+    boucle = asyncio.get_running_loop()
+    for signal_arret in (signal.SIGINT, signal.SIGTERM):
+        boucle.add_signal_handler(signal_arret, worker.arret.set)
+
+    await worker.boucle()
+    await worker.arreter(args.delai_arret)
+    server.log_travaux.info("Worker %s arrêté", worker.identifiant)
+    server.log_listener.stop()
+    server.client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
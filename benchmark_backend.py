@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Banc de charge reproductible pour le backend FastAPI
+
+L'application est exécutée dans le processus (httpx + ASGITransport) contre un
+mongod local ou, avec --memoire, contre mongomock-motor. Les données sont
+générées par generer_donnees.py dans une base dédiée, puis des clients
+asynchrones concurrents rejouent un mélange de scénarios réalistes. Le rapport JSON (débit, p50/p95/p99
+par endpoint) peut être comparé d'un commit à l'autre.
+
+Dépendances : httpx (et mongomock-motor pour --memoire)
+
+Exemples :
+    python benchmark_backend.py --factures 10000 --duree 30 --concurrence 20
+    python benchmark_backend.py --memoire --factures 2000 --sortie bench.json
+    python benchmark_backend.py --mix login=0,facture=5,listes=1 --reutiliser
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+import generer_donnees as generateur
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
+
+MIX_DEFAUT = "login=1,facture=2,dashboard=2,listes=4,outils=1"
+MOT_DE_PASSE_BENCH = "bench123"
+DOMAINE_BENCH = "bench.facturapp.cd"
+ROLES_BENCH = ["admin", "manager", "comptable", "technicien"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Banc de charge du backend FacturApp")
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db", default="facturapp_benchmark", help="Base dédiée au banc (vidée au départ)")
+    parser.add_argument("--memoire", action="store_true", help="Utiliser mongomock-motor au lieu de mongod")
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--produits", type=int, default=500)
+    parser.add_argument("--factures", type=int, default=10000)
+    parser.add_argument("--mouvements", type=int, default=20000)
+    parser.add_argument("--outils", type=int, default=200)
+    parser.add_argument("--utilisateurs", type=int, default=20, help="Comptes utilisateurs (au moins un par rôle)")
+    parser.add_argument("--concurrence", type=int, default=10, help="Nombre de clients simultanés")
+    parser.add_argument("--duree", type=float, default=30.0, help="Durée de la charge en secondes")
+    parser.add_argument("--mix", default=MIX_DEFAUT, help="Poids des scénarios, ex. " + MIX_DEFAUT)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--taille-lot", type=int, default=1000, help="Documents par insert_many")
+    parser.add_argument("--reutiliser", action="store_true", help="Ne pas régénérer les données existantes")
+    parser.add_argument("--sortie", help="Fichier JSON de résultats (stdout par défaut)")
+    return parser.parse_args()
+
+
+def charger_serveur(args):
+    """Importe server.py en le faisant pointer vers la base du banc"""
+    os.environ["MONGO_URL"] = args.mongo_url
+    os.environ["DB_NAME"] = args.db
+    # Les logs INFO de chaque facture fausseraient la mesure
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    sys.path.insert(0, BACKEND_DIR)
+    import server
+
+    if args.memoire:
+        from mongomock_motor import AsyncMongoMockClient
+        adapter_mongomock()
+        server.client = AsyncMongoMockClient()
+        server.db = server.BaseHorodatee(server.client[args.db])
+        server.db_rapports = server.client[args.db]
+    return server
+
+
+def adapter_mongomock():
+    """Accorde mongomock aux appels du serveur qu'il ne connaît pas
+
+    - UpdateOne et ReplaceOne de pymongo >= 4.9 transmettent sort (toujours None ici) au bulk_write ;
+    - create_collection refuse les options de stockage (compression des seaux).
+    """
+    from mongomock import collection as mongomock_collection
+    from mongomock import database as mongomock_database
+
+    for nom in ("add_update", "add_replace"):
+        ajout = getattr(mongomock_collection.BulkOperationBuilder, nom)
+        if not getattr(ajout, "adapte", False):
+            def ajout_sans_tri(self, *args, sort=None, _ajout=ajout, **kwargs):
+                return _ajout(self, *args, **kwargs)
+            ajout_sans_tri.adapte = True
+            setattr(mongomock_collection.BulkOperationBuilder, nom, ajout_sans_tri)
+
+    create_collection = mongomock_database.Database.create_collection
+    if not getattr(create_collection, "adapte", False):
+        def create_collection_sans_stockage(self, name, storageEngine=None, **kwargs):
+            return create_collection(self, name, **kwargs)
+        create_collection_sans_stockage.adapte = True
+        mongomock_database.Database.create_collection = create_collection_sans_stockage
+
+
+# ===== GÉNÉRATION DES DONNÉES =====
+
+def generer_lignes(rng, produits, taux):
+    lignes = []
+    for produit in rng.sample(produits, k=min(len(produits), rng.randint(1, 5))):
+        quantite = rng.randint(1, 3)
+        ht_usd = produit["prix_usd"] * quantite
+        lignes.append({
+            "produit_id": produit["id"],
+            "nom_produit": produit["nom"],
+            "quantite": quantite,
+            "prix_unitaire_usd": produit["prix_usd"],
+            "prix_unitaire_fc": produit["prix_usd"] * taux,
+            "devise": "USD",
+            "tva": 16.0,
+            "total_ht_usd": ht_usd,
+            "total_ht_fc": ht_usd * taux,
+            "total_ttc_usd": round(ht_usd * 1.16, 2),
+            "total_ttc_fc": round(ht_usd * 1.16 * taux, 2)
+        })
+    return lignes
+
+
+def totaux_facture(lignes):
+    ht_usd = sum(l["total_ht_usd"] for l in lignes)
+    ht_fc = sum(l["total_ht_fc"] for l in lignes)
+    ttc_usd = sum(l["total_ttc_usd"] for l in lignes)
+    ttc_fc = sum(l["total_ttc_fc"] for l in lignes)
+    return {
+        "total_ht_usd": ht_usd,
+        "total_ht_fc": ht_fc,
+        "total_tva_usd": ttc_usd - ht_usd,
+        "total_tva_fc": ttc_fc - ht_fc,
+        "total_ttc_usd": ttc_usd,
+        "total_ttc_fc": ttc_fc
+    }
+
+
+async def generer_donnees(server, args):
+    """Vide la base du banc et la remplit avec generer_donnees.py"""
+    db = server.db
+    await generateur.vider_collections(db)
+    volumes = {
+        "clients": args.clients,
+        "produits": args.produits,
+        "factures": args.factures,
+        "mouvements": args.mouvements,
+        "outils": args.outils,
+        "utilisateurs": args.utilisateurs,
+    }
+    volumes["entrepots"] = max(1, args.outils // 50)
+    volumes["affectations"] = args.outils * 5
+    for entite in ("devis", "commandes", "opportunites"):
+        volumes[entite] = max(1, args.factures // 5)
+    await generateur.generer(
+        db, volumes, seed=args.seed, taille_lot=args.taille_lot,
+        domaine=DOMAINE_BENCH, mot_de_passe=MOT_DE_PASSE_BENCH,
+        # Un seul hash bcrypt, calculé par le serveur lui-même
+        hashed_password=server.hash_password(MOT_DE_PASSE_BENCH)
+    )
+    # Stocks larges pour que factures et affectations ne s'épuisent pas pendant le banc
+    await db.produits.update_many({}, {"$set": {"gestion_stock": True, "stock_actuel": 10_000_000, "stock_maximum": 100_000_000}})
+    await db.outils.update_many({}, {"$set": {"quantite_stock": 1_000_000, "quantite_disponible": 1_000_000}})
+    await server.init_indexes()
+
+
+async def charger_references(server):
+    """Relit les identifiants nécessaires aux scénarios"""
+    db = server.db
+    return {
+        "utilisateurs": [u async for u in db.users.find({"email": {"$regex": "@" + re.escape(DOMAINE_BENCH) + "$"}, "is_active": True}, {"email": 1, "role": 1, "id": 1})],
+        "clients": [c async for c in db.clients.find({}, {"_id": 0, "id": 1, "nom": 1, "email": 1}).limit(5000)],
+        "produits": [p async for p in db.produits.find({}, {"_id": 0, "id": 1, "nom": 1, "prix_usd": 1}).limit(5000)],
+        "outils": [o async for o in db.outils.find({}, {"_id": 0, "id": 1}).limit(5000)]
+    }
+
+
+# ===== SCÉNARIOS =====
+
+class Banc:
+    def __init__(self, server, http, references):
+        self.server = server
+        self.http = http
+        self.refs = references
+        self.mesures = []
+        self.jetons = {
+            role: server.create_access_token(
+                data={"sub": next(u["email"] for u in references["utilisateurs"] if u["role"] == role)},
+                expires_delta=timedelta(hours=6)
+            )
+            for role in ROLES_BENCH
+        }
+        self.techniciens = [u["id"] for u in references["utilisateurs"] if u["role"] == "technicien"]
+
+    async def requete(self, label, methode, chemin, role=None, **kwargs):
+        headers = {"Authorization": f"Bearer {self.jetons[role]}"} if role else {}
+        debut = time.perf_counter()
+        try:
+            reponse = await self.http.request(methode, chemin, headers=headers, **kwargs)
+            statut = reponse.status_code
+        except Exception:
+            reponse, statut = None, 599
+        self.mesures.append((label, time.perf_counter() - debut, statut))
+        return reponse
+
+    async def login(self, rng):
+        utilisateur = rng.choice(self.refs["utilisateurs"])
+        await self.requete("POST /api/auth/login", "POST", "/api/auth/login",
+                           json={"email": utilisateur["email"], "password": MOT_DE_PASSE_BENCH})
+
+    async def facture(self, rng):
+        client = rng.choice(self.refs["clients"])
+        lignes = generer_lignes(rng, self.refs["produits"], 2800.0)
+        await self.requete("POST /api/factures", "POST", "/api/factures", role="comptable", json={
+            "client_id": client["id"],
+            "client_nom": client["nom"],
+            "client_email": client["email"],
+            "devise": "USD",
+            "lignes": lignes,
+            **totaux_facture(lignes)
+        })
+
+    async def dashboard(self, rng):
+        await self.requete("GET /api/stats", "GET", "/api/stats", role="manager")
+        await self.requete("GET /api/vente/stats", "GET", "/api/vente/stats", role="manager")
+        await self.requete("GET /api/taux-change", "GET", "/api/taux-change")
+
+    async def listes(self, rng):
+        liste = rng.choice(["clients", "produits", "factures", "paiements"])
+        if liste == "paiements":
+            page = rng.randint(1, 20)
+            await self.requete("GET /api/paiements", "GET", f"/api/paiements?page={page}&limit=50", role="comptable")
+        else:
+            await self.requete(f"GET /api/{liste}", "GET", f"/api/{liste}", role="manager")
+
+    async def outils(self, rng):
+        outil = rng.choice(self.refs["outils"])
+        reponse = await self.requete(
+            "POST /api/outils/{outil_id}/affecter", "POST", f"/api/outils/{outil['id']}/affecter", role="manager",
+            json={"outil_id": outil["id"], "technicien_id": rng.choice(self.techniciens), "quantite_affectee": 1}
+        )
+        if reponse is not None and reponse.status_code == 200:
+            affectation_id = reponse.json()["id"]
+            await self.requete(
+                "PUT /api/affectations/{affectation_id}/retourner", "PUT",
+                f"/api/affectations/{affectation_id}/retourner", role="manager",
+                json={"quantite_retournee": 1, "etat_retour": "bon"}
+            )
+
+
+def parse_mix(mix):
+    poids = {}
+    for element in mix.split(","):
+        nom, _, valeur = element.partition("=")
+        poids[nom.strip()] = float(valeur or 1)
+    return {nom: p for nom, p in poids.items() if p > 0}
+
+
+async def executer_charge(banc, mix, duree, concurrence, seed):
+    scenarios = list(mix)
+    poids = [mix[s] for s in scenarios]
+    fin = time.perf_counter() + duree
+
+    async def client_virtuel(numero):
+        rng = random.Random(seed * 1000 + numero)
+        while time.perf_counter() < fin:
+            await getattr(banc, rng.choices(scenarios, weights=poids)[0])(rng)
+
+    debut = time.perf_counter()
+    await asyncio.gather(*(client_virtuel(i) for i in range(concurrence)))
+    return time.perf_counter() - debut
+
+
+# ===== RAPPORT =====
+
+def percentile(valeurs_triees, p):
+    if not valeurs_triees:
+        return None
+    # Rang le plus proche
+    rang = max(0, min(len(valeurs_triees) - 1, math.ceil(p / 100 * len(valeurs_triees)) - 1))
+    return valeurs_triees[rang]
+
+
+def construire_rapport(mesures, duree_reelle, args):
+    par_endpoint = {}
+    for label, duree, statut in mesures:
+        par_endpoint.setdefault(label, []).append((duree, statut))
+
+    endpoints = {}
+    for label, valeurs in sorted(par_endpoint.items()):
+        durees = sorted(d for d, _ in valeurs)
+        erreurs = sum(1 for _, s in valeurs if s >= 400)
+        endpoints[label] = {
+            "requetes": len(valeurs),
+            "erreurs": erreurs,
+            "statuts": {str(s): sum(1 for _, x in valeurs if x == s) for s in sorted({s for _, s in valeurs})},
+            "debit_rps": round(len(valeurs) / duree_reelle, 2),
+            "moyenne_ms": round(sum(durees) / len(durees) * 1000, 2),
+            "p50_ms": round(percentile(durees, 50) * 1000, 2),
+            "p95_ms": round(percentile(durees, 95) * 1000, 2),
+            "p99_ms": round(percentile(durees, 99) * 1000, 2),
+            "max_ms": round(durees[-1] * 1000, 2)
+        }
+
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL,
+                                         cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except Exception:
+        commit = None
+
+    return {
+        "commit": commit,
+        "date": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "parametres": vars(args),
+        "duree_s": round(duree_reelle, 2),
+        "total_requetes": len(mesures),
+        "debit_total_rps": round(len(mesures) / duree_reelle, 2) if duree_reelle else 0,
+        "endpoints": endpoints
+    }
+
+
+async def main():
+    args = parse_args()
+    import httpx
+
+    server = charger_serveur(args)
+
+    if args.reutiliser and await server.db.factures.estimated_document_count() > 0:
+        print(f"♻️  Réutilisation des données de '{args.db}'", file=sys.stderr)
+    else:
+        debut = time.perf_counter()
+        print(f"🏗️  Génération des données dans '{args.db}'...", file=sys.stderr)
+        await generer_donnees(server, args)
+        print(f"✅ Données générées en {time.perf_counter() - debut:.1f}s", file=sys.stderr)
+
+    references = await charger_references(server)
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=120) as http:
+        banc = Banc(server, http, references)
+        print(f"🚀 Charge : {args.concurrence} clients pendant {args.duree}s ({args.mix})", file=sys.stderr)
+        duree_reelle = await executer_charge(banc, parse_mix(args.mix), args.duree, args.concurrence, args.seed)
+
+    rapport = construire_rapport(banc.mesures, duree_reelle, args)
+    sortie = json.dumps(rapport, indent=2, ensure_ascii=False)
+    if args.sortie:
+        with open(args.sortie, "w", encoding="utf-8") as f:
+            f.write(sortie)
+        print(f"📊 Résultats écrits dans {args.sortie}", file=sys.stderr)
+    else:
+        print(sortie)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
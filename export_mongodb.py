@@ -1,106 +1,269 @@
 #!/usr/bin/env python3
 """
 Script d'export des données MongoDB vers JSON pour migration vers Laravel + MySQL
+
+Les documents sont lus par lots et écrits au fil de l'eau : la mémoire reste
+bornée quelle que soit la taille des collections. Plusieurs collections sont
+exportées en même temps. Chaque fichier est d'abord écrit sous un nom
+temporaire puis renommé, un export interrompu ne laisse pas de fichier tronqué.
+
+Formats :
+    json    tableau JSON, un document par ligne (lu tel quel par import_data.php)
+    ndjson  un document JSON par ligne, sans tableau englobant
+
+Avec --since, seuls les documents créés ou modifiés après la date sont exportés
+(champs de date de chaque collection, voir CHAMPS_SINCE). Les suppressions ne
+sont pas visibles dans un export incrémental.
+
+Les seaux d'historique (mouvements_stock_seaux, mouvements_outils_seaux) sont
+exportés à plat, un document par mouvement, dans mouvements_stock et
+mouvements_outils comme l'attend l'import.
+
+Exemples :
+    python export_mongodb.py
+    python export_mongodb.py --format ndjson --sortie /tmp/export --paralleles 8
+    python export_mongodb.py --since 2025-07-01 --collections factures paiements
 """
 
+import argparse
+import asyncio
 import json
 import os
-from datetime import datetime
-from bson import ObjectId
-from motor.motor_asyncio import AsyncIOMotorClient
-import asyncio
+import sys
+import time
 import uuid
+from datetime import datetime
+
+# Collections métier exportées par défaut. Liste explicite : les collections techniques
+# (travaux, imports, sauvegardes, synchronisation, limitation des connexions, profils...)
+# et celles ajoutées plus tard ne partent pas dans un export sans y être inscrites
+COLLECTIONS_METIER = {
+    "users", "clients", "produits", "services", "entrepots", "app_config",
+    "taux_change", "taux_change_history",
+    "factures", "paiements", "devis", "commandes", "opportunites",
+    "factures_supprimees", "paiements_supprimes", "devis_supprimes",
+    "outils", "affectations_outils",
+    "mouvements_stock_seaux", "mouvements_outils_seaux",
+}
+
+# Seaux d'historique -> journal exporté à plat
+COLLECTIONS_SEAUX = {
+    "mouvements_stock_seaux": "mouvements_stock",
+    "mouvements_outils_seaux": "mouvements_outils",
+}
+
+# Champs consultés par --since ; date_creation et date_modification par défaut
+CHAMPS_SINCE = {
+    "factures": ["date_modification", "date_creation", "date_paiement"],
+    "paiements": ["date_modification", "date_creation", "date_paiement"],
+    "mouvements_stock": ["date_mouvement"],
+    "mouvements_outils": ["date_mouvement"],
+    "affectations_outils": ["date_modification", "date_affectation", "date_retour_effective"],
+    "devis": ["date_modification", "date_creation", "date_acceptation"],
+    "commandes": ["date_modification", "date_creation", "date_livraison_reelle"],
+    "users": ["date_modification", "date_creation", "derniere_connexion"],
+}
+
+# Dates stockées en chaîne à normaliser en ISO 8601
+CHAMPS_DATES = ['date_creation', 'date_echeance', 'date_paiement', 'date_expiration', 'date_acceptation']
+
+EXTENSIONS = {"json": ".json", "ndjson": ".ndjson"}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Export des données MongoDB FacturApp")
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db", default=os.environ.get("DB_NAME", "billing_app"), help="Base à exporter")
+    parser.add_argument("--sortie", default="/app/migration_data", help="Dossier des fichiers exportés")
+    parser.add_argument("--format", choices=sorted(EXTENSIONS), default="json")
+    parser.add_argument("--collections", nargs="+", default=None,
+                        help="Collections à exporter (collections métier par défaut, voir COLLECTIONS_METIER)")
+    parser.add_argument("--since", default=None,
+                        help="Exporter seulement ce qui a changé depuis cette date (AAAA-MM-JJ[THH:MM:SS])")
+    parser.add_argument("--paralleles", type=int, default=4, help="Collections exportées simultanément")
+    parser.add_argument("--taille-lot", type=int, default=1000, help="Documents lus et écrits par lot")
+    args = parser.parse_args(argv)
+    if args.since:
+        try:
+            args.since = datetime.fromisoformat(args.since)
+        except ValueError:
+            parser.error(f"date --since invalide: {args.since}")
+    return args
+
+
+def encoder_valeur(valeur):
+    """Types BSON sans équivalent JSON : dates en ISO 8601, le reste (ObjectId...) en chaîne"""
+    if isinstance(valeur, datetime):
+        return valeur.isoformat()
+    return str(valeur)
+
+
+def normaliser_document(doc):
+    """Identifiant et dates attendus par l'import Laravel"""
+    # Générer un UUID si pas d'ID existant
+    if not doc.get('id'):
+        doc['id'] = str(uuid.uuid4())
+
+    # Assurer la cohérence des dates
+    for field in CHAMPS_DATES:
+        valeur = doc.get(field)
+        if valeur and isinstance(valeur, str):
+            try:
+                doc[field] = datetime.fromisoformat(valeur.replace('Z', '+00:00')).isoformat()
+            except ValueError:
+                pass
+    return doc
+
+
+def requete_since(collection_name, since):
+    if since is None:
+        return {}
+    champs = CHAMPS_SINCE.get(collection_name, ["date_modification", "date_creation"])
+    return {"$or": [{champ: {"$gt": since}} for champ in champs]}
+
+
+def pipeline_seaux(collection_name, since):
+    """Mouvements des seaux, un document chacun ; --since écarte d'abord les seaux plus anciens"""
+    journal = COLLECTIONS_SEAUX[collection_name]
+    return [
+        {"$match": {"fin": {"$gt": since}} if since else {}},
+        {"$unwind": "$mouvements"},
+        {"$replaceRoot": {"newRoot": "$mouvements"}},
+        {"$match": requete_since(journal, since)},
+    ]
+
+
+class FichierExport:
+    """Écrit un tableau JSON ou du NDJSON de façon incrémentale, hors de la boucle asyncio"""
+
+    def __init__(self, chemin, format_export):
+        self.chemin = chemin
+        self.temporaire = chemin + ".partiel"
+        self.format = format_export
+        self.documents = 0
+        self.octets = 0
+        self.fichier = None
+
+    def ouvrir(self):
+        self.fichier = open(self.temporaire, 'w', encoding='utf-8')
+        if self.format == "json":
+            self._ecrire("[")
+
+    def _ecrire(self, texte):
+        self.fichier.write(texte)
+        self.octets += len(texte.encode('utf-8'))
+
+    def ecrire_lot(self, lot):
+        lignes = [json.dumps(normaliser_document(doc), ensure_ascii=False, default=encoder_valeur) for doc in lot]
+        if self.format == "json":
+            separateur = ",\n" if self.documents else "\n"
+            self._ecrire(separateur + ",\n".join(lignes))
+        else:
+            self._ecrire("\n".join(lignes) + "\n")
+        self.documents += len(lot)
+
+    def terminer(self):
+        if self.format == "json":
+            self._ecrire("\n]\n" if self.documents else "]\n")
+        self.fichier.close()
+        os.replace(self.temporaire, self.chemin)
+
+    def abandonner(self):
+        if self.fichier:
+            self.fichier.close()
+        if os.path.exists(self.temporaire):
+            os.remove(self.temporaire)
+
+
+async def export_collection(db, collection_name, output_file, format_export="json", since=None, taille_lot=1000):
+    """Export une collection MongoDB vers un fichier, lot par lot"""
+    debut = time.perf_counter()
+    fichier = FichierExport(output_file, format_export)
+    await asyncio.to_thread(fichier.ouvrir)
+    try:
+        if collection_name in COLLECTIONS_SEAUX:
+            curseur = db[collection_name].aggregate(pipeline_seaux(collection_name, since), batchSize=taille_lot)
+        else:
+            curseur = db[collection_name].find(requete_since(collection_name, since), batch_size=taille_lot)
+        lot = []
+        async for doc in curseur:
+            lot.append(doc)
+            if len(lot) >= taille_lot:
+                await asyncio.to_thread(fichier.ecrire_lot, lot)
+                lot = []
+        if lot:
+            await asyncio.to_thread(fichier.ecrire_lot, lot)
+        await asyncio.to_thread(fichier.terminer)
+    except BaseException:
+        await asyncio.to_thread(fichier.abandonner)
+        raise
+
+    duree = time.perf_counter() - debut
+    print(f"✅ Collection '{collection_name}' exportée -> {output_file} ({fichier.documents} documents, "
+          f"{fichier.octets / 1e6:.1f} Mo, {fichier.documents / duree:.0f} docs/s)")
+    return {"documents": fichier.documents, "octets": fichier.octets, "duree": duree}
+
+
+async def exporter(db, export_dir, collections=None, format_export="json", since=None, paralleles=4, taille_lot=1000):
+    """Exporte les collections en parallèle ; renvoie les statistiques par collection et les échecs"""
+    os.makedirs(export_dir, exist_ok=True)
+    if not collections:
+        collections = sorted(set(await db.list_collection_names()) & COLLECTIONS_METIER)
+    semaphore = asyncio.Semaphore(paralleles)
+
+    async def exporter_collection(collection_name):
+        nom_fichier = COLLECTIONS_SEAUX.get(collection_name, collection_name)
+        output_file = os.path.join(export_dir, f"{nom_fichier}{EXTENSIONS[format_export]}")
+        async with semaphore:
+            print(f"📦 Export de la collection '{collection_name}'...")
+            try:
+                return collection_name, await export_collection(
+                    db, collection_name, output_file, format_export, since, taille_lot
+                )
+            except Exception as e:
+                print(f"❌ Erreur lors de l'export de '{collection_name}': {e}")
+                return collection_name, None
+
+    resultats = dict(await asyncio.gather(*(exporter_collection(nom) for nom in collections)))
+    statistiques = {nom: stats for nom, stats in resultats.items() if stats is not None}
+    echecs = sorted(nom for nom, stats in resultats.items() if stats is None)
+    return statistiques, echecs
 
-# Configuration MongoDB
-MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(MONGO_URL)
-db = client.billing_app
-
-# Fonction pour convertir ObjectId en string
-def convert_objectid(doc):
-    if doc is None:
-        return None
-    if isinstance(doc, ObjectId):
-        return str(doc)
-    elif isinstance(doc, dict):
-        return {k: convert_objectid(v) for k, v in doc.items()}
-    elif isinstance(doc, list):
-        return [convert_objectid(item) for item in doc]
-    elif isinstance(doc, datetime):
-        return doc.isoformat()
-    else:
-        return doc
-
-async def export_collection(collection_name, output_file):
-    """Export une collection MongoDB vers un fichier JSON"""
-    print(f"📦 Export de la collection '{collection_name}'...")
-    
-    collection = db[collection_name]
-    documents = []
-    
-    async for doc in collection.find():
-        # Convertir ObjectId en string et générer UUID si nécessaire
-        doc = convert_objectid(doc)
-        
-        # Générer un UUID si pas d'ID existant
-        if not doc.get('id'):
-            doc['id'] = str(uuid.uuid4())
-        
-        # Assurer la cohérence des dates
-        for field in ['date_creation', 'date_echeance', 'date_paiement', 'date_expiration', 'date_acceptation']:
-            if field in doc and doc[field]:
-                if isinstance(doc[field], str):
-                    try:
-                        doc[field] = datetime.fromisoformat(doc[field].replace('Z', '+00:00')).isoformat()
-                    except:
-                        pass
-        
-        documents.append(doc)
-    
-    # Sauvegarder vers fichier JSON
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(documents, f, ensure_ascii=False, indent=2)
-    
-    print(f"✅ Collection '{collection_name}' exportée -> {output_file} ({len(documents)} documents)")
-    return len(documents)
 
 async def main():
     """Fonction principale d'export"""
+    args = parse_args()
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(args.mongo_url)
+    db = client[args.db]
+
     print("🚀 DÉBUT DE L'EXPORT DES DONNÉES MONGODB")
+    if args.since:
+        print(f"🕒 Export incrémental depuis {args.since.isoformat()}")
     print("=" * 50)
-    
-    # Créer le dossier d'export
-    export_dir = '/app/migration_data'
-    os.makedirs(export_dir, exist_ok=True)
-    
-    # Collections à exporter
-    collections = [
-        'users',
-        'clients', 
-        'produits',
-        'factures',
-        'paiements',
-        'devis',
-        'opportunites',
-        'commandes',
-        'mouvements_stock',
-        'taux_change'
-    ]
-    
-    total_documents = 0
-    
-    for collection_name in collections:
-        output_file = f"{export_dir}/{collection_name}.json"
-        try:
-            count = await export_collection(collection_name, output_file)
-            total_documents += count
-        except Exception as e:
-            print(f"❌ Erreur lors de l'export de '{collection_name}': {e}")
-    
+
+    # Date de début : point de départ du prochain export incrémental
+    date_export = datetime.now()
+    debut = time.perf_counter()
+    statistiques, echecs = await exporter(
+        db, args.sortie, args.collections, args.format, args.since, args.paralleles, args.taille_lot
+    )
+    duree = time.perf_counter() - debut
+    client.close()
+
+    total_documents = sum(s["documents"] for s in statistiques.values())
+    total_octets = sum(s["octets"] for s in statistiques.values())
     print("\n" + "=" * 50)
-    print(f"🎉 EXPORT TERMINÉ - {total_documents} documents exportés")
-    print(f"📁 Fichiers sauvegardés dans: {export_dir}")
+    print(f"🎉 EXPORT TERMINÉ - {total_documents} documents exportés en {duree:.1f}s "
+          f"({total_documents / duree:.0f} docs/s, {total_octets / 1e6 / duree:.1f} Mo/s)")
+    print(f"📁 Fichiers sauvegardés dans: {args.sortie}")
+    print(f"🔁 Prochain export incrémental: --since {date_export.isoformat(timespec='seconds')}")
+    if echecs:
+        print(f"❌ Collections en échec: {', '.join(echecs)}")
     print("=" * 50)
+    if echecs:
+        sys.exit(1)
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
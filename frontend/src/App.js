@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import './App.css';
 import { AuthProvider, useAuth } from './contexts/AuthContext';
 import { ThemeProvider, useTheme } from './contexts/ThemeContext';
@@ -288,6 +288,9 @@ const AppContent = () => {
     return emojis[role] || '👤';
   };
 
+  // Jeton de synchronisation incrémentale (voir synchroniser)
+  const jetonSyncRef = useRef(null);
+
   const loadData = async () => {
     if (!user || !accessToken) {
       console.log('❌ Pas d\'utilisateur ou de token, abandon du chargement');
@@ -303,142 +306,60 @@ const AppContent = () => {
     setLoading(true);
     try {
       console.log('🔄 Début chargement des données avec token pour rôle:', user.role);
-      
-      // Données accessibles à tous les utilisateurs authentifiés
-      console.log('📊 Chargement des données de base...');
-      const [clientsRes, produitsRes, statsRes, tauxRes] = await Promise.all([
-        apiCall('GET', '/api/clients'),
-        apiCall('GET', '/api/produits'),
-        apiCall('GET', '/api/stats'),
-        apiCall('GET', '/api/taux-change')
-      ]);
-
-      setClients(clientsRes.data || []);
-      setProduits(produitsRes.data || []);
-      setStats(statsRes.data || {});
+
+      // Un seul appel : le serveur calcule en parallèle les sections autorisées pour le rôle.
+      // Le jeton est pris avant les lectures : ce qui s'écrit pendant sera rattrapé par la prochaine synchronisation
+      const params = new URLSearchParams({
+        page_paiements: paginationPaiements.page,
+        limit_paiements: paginationPaiements.limit
+      });
+      Object.entries(filtresOpportunites).forEach(([key, value]) => {
+        if (value) {
+          params.append(key, value);
+        }
+      });
+      jetonSyncRef.current = null;
+      const bootstrapRes = await apiCall('GET', `/api/bootstrap?${params.toString()}`);
+      const { token, sections, erreurs } = bootstrapRes.data;
+      if (Object.keys(erreurs || {}).length > 0) {
+        console.warn('⚠️ Sections non chargées:', erreurs);
+      }
+
+      setClients(sections.clients || []);
+      setProduits(sections.produits || []);
+      setStats(sections.stats || {});
       // Adapter la structure de données du backend (taux) vers le format attendu par le frontend (taux_change_actuel)
-      const newTauxData = tauxRes.data ? { taux_change_actuel: tauxRes.data.taux } : { taux_change_actuel: 2800 };
+      const newTauxData = sections.taux_change ? { taux_change_actuel: sections.taux_change.taux } : { taux_change_actuel: 2800 };
       console.log('💱 Structure adaptée pour le frontend:', newTauxData);
       setTauxChange(newTauxData);
 
-      // Données restreintes seulement pour certains rôles
-      if (user.role === 'admin' || user.role === 'manager' || user.role === 'comptable') {
-        console.log('💼 Chargement des données restreintes pour rôle:', user.role);
-        try {
-          const [facturesRes, paiementsRes] = await Promise.all([
-            apiCall('GET', '/api/factures'),
-            apiCall('GET', `/api/paiements?page=${paginationPaiements.page}&limit=${paginationPaiements.limit}`)
-          ]);
-          
-          setFactures(facturesRes.data || []);
-          if (paiementsRes.data) {
-            setPaiements(paiementsRes.data.paiements || []);
-            setPaginationPaiements(paiementsRes.data.pagination || paginationPaiements);
-          }
-          console.log('💰 Données financières chargées - Factures:', facturesRes.data.length, 'Paiements:', paiementsRes.data?.paiements?.length || 0);
-        } catch (restrictedError) {
-          console.warn('⚠️ Erreur chargement données restreintes:', restrictedError.response?.status);
-          setFactures([]);
-          setPaiements([]);
-        }
-      } else {
-        // Utilisateur simple - pas d'accès aux factures et paiements
-        setFactures([]);
-        setPaiements([]);
-        console.log('👤 Utilisateur simple - PAS de requête aux factures/paiements');
+      // Sections restreintes : absentes de la réponse pour les rôles qui n'y ont pas accès
+      setFactures(sections.factures || []);
+      setPaiements(sections.paiements?.paiements || []);
+      if (sections.paiements?.pagination) {
+        setPaginationPaiements(sections.paiements.pagination);
       }
 
-      // Données de vente pour Admin et Manager uniquement
-      if (user.role === 'admin' || user.role === 'manager') {
-        console.log('💼 Chargement des données de vente pour rôle:', user.role);
-        try {
-          // Construire les paramètres de filtre pour les opportunités
-          const filtresParams = new URLSearchParams();
-          Object.entries(filtresOpportunites).forEach(([key, value]) => {
-            if (value) {
-              filtresParams.append(key, value);
-            }
-          });
-          
-          const [devisRes, opportunitesRes, commandesRes, venteStatsRes, filtresRes] = await Promise.all([
-            apiCall('GET', '/api/devis'),
-            apiCall('GET', `/api/opportunites?${filtresParams.toString()}`),
-            apiCall('GET', '/api/commandes'),
-            apiCall('GET', '/api/vente/stats'),
-            apiCall('GET', '/api/opportunites/filtres')
-          ]);
-          
-          setDevis(devisRes.data || []);
-          setOpportunites(opportunitesRes.data || []);
-          setCommandes(commandesRes.data || []);
-          setVenteStats(venteStatsRes.data || {});
-          setOptionsFiltres(filtresRes.data || {});
-          console.log('💼 Données de vente chargées - Devis:', devisRes.data.length, 'Opportunités:', opportunitesRes.data.length, 'Commandes:', commandesRes.data.length);
-        } catch (salesError) {
-          console.warn('⚠️ Erreur chargement données de vente:', salesError.response?.status);
-          setDevis([]);
-          setOpportunites([]);
-          setCommandes([]);
-          setVenteStats({});
-        }
-      } else {
-        // Pas d'accès aux données de vente
-        setDevis([]);
-        setOpportunites([]);
-        setCommandes([]);
-        setVenteStats({});
+      setDevis(sections.devis || []);
+      setOpportunites(sections.opportunites || []);
+      setCommandes(sections.commandes || []);
+      setVenteStats(sections.vente_stats || {});
+      if (sections.opportunites_filtres) {
+        setOptionsFiltres(sections.opportunites_filtres);
       }
 
-      // Données utilisateurs pour Admin et Support uniquement
-      if (user.role === 'admin' || user.role === 'support') {
-        console.log('👤 Chargement des données utilisateurs pour Admin/Support');
-        try {
-          const usersRes = await apiCall('GET', '/api/users');
-          setUsers(usersRes.data || []);
-          console.log('👤 Utilisateurs chargés:', usersRes.data?.length || 0);
-        } catch (error) {
-          console.error('❌ Erreur chargement utilisateurs:', error.response?.status, error.response?.data || error.message);
-        }
+      if (sections.users) {
+        setUsers(sections.users);
       }
 
-      // Données d'outils pour Technicien, Manager et Admin
-      if (user.role === 'technicien' || user.role === 'manager' || user.role === 'admin') {
-        console.log('🔧 Chargement des données d\'outils pour rôle:', user.role);
-        try {
-          const [outilsRes, affectationsRes, entrepotsRes] = await Promise.all([
-            apiCall('GET', '/api/outils'),
-            apiCall('GET', '/api/affectations'),
-            apiCall('GET', '/api/entrepots')
-          ]);
-          
-          setOutils(outilsRes.data || []);
-          setAffectations(affectationsRes.data || []);
-          setEntrepots(entrepotsRes.data || []);
-          console.log('🔧 Données d\'outils chargées - Outils:', outilsRes.data?.length || 0, 'Affectations:', affectationsRes.data?.length || 0, 'Entrepôts:', entrepotsRes.data?.length || 0);
-        } catch (toolsError) {
-          console.warn('⚠️ Erreur chargement données d\'outils:', toolsError.response?.status);
-          setOutils([]);
-          setAffectations([]);
-          setEntrepots([]);
-        }
-      } else {
-        // Pas d'accès aux outils
-        setOutils([]);
-        setAffectations([]);
-        setEntrepots([]);
-      }
+      setOutils(sections.outils || []);
+      setAffectations(sections.affectations || []);
+      setEntrepots(sections.entrepots || []);
 
-      // Données de configuration pour Support uniquement
-      if (user.role === 'support') {
-        console.log('⚙️ Chargement des paramètres système pour Support');
-        try {
-          const configRes = await apiCall('GET', '/api/parametres');
-          setAppConfig(prev => ({ ...prev, ...configRes.data }));
-          console.log('⚙️ Configuration chargée:', configRes.data);
-        } catch (error) {
-          console.error('❌ Erreur chargement configuration:', error.response?.status, error.response?.data || error.message);
-        }
+      if (sections.parametres) {
+        setAppConfig(prev => ({ ...prev, ...sections.parametres }));
       }
+      console.log('📊 Sections chargées:', Object.keys(sections).join(', '));
 
       // Initialisation par défaut pour les autres rôles
       if (user.role !== 'admin' && user.role !== 'support') {
@@ -451,6 +372,7 @@ const AppContent = () => {
         });
       }
       
+      jetonSyncRef.current = token;
       console.log('✅ Toutes les données chargées avec succès pour rôle:', user.role);
     } catch (error) {
       console.error('❌ Erreur chargement données de base:', error.response?.status, error.response?.data || error.message);
@@ -467,6 +389,121 @@ const AppContent = () => {
     }
   };
 
+  // Fusionner une liste avec un delta de /api/sync : modifiés remplacés, nouveaux en tête, supprimés retirés
+  const fusionnerDelta = (liste, { modifies, supprimes }) => {
+    const modifiesParId = new Map(modifies.map(doc => [doc.id, doc]));
+    const retires = new Set(supprimes);
+    const existants = new Set(liste.map(doc => doc.id));
+    const nouveaux = modifies.filter(doc => !existants.has(doc.id) && !retires.has(doc.id));
+    return [
+      ...nouveaux,
+      ...liste.filter(doc => !retires.has(doc.id)).map(doc => modifiesParId.get(doc.id) || doc)
+    ];
+  };
+
+  // Serveur occupé (429/503) : un seul nouvel essai après le délai Retry-After annoncé
+  const appelAvecReprise = async (method, url) => {
+    try {
+      return await apiCall(method, url);
+    } catch (error) {
+      const statut = error.response?.status;
+      if (statut !== 429 && statut !== 503) {
+        throw error;
+      }
+      const attente = Math.min(Number(error.response.headers?.['retry-after']) || 1, 10);
+      await new Promise(resolve => setTimeout(resolve, attente * 1000));
+      return apiCall(method, url);
+    }
+  };
+
+  // Après une écriture : ne récupérer que ce qui a changé depuis le dernier jeton au lieu de tout recharger
+  const synchroniser = async () => {
+    if (!user || !accessToken) return;
+    if (!jetonSyncRef.current) {
+      return loadData();
+    }
+
+    try {
+      const syncRes = await apiCall('GET', `/api/sync?since=${encodeURIComponent(jetonSyncRef.current)}`);
+      const { token, complet, entites } = syncRes.data;
+      if (complet) {
+        // Données restaurées entre-temps ou jeton trop ancien : rechargement complet
+        console.log('🔄 Synchronisation complète demandée par le serveur');
+        jetonSyncRef.current = null;
+        return loadData();
+      }
+      jetonSyncRef.current = token;
+
+      const aChange = (nom) => entites[nom] && (entites[nom].modifies.length > 0 || entites[nom].supprimes.length > 0);
+      const filtresActifs = Object.values(filtresOpportunites).some(Boolean);
+      const listes = {
+        clients: setClients,
+        produits: setProduits,
+        factures: setFactures,
+        devis: setDevis,
+        commandes: setCommandes,
+        users: setUsers,
+        outils: setOutils,
+        affectations: setAffectations,
+        entrepots: setEntrepots
+      };
+      if (!filtresActifs) {
+        listes.opportunites = setOpportunites;
+      }
+      Object.entries(listes).forEach(([nom, setListe]) => {
+        if (aChange(nom)) {
+          setListe(liste => fusionnerDelta(liste, entites[nom]));
+        }
+      });
+
+      if (aChange('taux_change')) {
+        const tauxActif = entites.taux_change.modifies
+          .filter(taux => taux.actif)
+          .sort((a, b) => (b.date_creation || '').localeCompare(a.date_creation || ''))[0];
+        if (tauxActif) {
+          setTauxChange({ taux_change_actuel: tauxActif.taux });
+        }
+      }
+      console.log('🔄 Synchronisation:', Object.keys(entites).filter(aChange).join(', ') || 'aucun changement');
+
+      // Statistiques, paiements paginés et opportunités filtrées : recalculés côté serveur
+      const rechargements = [
+        appelAvecReprise('GET', '/api/stats').then(res => setStats(res.data || {}))
+      ];
+      if (aChange('paiements')) {
+        rechargements.push(
+          apiCall('GET', `/api/paiements?page=${paginationPaiements.page}&limit=${paginationPaiements.limit}`).then(res => {
+            setPaiements(res.data?.paiements || []);
+            setPaginationPaiements(res.data?.pagination || paginationPaiements);
+          })
+        );
+      }
+      if (canManageSales()) {
+        rechargements.push(appelAvecReprise('GET', '/api/vente/stats').then(res => setVenteStats(res.data || {})));
+        if (filtresActifs && aChange('opportunites')) {
+          const filtresParams = new URLSearchParams();
+          Object.entries(filtresOpportunites).forEach(([key, value]) => {
+            if (value) {
+              filtresParams.append(key, value);
+            }
+          });
+          rechargements.push(
+            apiCall('GET', `/api/opportunites?${filtresParams.toString()}`).then(res => setOpportunites(res.data || []))
+          );
+        }
+      }
+      // Les listes sont déjà à jour : un rechargement refusé ne relance pas tout le chargement
+      const echecs = (await Promise.allSettled(rechargements)).filter(resultat => resultat.status === 'rejected');
+      if (echecs.length > 0) {
+        console.warn('⚠️ Rechargements différés à la prochaine synchronisation:', echecs.map(e => e.reason?.response?.status));
+      }
+    } catch (error) {
+      console.warn('⚠️ Synchronisation impossible, rechargement complet:', error.response?.status);
+      jetonSyncRef.current = null;
+      loadData();
+    }
+  };
+
   useEffect(() => {
     if (user && accessToken) {
       console.log('👤 Utilisateur connecté, chargement des données...');
@@ -501,7 +538,7 @@ const AppContent = () => {
         await apiCall('POST', '/api/clients', clientForm);
       }
 
-      loadData();
+      synchroniser();
       setShowClientModal(false);
       setClientForm({ nom: '', email: '', telephone: '', adresse: '' });
       setEditingClient(null);
@@ -524,7 +561,7 @@ const AppContent = () => {
       async () => {
         try {
           await apiCall('DELETE', `/api/clients/${clientId}`);
-          loadData();
+          synchroniser();
           showNotification('Client supprimé avec succès');
         } catch (error) {
           console.error('Erreur suppression client:', error);
@@ -551,7 +588,7 @@ const AppContent = () => {
         await apiCall('POST', '/api/produits', produitData);
       }
 
-      loadData();
+      synchroniser();
       setShowProduitModal(false);
       setProduitForm({ nom: '', description: '', prix_usd: '', prix_fc: '', stock_actuel: '', stock_minimum: '', gestion_stock: true });
       setEditingProduit(null);
@@ -574,7 +611,7 @@ const AppContent = () => {
       async () => {
         try {
           await apiCall('DELETE', `/api/produits/${produitId}`);
-          loadData();
+          synchroniser();
           showNotification('Produit supprimé avec succès');
         } catch (error) {
           console.error('Erreur suppression produit:', error);
@@ -728,7 +765,7 @@ const AppContent = () => {
       const response = await apiCall('POST', '/api/factures', factureData);
       console.log('✅ Facture sauvegardée:', response.data);
 
-      loadData();
+      synchroniser();
       setShowFactureModal(false);
       setFactureForm({ client_id: '', items: [], devise: 'USD', notes: '', numero: '' });
       showNotification('Facture créée avec succès');
@@ -771,7 +808,7 @@ Transaction ID: ${data.transaction_id}
           });
 
           showNotification(`💳 Paiement simulé avec succès ! Facture ${facture.numero} marquée comme payée`, 'success');
-          loadData();
+          synchroniser();
         }
       );
     } catch (error) {
@@ -792,7 +829,7 @@ Montant: ${formatMontant(facture.total_ttc_usd, 'USD')} / ${formatMontant(factur
           await apiCall('POST', `/api/factures/${facture.id}/payer`, {});
 
           showNotification(`✅ Facture ${facture.numero} marquée comme payée !`, 'success');
-          loadData();
+          synchroniser();
         } catch (error) {
           console.error('Erreur marquage facture:', error);
           showNotification(`❌ Erreur lors du marquage de la facture: ${error.response?.data?.detail || error.message}`, 'error');
@@ -815,10 +852,10 @@ Montant: ${formatMontant(facture.total_ttc_usd, 'USD')} / ${formatMontant(factur
           
           showNotification('✅ Paiement validé avec succès !', 'success');
           
-          // Recharger les données avec un petit délai pour s'assurer que la DB est mise à jour
-          console.log('🔄 Rechargement des données...');
+          // Synchroniser avec un petit délai pour s'assurer que la DB est mise à jour
+          console.log('🔄 Synchronisation des données...');
           setTimeout(async () => {
-            await loadData();
+            await synchroniser();
             console.log('✅ Données rechargées');
           }, 500);
           
@@ -856,7 +893,7 @@ Montant: ${formatMontant(facture.total_ttc_usd, 'USD')} / ${formatMontant(factur
       setShowAnnulerFactureModal(false);
       setFactureToCancel(null);
       setMotifAnnulation('');
-      loadData();
+      synchroniser();
     } catch (error) {
       console.error('Erreur annulation facture:', error);
       showNotification(`❌ Erreur lors de l'annulation: ${error.response?.data?.detail || error.message}`, 'error');
@@ -876,7 +913,7 @@ Montant: ${formatMontant(facture.total_ttc_usd, 'USD')} / ${formatMontant(factur
       setShowSupprimerFactureModal(false);
       setFactureToDelete(null);
       setMotifSuppression('');
-      loadData();
+      synchroniser();
     } catch (error) {
       console.error('Erreur suppression facture:', error);
       showNotification(`❌ Erreur lors de la suppression: ${error.response?.data?.detail || error.message}`, 'error');
@@ -908,7 +945,7 @@ Montant: ${formatMontant(facture.total_ttc_usd, 'USD')} / ${formatMontant(factur
         showNotification(`⚠️ ${response.data.warning}`, 'warning');
       }
 
-      loadData();
+      synchroniser();
       setShowStockModal(false);
       setStockForm({ produit_id: '', operation: 'ajouter', quantite: '', motif: '' });
       showNotification(`✅ ${response.data.message}`, 'success');
@@ -985,7 +1022,7 @@ Montant: ${formatMontant(facture.total_ttc_usd, 'USD')} / ${formatMontant(factur
       setShowSupprimerPaiementModal(false);
       setPaiementToDelete(null);
       setMotifSuppressionPaiement('');
-      loadData();
+      synchroniser();
     } catch (error) {
       console.error('Erreur suppression paiement:', error);
       showNotification(`❌ Erreur lors de la suppression: ${error.response?.data?.detail || error.message}`, 'error');
@@ -1005,7 +1042,7 @@ Montant: ${formatMontant(facture.total_ttc_usd, 'USD')} / ${formatMontant(factur
       setShowSupprimerDevisModal(false);
       setDevisToDelete(null);
       setMotifSuppressionDevis('');
-      loadData();
+      synchroniser();
     } catch (error) {
       console.error('Erreur suppression devis:', error);
       showNotification(`❌ Erreur lors de la suppression: ${error.response?.data?.detail || error.message}`, 'error');
@@ -1028,8 +1065,8 @@ Montant: ${formatMontant(facture.total_ttc_usd, 'USD')} / ${formatMontant(factur
         'success'
       );
       
-      // Recharger les données
-      loadData();
+      // Mettre à jour les données
+      synchroniser();
     } catch (error) {
       console.error('Erreur conversion devis:', error);
       showNotification('Erreur lors de la conversion du devis en facture', 'error');
@@ -1093,7 +1130,7 @@ Montant: ${formatMontant(facture.total_ttc_usd, 'USD')} / ${formatMontant(factur
       showNotification('Devis créé avec succès', 'success');
       setShowDevisModal(false);
       setDevisForm({ client_id: '', items: [], devise: 'USD', notes: '', validite_jours: 30 });
-      loadData();
+      synchroniser();
     } catch (error) {
       console.error('Erreur création devis:', error);
       showNotification('Erreur lors de la création du devis', 'error');
@@ -1128,7 +1165,7 @@ Montant: ${formatMontant(facture.total_ttc_usd, 'USD')} / ${formatMontant(factur
         titre: '', description: '', client_id: '', valeur_estimee_usd: '', devise: 'USD', 
         probabilite: 50, etape: 'prospect', priorite: 'moyenne', notes: '' 
       });
-      loadData();
+      synchroniser();
     } catch (error) {
       console.error('Erreur liaison opportunité:', error);
       showNotification(`❌ Erreur lors de la liaison: ${error.response?.data?.detail || error.message}`, 'error');
@@ -1184,7 +1221,7 @@ Montant: ${formatMontant(facture.total_ttc_usd, 'USD')} / ${formatMontant(factur
         titre: '', description: '', client_id: '', valeur_estimee_usd: '', devise: 'USD', 
         probabilite: 50, etape: 'prospect', priorite: 'moyenne', notes: '' 
       });
-      loadData();
+      synchroniser();
     } catch (error) {
       console.error('Erreur création opportunité:', error);
       showNotification('Erreur lors de la création de l\'opportunité', 'error');
@@ -1224,7 +1261,7 @@ Montant: ${formatMontant(facture.total_ttc_usd, 'USD')} / ${formatMontant(factur
         client_id: '', opportunite_id: '', items: [], devise: 'USD', 
         adresse_livraison: '', notes: '' 
       });
-      loadData();
+      synchroniser();
     } catch (error) {
       console.error('Erreur création commande:', error);
       showNotification('Erreur lors de la création de la commande', 'error');
@@ -1392,8 +1429,8 @@ Montant: ${formatMontant(facture.total_ttc_usd, 'USD')} / ${formatMontant(factur
         'success'
       );
       
-      // Recharger les données utilisateurs
-      loadData();
+      // Mettre à jour les données utilisateurs
+      synchroniser();
     } catch (error) {
       console.error('Erreur changement statut utilisateur:', error);
       showNotification('Erreur lors du changement de statut', 'error');
@@ -1407,8 +1444,8 @@ Montant: ${formatMontant(facture.total_ttc_usd, 'USD')} / ${formatMontant(factur
       
       showNotification('Rôle utilisateur mis à jour avec succès', 'success');
       
-      // Recharger les données utilisateurs
-      loadData();
+      // Mettre à jour les données utilisateurs
+      synchroniser();
     } catch (error) {
       console.error('Erreur changement rôle utilisateur:', error);
       showNotification('Erreur lors du changement de rôle', 'error');
@@ -1462,7 +1499,7 @@ Montant: ${formatMontant(facture.total_ttc_usd, 'USD')} / ${formatMontant(factur
         nom: '', description: '', reference: '', entrepot_id: '', quantite_stock: 0, prix_unitaire_usd: '',
         fournisseur: '', date_achat: '', etat: 'neuf', localisation: '', numero_serie: ''
       });
-      loadData();
+      synchroniser();
     } catch (error) {
       console.error('Erreur sauvegarde outil:', error);
       showNotification(`Erreur lors de la ${editingOutil ? 'modification' : 'création'} de l'outil`, 'error');
@@ -1489,7 +1526,7 @@ Montant: ${formatMontant(facture.total_ttc_usd, 'USD')} / ${formatMontant(factur
         quantite_ajoutee: 0, prix_unitaire_usd: '', fournisseur: '', date_achat: '', notes: ''
       });
       setSelectedOutil(null);
-      loadData();
+      synchroniser();
     } catch (error) {
       console.error('Erreur approvisionnement:', error);
       showNotification('Erreur lors de l\'approvisionnement', 'error');
@@ -1516,7 +1553,7 @@ Montant: ${formatMontant(facture.total_ttc_usd, 'USD')} / ${formatMontant(factur
         technicien_id: '', quantite_affectee: 1, date_retour_prevue: '', notes_affectation: ''
       });
       setSelectedOutil(null);
-      loadData();
+      synchroniser();
     } catch (error) {
       console.error('Erreur affectation:', error);
       showNotification('Erreur lors de l\'affectation', 'error');
@@ -1541,7 +1578,7 @@ Montant: ${formatMontant(facture.total_ttc_usd, 'USD')} / ${formatMontant(factur
         quantite_retournee: 1, etat_retour: 'bon', notes_retour: ''
       });
       setSelectedAffectation(null);
-      loadData();
+      synchroniser();
     } catch (error) {
       console.error('Erreur retour:', error);
       showNotification('Erreur lors du retour', 'error');
@@ -1587,7 +1624,7 @@ Montant: ${formatMontant(facture.total_ttc_usd, 'USD')} / ${formatMontant(factur
       setEntrepotForm({
         nom: '', description: '', adresse: '', responsable: '', capacite_max: '', statut: 'actif'
       });
-      loadData();
+      synchroniser();
     } catch (error) {
       console.error('Erreur sauvegarde entrepôt:', error);
       showNotification(`Erreur lors de la ${editingEntrepot ? 'modification' : 'création'} de l'entrepôt`, 'error');
@@ -1605,7 +1642,7 @@ Montant: ${formatMontant(facture.total_ttc_usd, 'USD')} / ${formatMontant(factur
       setLoading(true);
       await apiCall('DELETE', `/api/entrepots/${entrepot.id}`);
       showNotification('Entrepôt supprimé avec succès', 'success');
-      loadData();
+      synchroniser();
     } catch (error) {
       console.error('Erreur suppression entrepôt:', error);
       if (error.response?.status === 400) {
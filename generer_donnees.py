@@ -0,0 +1,761 @@
+#!/usr/bin/env python3
+"""
+Générateur de données synthétiques pour les tests à l'échelle
+
+Produit des volumes réalistes pour toutes les entités de l'application :
+utilisateurs, clients (avec marques/modèles de véhicules), produits avec stock,
+factures multi-lignes et leurs paiements, devis, opportunités, commandes,
+entrepôts, outils, affectations et historiques de mouvements.
+
+Les distributions suivent grossièrement la réalité du terrain : quelques gros
+clients concentrent l'activité, une minorité de produits fait l'essentiel des
+ventes, l'activité croît avec le temps et les vieilles factures sont payées.
+
+La sortie est déterministe pour un seed et une date de référence donnés
+(identifiants compris) afin que les régressions de performance soient
+reproductibles. Seul le sel bcrypt des mots de passe varie d'une exécution
+à l'autre. Les documents sont écrits par insert_many, plusieurs lots en
+parallèle.
+
+Exemples :
+    python generer_donnees.py --db facturapp_echelle --vider
+    python generer_donnees.py --db facturapp_echelle --vider --echelle 10 --seed 7
+    python generer_donnees.py --db facturapp_echelle --vider --factures 200000 --taille-lot 5000
+"""
+
+import argparse
+import asyncio
+import math
+import os
+import random
+import string
+import sys
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+
+VOLUMES_DEFAUT = {
+    "utilisateurs": 40,
+    "clients": 5000,
+    "produits": 800,
+    "factures": 50000,
+    "devis": 15000,
+    "opportunites": 4000,
+    "commandes": 8000,
+    "entrepots": 8,
+    "outils": 600,
+    "affectations": 6000,
+    "mouvements": 100000,
+}
+
+# Collections écrites par le générateur (vidées par --vider)
+COLLECTIONS = [
+    "users", "taux_change", "clients", "produits", "mouvements_stock_seaux", "factures", "paiements",
+    "opportunites", "devis", "commandes", "entrepots", "outils", "affectations_outils", "mouvements_outils_seaux",
+]
+
+# Historique des mouvements rangé en seaux (élément, mois), comme le fait le serveur
+MOUVEMENTS_PAR_SEAU = 200
+# Mouvements gardés dans des seaux incomplets ; au-delà, tous les seaux ouverts sont écrits
+MOUVEMENTS_EN_ATTENTE_MAX = 20000
+
+DATE_REFERENCE_DEFAUT = "2026-01-01"
+DOMAINE_DEFAUT = "echelle.facturapp.cd"
+MOT_DE_PASSE_DEFAUT = "echelle123"
+TAUX_CHANGE = 2800.0
+TVA = 16.0
+
+# Les premiers comptes couvrent chaque rôle, les suivants sont tirés selon ces poids
+ROLES = ["admin", "manager", "comptable", "technicien", "support", "utilisateur"]
+POIDS_ROLES = [1, 3, 4, 8, 1, 3]
+
+VILLES = ["Kinshasa", "Lubumbashi", "Goma", "Matadi", "Kisangani", "Bukavu", "Kolwezi", "Mbuji-Mayi"]
+POIDS_VILLES = [45, 15, 10, 8, 6, 6, 5, 5]
+
+MARQUES = {
+    "Toyota": ["Land Cruiser", "Hilux", "Corolla", "RAV4", "Prado", "Hiace"],
+    "Nissan": ["Patrol", "Navara", "X-Trail", "Sunny"],
+    "Mitsubishi": ["Pajero", "L200", "Outlander"],
+    "Hyundai": ["Tucson", "Santa Fe", "H-1"],
+    "Mercedes-Benz": ["Classe G", "Sprinter", "Actros"],
+    "Land Rover": ["Defender", "Discovery", "Range Rover"],
+    "Isuzu": ["D-Max", "NPR"],
+    "Suzuki": ["Jimny", "Vitara", "Swift"],
+}
+POIDS_MARQUES = [40, 15, 10, 8, 8, 8, 6, 5]
+
+CATEGORIES_PRODUITS = ["Filtre", "Plaquettes", "Batterie", "Pneu", "Huile moteur", "Amortisseur",
+                       "Courroie", "Bougie", "Radiateur", "Alternateur", "Démarreur", "Embrayage"]
+CATEGORIES_OUTILS = ["Clé dynamométrique", "Cric hydraulique", "Valise diagnostic", "Compresseur",
+                     "Poste à souder", "Jeu de douilles", "Multimètre", "Pont élévateur mobile"]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Générateur de données synthétiques FacturApp")
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db", default="facturapp_echelle", help="Base cible")
+    parser.add_argument("--vider", action="store_true", help="Vider les collections cibles avant génération")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--date-reference", default=DATE_REFERENCE_DEFAUT,
+                        help="Date « aujourd'hui » des données (AAAA-MM-JJ), fixe pour rester reproductible")
+    parser.add_argument("--jours", type=int, default=730, help="Profondeur d'historique en jours")
+    parser.add_argument("--echelle", type=float, default=1.0, help="Multiplicateur appliqué à tous les volumes")
+    for entite, volume in VOLUMES_DEFAUT.items():
+        parser.add_argument(f"--{entite}", type=int, default=None, help=f"Volume de {entite} (défaut {volume})")
+    parser.add_argument("--taille-lot", type=int, default=1000, help="Documents par insert_many")
+    parser.add_argument("--paralleles", type=int, default=4, help="Lots insérés simultanément")
+    parser.add_argument("--domaine", default=DOMAINE_DEFAUT, help="Domaine des emails générés")
+    parser.add_argument("--mot-de-passe", default=MOT_DE_PASSE_DEFAUT, help="Mot de passe de tous les comptes")
+    return parser.parse_args(argv)
+
+
+def volumes_depuis_args(args):
+    """Volumes par défaut mis à l'échelle, surchargés par les options explicites"""
+    volumes = {}
+    for entite, volume in VOLUMES_DEFAUT.items():
+        valeur = getattr(args, entite)
+        volumes[entite] = valeur if valeur is not None else max(1, int(volume * args.echelle))
+    return volumes
+
+
+# ===== ÉCRITURE PAR LOTS =====
+
+class EcrivainLots:
+    """Accumule les documents par collection et les insère par lots en parallèle
+
+    Le sémaphore borne le nombre de lots en vol : quand tous les slots sont
+    occupés, la génération attend, ce qui limite la mémoire consommée.
+    """
+
+    def __init__(self, db, taille_lot=1000, paralleles=4):
+        self.db = db
+        self.taille_lot = taille_lot
+        self.semaphore = asyncio.Semaphore(paralleles)
+        self.tampons = {}
+        self.seaux = {}
+        self.mouvements_en_attente = 0
+        self.taches = []
+        self.compteurs = Counter()
+
+    async def ajouter(self, collection, document):
+        tampon = self.tampons.setdefault(collection, [])
+        tampon.append(document)
+        if len(tampon) >= self.taille_lot:
+            await self._envoyer(collection)
+
+    async def ajouter_mouvement(self, collection, champ, mouvement):
+        """Range le mouvement dans son seau (élément, mois), écrit dès qu'il est plein
+
+        Au-delà de MOUVEMENTS_EN_ATTENTE_MAX mouvements en attente, les seaux incomplets
+        sont écrits tels quels : un (élément, mois) peut alors compter plusieurs seaux,
+        comme après des écritures du serveur.
+        """
+        cle = (mouvement[champ], mouvement["date_mouvement"].strftime("%Y-%m"))
+        seaux = self.seaux.setdefault((collection, champ), {})
+        seau = seaux.setdefault(cle, [])
+        seau.append(mouvement)
+        self.mouvements_en_attente += 1
+        if len(seau) >= MOUVEMENTS_PAR_SEAU:
+            del seaux[cle]
+            await self._ecrire_seau(collection, champ, cle, seau)
+        elif self.mouvements_en_attente > MOUVEMENTS_EN_ATTENTE_MAX:
+            await self.vider_seaux()
+
+    async def vider_seaux(self):
+        """Écrit tous les seaux ouverts (fin d'un élément, ou trop de mouvements en attente)"""
+        seaux, self.seaux = self.seaux, {}
+        for (collection, champ), seaux_collection in seaux.items():
+            for cle, mouvements in seaux_collection.items():
+                await self._ecrire_seau(collection, champ, cle, mouvements)
+
+    async def _ecrire_seau(self, collection, champ, cle, mouvements):
+        element, mois = cle
+        mouvements.sort(key=lambda m: m["date_mouvement"])
+        self.mouvements_en_attente -= len(mouvements)
+        await self.ajouter(collection, {
+            champ: element, "mois": mois, "n": len(mouvements), "mouvements": mouvements,
+            "debut": mouvements[0]["date_mouvement"], "fin": mouvements[-1]["date_mouvement"],
+            "date_modification": mouvements[-1]["date_mouvement"],
+        })
+
+    async def _envoyer(self, collection):
+        lot = self.tampons.pop(collection, None)
+        if not lot:
+            return
+        await self.semaphore.acquire()
+        self.taches.append(asyncio.create_task(self._inserer(collection, lot)))
+
+    async def _inserer(self, collection, lot):
+        try:
+            await self.db[collection].insert_many(lot, ordered=False)
+            self.compteurs[collection] += len(lot)
+        finally:
+            self.semaphore.release()
+
+    async def terminer(self):
+        await self.vider_seaux()
+        for collection in list(self.tampons):
+            await self._envoyer(collection)
+        await asyncio.gather(*self.taches)
+        self.taches = []
+        return dict(self.compteurs)
+
+
+# ===== GÉNÉRATEUR =====
+
+class Generateur:
+    def __init__(self, seed, date_reference, jours, domaine):
+        self.rng = random.Random(seed)
+        self.maintenant = date_reference
+        self.jours = jours
+        self.domaine = domaine
+
+    def identifiant(self):
+        # uuid4 tiré du générateur pseudo-aléatoire : même seed, mêmes identifiants
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def date_passee(self, jours=None):
+        """Date dans l'historique, plus dense vers le présent (activité croissante)"""
+        jours = jours or self.jours
+        anciennete = jours * (1 - math.sqrt(self.rng.random()))
+        return self.maintenant - timedelta(days=anciennete, seconds=self.rng.randint(0, 86399))
+
+    def code(self, longueur):
+        return "".join(self.rng.choices(string.ascii_uppercase + string.digits, k=longueur))
+
+    def quantite(self):
+        # Majorité de petites quantités, queue longue
+        return 1 + int(self.rng.expovariate(0.6))
+
+    def telephone(self):
+        return f"+243 {self.rng.choice(['81', '82', '84', '85', '89', '97', '99'])} {self.rng.randint(100, 999)} {self.rng.randint(1000, 9999)}"
+
+    def poids_pareto(self, n, alpha=1.16):
+        # alpha ≈ 1,16 : environ 20 % des éléments portent 80 % du volume
+        return [self.rng.paretovariate(alpha) for _ in range(n)]
+
+    # --- Référentiels ---
+
+    def utilisateurs(self, n, hashed_password):
+        documents = []
+        for i in range(n):
+            role = ROLES[i] if i < len(ROLES) else self.rng.choices(ROLES, weights=POIDS_ROLES)[0]
+            documents.append({
+                "id": self.identifiant(),
+                "email": f"{role}{i}@{self.domaine}",
+                "nom": f"Nom{i}",
+                "prenom": role.capitalize(),
+                "role": role,
+                "is_active": self.rng.random() > 0.05,
+                "hashed_password": hashed_password,
+                "date_creation": self.date_passee(),
+                "derniere_connexion": self.date_passee(30) if self.rng.random() > 0.2 else None,
+            })
+        # Les comptes du premier tour restent actifs pour pouvoir se connecter avec chaque rôle
+        for document in documents[:len(ROLES)]:
+            document["is_active"] = True
+        return documents
+
+    def clients(self, n):
+        documents = []
+        for i in range(n):
+            marques = self.rng.choices(list(MARQUES), weights=POIDS_MARQUES, k=self.rng.choice([1, 1, 1, 2, 3]))
+            marques = list(dict.fromkeys(marques))
+            modeles = [self.rng.choice(MARQUES[m]) for m in marques]
+            entreprise = self.rng.random() < 0.4
+            nom = f"{'Société' if entreprise else 'Client'} {i:06d}"
+            documents.append({
+                "id": self.identifiant(),
+                "nom": nom,
+                "email": f"client{i}@{self.domaine}",
+                "telephone": self.telephone(),
+                "adresse": f"{self.rng.randint(1, 400)} Avenue {self.rng.choice(['du Commerce', 'Lumumba', 'Kasa-Vubu', 'de la Paix', 'Mobutu'])}",
+                "ville": self.rng.choices(VILLES, weights=POIDS_VILLES)[0],
+                "code_postal": None,
+                "pays": "RDC",
+                "devise_preferee": self.rng.choices(["USD", "FC"], weights=[7, 3])[0],
+                "marques": marques,
+                "modeles": modeles,
+                "numero_chassis": self.code(17) if self.rng.random() < 0.7 else None,
+                "plaque_immatriculation": f"{self.rng.randint(1000, 9999)}{self.code(2)}{self.rng.randint(1, 26):02d}" if self.rng.random() < 0.8 else None,
+                "formule": self.rng.choices(["Basic", "Standard", "Premium"], weights=[6, 3, 1])[0],
+                "date_creation": self.date_passee(),
+            })
+        return documents
+
+    def produits(self, n):
+        documents = []
+        for i in range(n):
+            # Prix log-normaux : beaucoup de consommables, quelques pièces chères
+            prix = round(min(20000, max(1, self.rng.lognormvariate(3.8, 1.2))), 2)
+            gestion_stock = self.rng.random() < 0.85
+            stock_minimum = self.rng.choice([5, 10, 20, 50]) if gestion_stock else None
+            documents.append({
+                "id": self.identifiant(),
+                "nom": f"{self.rng.choice(CATEGORIES_PRODUITS)} {self.code(4)}-{i}",
+                "description": f"Référence {self.code(8)}",
+                "prix_usd": prix,
+                "prix_fc": round(prix * TAUX_CHANGE, 2),
+                "unite": "unité",
+                "tva": TVA,
+                "actif": self.rng.random() > 0.03,
+                "gestion_stock": gestion_stock,
+                "stock_actuel": None,
+                "stock_minimum": stock_minimum,
+                "stock_maximum": stock_minimum * 20 if gestion_stock else None,
+                "date_creation": self.date_passee(),
+            })
+        return documents
+
+    def entrepots(self, n):
+        return [
+            {
+                "id": self.identifiant(),
+                "nom": f"Entrepôt {VILLES[i % len(VILLES)]} {i // len(VILLES) + 1}",
+                "description": None,
+                "adresse": f"Zone industrielle, {VILLES[i % len(VILLES)]}",
+                "responsable": f"Responsable {i}",
+                "capacite_max": self.rng.choice([500, 1000, 5000]),
+                "statut": self.rng.choices(["actif", "inactif", "maintenance"], weights=[8, 1, 1])[0],
+                "date_creation": self.date_passee(),
+                "date_modification": self.maintenant,
+            }
+            for i in range(n)
+        ]
+
+    # --- Lignes et totaux ---
+
+    def lignes(self, produits, poids_produits, devise):
+        nombre = self.rng.choices(range(1, 9), weights=[30, 25, 15, 10, 8, 6, 4, 2])[0]
+        choisis = {p["id"]: p for p in self.rng.choices(produits, weights=poids_produits, k=nombre)}
+        lignes = []
+        for produit in choisis.values():
+            quantite = self.quantite()
+            ht_usd = round(produit["prix_usd"] * quantite, 2)
+            lignes.append({
+                "produit_id": produit["id"],
+                "nom_produit": produit["nom"],
+                "quantite": quantite,
+                "prix_unitaire_usd": produit["prix_usd"],
+                "prix_unitaire_fc": produit["prix_fc"],
+                "devise": devise,
+                "tva": TVA,
+                "total_ht_usd": ht_usd,
+                "total_ht_fc": round(ht_usd * TAUX_CHANGE, 2),
+                "total_ttc_usd": round(ht_usd * (1 + TVA / 100), 2),
+                "total_ttc_fc": round(ht_usd * (1 + TVA / 100) * TAUX_CHANGE, 2),
+            })
+        return lignes
+
+
+def totaux(lignes):
+    ht_usd = round(sum(l["total_ht_usd"] for l in lignes), 2)
+    ht_fc = round(sum(l["total_ht_fc"] for l in lignes), 2)
+    ttc_usd = round(sum(l["total_ttc_usd"] for l in lignes), 2)
+    ttc_fc = round(sum(l["total_ttc_fc"] for l in lignes), 2)
+    return {
+        "total_ht_usd": ht_usd,
+        "total_ht_fc": ht_fc,
+        "total_tva_usd": round(ttc_usd - ht_usd, 2),
+        "total_tva_fc": round(ttc_fc - ht_fc, 2),
+        "total_ttc_usd": ttc_usd,
+        "total_ttc_fc": ttc_fc,
+    }
+
+
+def numero(prefixe, date, i):
+    return f"{prefixe}-{date.strftime('%Y%m%d')}-{i:06X}"
+
+
+def hasher_mot_de_passe(mot_de_passe):
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto").hash(mot_de_passe)
+
+
+async def vider_collections(db):
+    for nom in COLLECTIONS:
+        await db[nom].delete_many({})
+
+
+async def generer(db, volumes=None, seed=42, date_reference=None, jours=730, taille_lot=1000, paralleles=4,
+                  domaine=DOMAINE_DEFAUT, mot_de_passe=MOT_DE_PASSE_DEFAUT, hashed_password=None):
+    """Génère toutes les entités dans db et retourne le nombre de documents par collection
+
+    Les collections cibles doivent être vides (voir vider_collections). Les
+    entités sont produites dans un ordre fixe depuis un seul générateur
+    pseudo-aléatoire ; seule l'écriture est parallèle.
+    """
+    volumes = {**VOLUMES_DEFAUT, **(volumes or {})}
+    date_reference = date_reference or datetime.strptime(DATE_REFERENCE_DEFAUT, "%Y-%m-%d")
+    gen = Generateur(seed, date_reference, jours, domaine)
+    rng = gen.rng
+    ecrivain = EcrivainLots(db, taille_lot, paralleles)
+
+    await ecrivain.ajouter("taux_change", {
+        "id": gen.identifiant(), "devise_base": "USD", "devise_cible": "FC",
+        "taux": TAUX_CHANGE, "date_creation": date_reference, "actif": True
+    })
+
+    # Un seul hash bcrypt pour tous les comptes : le coût est volontaire et ne doit pas dominer
+    utilisateurs = gen.utilisateurs(volumes["utilisateurs"], hashed_password or hasher_mot_de_passe(mot_de_passe))
+    for utilisateur in utilisateurs:
+        await ecrivain.ajouter("users", utilisateur)
+    commerciaux = [u for u in utilisateurs if u["role"] in ("admin", "manager")]
+    techniciens = [u for u in utilisateurs if u["role"] == "technicien"] or utilisateurs
+
+    clients = gen.clients(volumes["clients"])
+    for client in clients:
+        await ecrivain.ajouter("clients", client)
+    poids_clients = gen.poids_pareto(len(clients))
+
+    # Les produits sont écrits après leurs mouvements, qui fixent le stock actuel
+    produits = gen.produits(volumes["produits"])
+    poids_produits = [1 / (rang + 1) for rang in range(len(produits))]  # popularité de Zipf
+    produits_stock = [p for p in produits if p["gestion_stock"]]
+    repartition = Counter(rng.choices(range(len(produits_stock)), weights=poids_produits[:len(produits_stock)],
+                                      k=volumes["mouvements"])) if produits_stock else Counter()
+    for index, produit in enumerate(produits_stock):
+        stock = produit["stock_maximum"] // 2
+        dates = sorted(gen.date_passee() for _ in range(repartition[index]))
+        for date_mouvement in dates:
+            if stock <= produit["stock_minimum"] or rng.random() < 0.25:
+                type_mouvement, quantite = "entree", rng.randint(produit["stock_minimum"], produit["stock_maximum"])
+                quantite = min(quantite, produit["stock_maximum"] - stock) or 1
+            else:
+                type_mouvement, quantite = "sortie", -min(stock, gen.quantite())
+            await ecrivain.ajouter_mouvement("mouvements_stock_seaux", "produit_id", {
+                "id": gen.identifiant(),
+                "produit_id": produit["id"],
+                "type_mouvement": type_mouvement,
+                "quantite": quantite,
+                "stock_avant": stock,
+                "stock_après": stock + quantite,
+                "motif": "Réapprovisionnement" if type_mouvement == "entree" else "Vente",
+                "date_mouvement": date_mouvement,
+            })
+            stock += quantite
+        produit["stock_actuel"] = stock
+        # Dates triées par produit : ses seaux sont complets, rien ne reste en mémoire
+        await ecrivain.vider_seaux()
+    for produit in produits:
+        await ecrivain.ajouter("produits", produit)
+
+    # Factures et paiements
+    for i in range(volumes["factures"]):
+        client = rng.choices(clients, weights=poids_clients)[0]
+        devise = client["devise_preferee"]
+        lignes = gen.lignes(produits, poids_produits, devise)
+        date_creation = gen.date_passee()
+        age = (date_reference - date_creation).days
+        # Plus une facture est ancienne, plus elle a de chances d'être réglée
+        if age > 60:
+            statut = rng.choices(["payee", "envoyee", "annulee"], weights=[88, 7, 5])[0]
+        else:
+            statut = rng.choices(["brouillon", "envoyee", "payee", "annulee"], weights=[20, 45, 32, 3])[0]
+        facture = {
+            "id": gen.identifiant(),
+            "numero": numero("FACT", date_creation, i),
+            "client_id": client["id"],
+            "client_nom": client["nom"],
+            "client_email": client["email"],
+            "client_adresse": client["adresse"],
+            "devise": devise,
+            "lignes": lignes,
+            **totaux(lignes),
+            "statut": statut,
+            "date_creation": date_creation,
+            "date_echeance": date_creation + timedelta(days=30),
+            "date_paiement": None,
+            "notes": None,
+        }
+        if statut == "payee":
+            # Règlement en une à trois fois
+            tranches = rng.choices([1, 2, 3], weights=[80, 15, 5])[0]
+            date_paiement = date_creation
+            for tranche in range(tranches):
+                date_paiement = min(date_reference, date_paiement + timedelta(days=rng.randint(0, 25)))
+                part = 1 / tranches
+                await ecrivain.ajouter("paiements", {
+                    "id": gen.identifiant(),
+                    "facture_id": facture["id"],
+                    "facture_numero": facture["numero"],
+                    "montant_usd": round(facture["total_ttc_usd"] * part, 2),
+                    "montant_fc": round(facture["total_ttc_fc"] * part, 2),
+                    "devise_paiement": devise,
+                    "methode_paiement": rng.choices(["manuel", "cash", "bank_transfer", "stripe"], weights=[4, 3, 2, 1])[0],
+                    "statut": "completed",
+                    "transaction_id": f"gen_{gen.code(10).lower()}",
+                    "date_paiement": date_paiement,
+                    "notes": None,
+                })
+            facture["date_paiement"] = date_paiement
+        await ecrivain.ajouter("factures", facture)
+
+    # Opportunités (conservées en mémoire pour y rattacher les devis)
+    etapes = ["prospect", "qualification", "proposition", "negociation", "ferme_gagne", "ferme_perdu"]
+    probabilites = {"prospect": 10, "qualification": 25, "proposition": 50, "negociation": 75, "ferme_gagne": 100, "ferme_perdu": 0}
+    opportunites_par_client = {}
+    opportunites = []
+    for i in range(volumes["opportunites"]):
+        client = rng.choices(clients, weights=poids_clients)[0]
+        etape = rng.choices(etapes, weights=[20, 20, 18, 12, 18, 12])[0]
+        valeur = round(rng.lognormvariate(7, 1), 2)
+        date_creation = gen.date_passee()
+        commercial = rng.choice(commerciaux) if commerciaux else None
+        activites = [
+            {
+                "id": gen.identifiant(),
+                "type_activite": rng.choice(["appel", "email", "reunion", "visite", "proposition", "suivi"]),
+                "date": date_creation + timedelta(days=rng.randint(0, 60)),
+                "resultat": rng.choice(["positif", "neutre", "negatif"]),
+            }
+            for _ in range(rng.choices(range(6), weights=[20, 30, 20, 15, 10, 5])[0])
+        ]
+        opportunite = {
+            "id": gen.identifiant(),
+            "titre": f"Opportunité {i} - {client['nom']}",
+            "description": None,
+            "client_id": client["id"],
+            "client_nom": client["nom"],
+            "valeur_estimee_usd": valeur,
+            "valeur_estimee_fc": round(valeur * TAUX_CHANGE, 2),
+            "devise": "USD",
+            "probabilite": probabilites[etape],
+            "etape": etape,
+            "priorite": rng.choices(["basse", "moyenne", "haute"], weights=[3, 5, 2])[0],
+            "date_creation": date_creation,
+            "date_cloture_prevue": date_creation + timedelta(days=rng.randint(15, 120)),
+            "date_cloture_reelle": date_creation + timedelta(days=rng.randint(15, 120)) if etape.startswith("ferme") else None,
+            "notes": None,
+            "commercial_id": commercial["id"] if commercial else None,
+            "devis_ids": [],
+            "activites": activites,
+        }
+        opportunites.append(opportunite)
+        opportunites_par_client.setdefault(client["id"], []).append(opportunite)
+
+    # Devis : les acceptés alimentent ensuite une partie des commandes
+    devis_acceptes = []
+    for i in range(volumes["devis"]):
+        client = rng.choices(clients, weights=poids_clients)[0]
+        devise = client["devise_preferee"]
+        lignes = gen.lignes(produits, poids_produits, devise)
+        date_creation = gen.date_passee()
+        statut = rng.choices(["brouillon", "envoye", "accepte", "refuse", "expire"], weights=[10, 25, 35, 15, 15])[0]
+        devis = {
+            "id": gen.identifiant(),
+            "numero": numero("DEVIS", date_creation, i),
+            "client_id": client["id"],
+            "client_nom": client["nom"],
+            "client_email": client["email"],
+            "client_adresse": client["adresse"],
+            "devise": devise,
+            "lignes": lignes,
+            **totaux(lignes),
+            "statut": statut,
+            "validite_jours": 30,
+            "date_creation": date_creation,
+            "date_expiration": date_creation + timedelta(days=30),
+            "date_acceptation": date_creation + timedelta(days=rng.randint(1, 20)) if statut == "accepte" else None,
+            "notes": None,
+            "conditions": None,
+            "facture_id": None,
+        }
+        candidates = opportunites_par_client.get(client["id"])
+        if candidates and rng.random() < 0.5:
+            rng.choice(candidates)["devis_ids"].append(devis["id"])
+        if statut == "accepte":
+            devis_acceptes.append(devis)
+        await ecrivain.ajouter("devis", devis)
+    for opportunite in opportunites:
+        await ecrivain.ajouter("opportunites", opportunite)
+
+    for i in range(volumes["commandes"]):
+        devis = rng.choice(devis_acceptes) if devis_acceptes and rng.random() < 0.6 else None
+        if devis:
+            client = {"id": devis["client_id"], "nom": devis["client_nom"], "email": devis["client_email"],
+                      "adresse": devis["client_adresse"], "devise_preferee": devis["devise"]}
+            lignes_source = devis["lignes"]
+            date_creation = devis["date_acceptation"]
+        else:
+            client = rng.choices(clients, weights=poids_clients)[0]
+            lignes_source = gen.lignes(produits, poids_produits, client["devise_preferee"])
+            date_creation = gen.date_passee()
+        statut = rng.choices(["nouvelle", "confirmee", "en_preparation", "expediee", "livree", "annulee"],
+                             weights=[10, 10, 10, 10, 55, 5])[0]
+        lignes = [
+            {
+                "produit_id": l["produit_id"],
+                "nom_produit": l["nom_produit"],
+                "quantite": l["quantite"],
+                "prix_unitaire_usd": l["prix_unitaire_usd"],
+                "prix_unitaire_fc": l["prix_unitaire_fc"],
+                "devise": l["devise"],
+                "total_usd": l["total_ttc_usd"],
+                "total_fc": l["total_ttc_fc"],
+                "statut_livraison": "livre" if statut == "livree" else "en_attente",
+            }
+            for l in lignes_source
+        ]
+        date_livraison_prevue = date_creation + timedelta(days=rng.randint(3, 30))
+        await ecrivain.ajouter("commandes", {
+            "id": gen.identifiant(),
+            "numero": numero("CMD", date_creation, i),
+            "client_id": client["id"],
+            "client_nom": client["nom"],
+            "client_email": client["email"],
+            "client_adresse": client["adresse"],
+            "opportunite_id": None,
+            "devis_id": devis["id"] if devis else None,
+            "lignes": lignes,
+            "total_usd": round(sum(l["total_usd"] for l in lignes), 2),
+            "total_fc": round(sum(l["total_fc"] for l in lignes), 2),
+            "devise": client["devise_preferee"],
+            "statut": statut,
+            "date_creation": date_creation,
+            "date_confirmation": date_creation + timedelta(days=1) if statut not in ("nouvelle", "annulee") else None,
+            "date_livraison_prevue": date_livraison_prevue,
+            "date_livraison_reelle": date_livraison_prevue + timedelta(days=rng.randint(-2, 7)) if statut == "livree" else None,
+            "adresse_livraison": client["adresse"],
+            "transporteur": None,
+            "numero_suivi": None,
+            "notes": None,
+            "facture_id": None,
+        })
+
+    # Entrepôts, outils et leur historique
+    entrepots = gen.entrepots(volumes["entrepots"])
+    for entrepot in entrepots:
+        await ecrivain.ajouter("entrepots", entrepot)
+
+    outils = []
+    for i in range(volumes["outils"]):
+        entrepot = rng.choice(entrepots)
+        quantite_stock = rng.choices([1, 2, 5, 10, 20, 50], weights=[25, 20, 20, 15, 12, 8])[0]
+        date_achat = gen.date_passee()
+        outil = {
+            "id": gen.identifiant(),
+            "nom": f"{rng.choice(CATEGORIES_OUTILS)} {gen.code(3)}-{i}",
+            "description": None,
+            "reference": f"OUT-{i:06d}",
+            "entrepot_id": entrepot["id"],
+            "entrepot_nom": entrepot["nom"],
+            "quantite_stock": quantite_stock,
+            "quantite_disponible": quantite_stock,
+            "prix_unitaire_usd": round(rng.lognormvariate(4.5, 1), 2),
+            "fournisseur": f"Fournisseur {rng.randint(1, 30)}",
+            "date_achat": date_achat,
+            "etat": rng.choices(["neuf", "bon", "use", "defaillant"], weights=[30, 45, 20, 5])[0],
+            "localisation": f"Allée {rng.randint(1, 20)}",
+            "numero_serie": gen.code(12),
+            "date_creation": date_achat,
+            "date_modification": date_achat,
+        }
+        outils.append(outil)
+        await ecrivain.ajouter_mouvement("mouvements_outils_seaux", "outil_id", {
+            "id": gen.identifiant(),
+            "outil_id": outil["id"],
+            "type_mouvement": "approvisionnement",
+            "quantite": quantite_stock,
+            "stock_avant": 0,
+            "stock_apres": quantite_stock,
+            "motif": "Stock initial",
+            "date_mouvement": date_achat,
+            "fait_par": commerciaux[0]["email"] if commerciaux else utilisateurs[0]["email"],
+        })
+
+    for _ in range(volumes["affectations"]):
+        outil = rng.choice(outils)
+        technicien = rng.choice(techniciens)
+        affecte_par = rng.choice(commerciaux or utilisateurs)
+        quantite = 1 if outil["quantite_stock"] < 5 else rng.randint(1, 3)
+        date_affectation = max(outil["date_achat"], gen.date_passee())
+        # Les affectations récentes sont souvent encore en cours
+        retourne = (date_reference - date_affectation).days > 14 or rng.random() < 0.5
+        statut = rng.choices(["retourne", "endommage", "perdu"], weights=[92, 6, 2])[0] if retourne else "affecte"
+        date_retour = date_affectation + timedelta(days=rng.randint(1, 14)) if retourne else None
+        if statut == "affecte":
+            quantite = min(quantite, outil["quantite_disponible"])
+            if quantite <= 0:
+                continue
+            outil["quantite_disponible"] -= quantite
+        await ecrivain.ajouter("affectations_outils", {
+            "id": gen.identifiant(),
+            "outil_id": outil["id"],
+            "outil_nom": outil["nom"],
+            "technicien_id": technicien["id"],
+            "technicien_nom": f"{technicien['prenom']} {technicien['nom']}",
+            "quantite_affectee": quantite,
+            "date_affectation": date_affectation,
+            "date_retour_prevue": date_affectation + timedelta(days=7),
+            "date_retour_effective": date_retour,
+            "statut": statut,
+            "notes_affectation": None,
+            "notes_retour": None,
+            "affecte_par": affecte_par["email"],
+        })
+        await ecrivain.ajouter_mouvement("mouvements_outils_seaux", "outil_id", {
+            "id": gen.identifiant(),
+            "outil_id": outil["id"],
+            "type_mouvement": "affectation",
+            "quantite": quantite,
+            "stock_avant": "N/A",
+            "stock_apres": "N/A",
+            "motif": f"Affectation à {technicien['prenom']} {technicien['nom']}",
+            "date_mouvement": date_affectation,
+            "fait_par": affecte_par["email"],
+        })
+        if retourne:
+            await ecrivain.ajouter_mouvement("mouvements_outils_seaux", "outil_id", {
+                "id": gen.identifiant(),
+                "outil_id": outil["id"],
+                "type_mouvement": "retour",
+                "quantite": quantite,
+                "stock_avant": "N/A",
+                "stock_apres": "N/A",
+                "motif": f"Retour {'bon' if statut == 'retourne' else statut}",
+                "date_mouvement": date_retour,
+                "fait_par": affecte_par["email"],
+            })
+    for outil in outils:
+        await ecrivain.ajouter("outils", outil)
+
+    return await ecrivain.terminer()
+
+
+async def main():
+    args = parse_args()
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(args.mongo_url)
+    db = client[args.db]
+
+    if args.vider:
+        await vider_collections(db)
+    else:
+        for nom in COLLECTIONS:
+            if await db[nom].estimated_document_count() > 0:
+                print(f"❌ La collection '{nom}' de '{args.db}' n'est pas vide (utiliser --vider)", file=sys.stderr)
+                sys.exit(1)
+
+    volumes = volumes_depuis_args(args)
+    print(f"🏗️  Génération dans '{args.db}' (seed {args.seed}) : "
+          + ", ".join(f"{k}={v}" for k, v in volumes.items()), file=sys.stderr)
+    debut = time.perf_counter()
+    compteurs = await generer(
+        db, volumes, seed=args.seed,
+        date_reference=datetime.strptime(args.date_reference, "%Y-%m-%d"), jours=args.jours,
+        taille_lot=args.taille_lot, paralleles=args.paralleles,
+        domaine=args.domaine, mot_de_passe=args.mot_de_passe
+    )
+    duree = time.perf_counter() - debut
+    total = sum(compteurs.values())
+    for nom in COLLECTIONS:
+        print(f"   {nom:<22} {compteurs.get(nom, 0):>10}", file=sys.stderr)
+    print(f"✅ {total} documents en {duree:.1f}s ({total / duree:.0f} docs/s)", file=sys.stderr)
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,37 @@
+"""
+Fixtures des tests unitaires du backend
+
+Le serveur est importé tel quel puis pointé vers une base mongomock-motor neuve
+à chaque test (sans mongod). Les scripts *_test.py de ce dossier testent, eux,
+un serveur démarré.
+"""
+
+import os
+import sys
+
+import pytest
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [RACINE, os.path.join(RACINE, "backend")]
+
+# Scripts lancés à la main contre un serveur démarré, sans tests pytest
+collect_ignore_glob = ["*_test.py"]
+
+pytest.importorskip("mongomock_motor")
+
+
+@pytest.fixture
+def serveur(monkeypatch):
+    """Module server sur une base en mémoire, avec un journal des mouvements neuf"""
+    from mongomock_motor import AsyncMongoMockClient
+
+    import benchmark_backend
+    import server
+
+    benchmark_backend.adapter_mongomock()
+    client = AsyncMongoMockClient()
+    monkeypatch.setattr(server, "client", client)
+    monkeypatch.setattr(server, "db", server.BaseHorodatee(client["tests"]))
+    monkeypatch.setattr(server, "db_rapports", client["tests"])
+    monkeypatch.setattr(server, "journal_mouvements", server.JournalMouvements())
+    return server
@@ -0,0 +1,78 @@
+"""Contrôle d'admission : limite par utilisateur des rapports (par route) et des exports (par classe)"""
+
+import asyncio
+
+import pytest
+
+
+def test_rapports_differents_admis_ensemble_pour_un_utilisateur(serveur):
+    async def scenario():
+        controle = serveur.ControleAdmission(serveur.CLASSES_ADMISSION)
+        # Le tableau de bord demande les deux statistiques en même temps
+        await controle.entrer("rapport", "manager@demo.com", "/api/stats")
+        await controle.entrer("rapport", "manager@demo.com", "/api/vente/stats")
+
+        with pytest.raises(serveur.RefusAdmission) as refus:
+            await controle.entrer("rapport", "manager@demo.com", "/api/stats")
+        assert refus.value.statut == 429
+        assert refus.value.reessayer_apres > 0
+
+        # Un autre utilisateur n'est pas concerné
+        await controle.entrer("rapport", "admin@demo.com", "/api/stats")
+
+        await controle.sortir("rapport", "manager@demo.com", "/api/stats")
+        await controle.entrer("rapport", "manager@demo.com", "/api/stats")
+
+    asyncio.run(scenario())
+
+
+def test_exports_limites_par_classe_pour_un_utilisateur(serveur):
+    async def scenario():
+        controle = serveur.ControleAdmission(serveur.CLASSES_ADMISSION)
+        await controle.entrer("export", "admin@demo.com", "/api/import/clients")
+        with pytest.raises(serveur.RefusAdmission) as refus:
+            await controle.entrer("export", "admin@demo.com", "/api/parametres/backup")
+        assert refus.value.statut == 429
+
+        await controle.sortir("export", "admin@demo.com", "/api/import/clients")
+        await controle.entrer("export", "admin@demo.com", "/api/parametres/backup")
+        assert controle.par_utilisateur == {("export", "admin@demo.com", None): 1}
+
+    asyncio.run(scenario())
+
+
+def test_compteurs_liberes_apres_attente_depassee(serveur, monkeypatch):
+    classes = {
+        **serveur.CLASSES_ADMISSION,
+        "rapport": {**serveur.CLASSES_ADMISSION["rapport"], "limite": 1, "attente_max": 0.01},
+    }
+
+    async def scenario():
+        controle = serveur.ControleAdmission(classes)
+        await controle.entrer("rapport", "a@demo.com", "/api/stats")
+        with pytest.raises(serveur.RefusAdmission) as refus:
+            await controle.entrer("rapport", "b@demo.com", "/api/stats")
+        assert refus.value.statut == 503
+        # Le refus ne laisse pas b compté comme en cours
+        assert ("rapport", "b@demo.com", "/api/stats") not in controle.par_utilisateur
+
+    asyncio.run(scenario())
+
+
+def test_refus_admission_porte_les_entetes_cors(serveur, monkeypatch):
+    import httpx
+
+    classes = {**serveur.CLASSES_ADMISSION, "liste": {**serveur.CLASSES_ADMISSION["liste"], "limite": 0, "file": 0}}
+    monkeypatch.setattr(serveur, "controle_admission", serveur.ControleAdmission(classes))
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=serveur.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            return await http.get("/api/clients", headers={"Origin": "http://localhost:3000"})
+
+    reponse = asyncio.run(scenario())
+    assert reponse.status_code == 503
+    # Sans ces en-têtes, le navigateur masque le refus à l'application (SPA sur une autre origine)
+    assert reponse.headers["access-control-allow-origin"]
+    assert "retry-after" in reponse.headers["access-control-expose-headers"].lower()
+    assert reponse.headers["retry-after"]
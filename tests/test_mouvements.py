@@ -0,0 +1,143 @@
+"""Historique des mouvements : seaux pleins, migration rejouée, reprise du journal sans doublon"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+from pymongo.errors import AutoReconnect
+
+
+def mouvements_produit(produit_id, nombre, prefixe="m", debut=datetime(2025, 3, 1)):
+    return [
+        {"id": f"{prefixe}{i}", "produit_id": produit_id, "type_mouvement": "sortie", "quantite": 1,
+         "date_mouvement": debut + timedelta(hours=i)}
+        for i in range(nombre)
+    ]
+
+
+async def seaux(serveur, produit_id):
+    return await serveur.db.mouvements_stock_seaux.find({"produit_id": produit_id}).sort("n", -1).to_list(None)
+
+
+def test_seau_plein_ouvre_un_nouveau_seau(serveur, monkeypatch):
+    monkeypatch.setattr(serveur, "MOUVEMENTS_PAR_SEAU", 3)
+
+    async def scenario():
+        mouvements = mouvements_produit("p1", 7)
+        # Un lot plus grand qu'un seau, puis des ajouts un par un
+        await serveur.journal_mouvements.journaliser("mouvements_stock", *mouvements[:4])
+        for mouvement in mouvements[4:]:
+            await serveur.journal_mouvements.journaliser("mouvements_stock", mouvement)
+
+        assert [seau["n"] for seau in await seaux(serveur, "p1")] == [3, 3, 1]
+        historique = await serveur.historique_mouvements("mouvements_stock", ["p1"])
+        assert [m["id"] for m in historique] == [f"m{i}" for i in reversed(range(7))]
+
+    asyncio.run(scenario())
+
+
+def test_mois_differents_dans_des_seaux_differents(serveur):
+    async def scenario():
+        mars = mouvements_produit("p1", 2, "mars")
+        avril = mouvements_produit("p1", 1, "avril", debut=datetime(2025, 4, 2))
+        await serveur.journal_mouvements.journaliser("mouvements_stock", *mars, *avril)
+        assert sorted((seau["mois"], seau["n"]) for seau in await seaux(serveur, "p1")) == [("2025-03", 2), ("2025-04", 1)]
+
+    asyncio.run(scenario())
+
+
+def test_migration_rejouee_sans_doublon(serveur, monkeypatch):
+    import migrer_mouvements
+
+    monkeypatch.setattr(serveur, "MOUVEMENTS_PAR_SEAU", 4)
+
+    async def scenario():
+        source = serveur.db.mouvements_stock
+        await source.insert_many(mouvements_produit("p1", 10))
+        # Migration interrompue après l'écriture d'un lot, avant son retrait de la source
+        premier_lot = await source.find({}).limit(6).to_list(None)
+        await migrer_mouvements.migrer_lot(source, "mouvements_stock_seaux", "produit_id", premier_lot, conserver=True)
+        # Reprise : le lot déjà écrit est relu en entier
+        migres = await migrer_mouvements.migrer_journal("mouvements_stock", taille_lot=3)
+
+        assert migres == 10
+        historique = await serveur.historique_mouvements("mouvements_stock", ["p1"])
+        assert sorted(m["id"] for m in historique) == sorted(f"m{i}" for i in range(10))
+        assert sum(seau["n"] for seau in await seaux(serveur, "p1")) == 10
+        assert "mouvements_stock" not in await serveur.db.list_collection_names()
+
+    asyncio.run(scenario())
+
+
+def test_seaux_migres_dates_pour_la_sauvegarde_incrementale(serveur):
+    import migrer_mouvements
+
+    async def scenario():
+        source = serveur.db.mouvements_stock
+        await source.insert_many(mouvements_produit("p1", 2, debut=datetime(2020, 1, 1)))
+        avant = datetime.now() - timedelta(seconds=1)
+        await migrer_mouvements.migrer_journal("mouvements_stock")
+        seau, = await seaux(serveur, "p1")
+        # fin reste ancienne, date_modification suit la migration
+        assert seau["fin"] < avant
+        assert seau["date_modification"] >= avant
+        assert "date_modification" in serveur.CHAMPS_FILIGRANE["mouvements_stock_seaux"]
+
+    asyncio.run(scenario())
+
+
+def test_journal_reprend_une_ecriture_incertaine_sans_doublon(serveur, monkeypatch):
+    monkeypatch.setattr(serveur, "JOURNAL_REPRISE_DELAI_SECONDES", 0.01)
+    journal = serveur.journal_mouvements
+    collection_reelle = journal._collection
+    echecs = {"restants": 2}
+
+    class EcritureIncertaine:
+        """Écrit le lot puis perd l'acquittement, comme un write concern non confirmé"""
+
+        def __init__(self, collection):
+            self.collection = collection
+
+        async def bulk_write(self, operations, **kwargs):
+            resultat = await self.collection.bulk_write(operations, **kwargs)
+            if echecs["restants"]:
+                echecs["restants"] -= 1
+                raise AutoReconnect("acquittement perdu")
+            return resultat
+
+    monkeypatch.setattr(journal, "_collection", lambda nom: EcritureIncertaine(collection_reelle(nom)))
+
+    async def scenario():
+        # L'opération métier est déjà enregistrée : l'appelant ne reçoit pas l'erreur
+        await journal.journaliser("mouvements_stock", *mouvements_produit("p1", 3))
+        while journal.reprises or journal.ecrivains:
+            await asyncio.sleep(0.01)
+        historique = await serveur.historique_mouvements("mouvements_stock", ["p1"])
+        assert sorted(m["id"] for m in historique) == ["m0", "m1", "m2"]
+
+    asyncio.run(scenario())
+
+
+def test_journal_abandonne_apres_le_dernier_essai(serveur, monkeypatch, caplog):
+    monkeypatch.setattr(serveur, "JOURNAL_REPRISE_DELAI_SECONDES", 0.01)
+    monkeypatch.setattr(serveur, "JOURNAL_TENTATIVES_MAX", 3)
+    journal = serveur.journal_mouvements
+    essais = []
+
+    class Indisponible:
+        async def bulk_write(self, operations, **kwargs):
+            essais.append(len(operations))
+            raise AutoReconnect("serveur indisponible")
+
+    monkeypatch.setattr(journal, "_collection", lambda nom: Indisponible())
+    abandons = []
+    monkeypatch.setattr(serveur.log_journal, "error", lambda *args, **kwargs: abandons.append(args))
+
+    async def scenario():
+        await journal.journaliser("mouvements_stock", *mouvements_produit("p1", 1))
+        while journal.reprises or journal.ecrivains:
+            await asyncio.sleep(0.01)
+        await journal.arreter()
+
+    asyncio.run(scenario())
+    assert len(essais) == 3
+    assert len(abandons) == 1
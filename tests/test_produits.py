@@ -0,0 +1,33 @@
+"""GET conditionnel des produits : prix FC des anciens produits au taux de l'ETag"""
+
+import asyncio
+from datetime import datetime
+
+import httpx
+
+
+def test_prix_fc_au_taux_en_base_malgre_un_cache_perime(serveur, monkeypatch):
+    monkeypatch.setitem(serveur.TAUX_CHANGE, "USD_TO_FC", 2000.0)
+
+    async def scenario():
+        db = serveur.db
+        await db.users.insert_one({"id": "u1", "email": "admin@demo.com", "nom": "A", "prenom": "B",
+                                   "role": "admin", "is_active": True})
+        # Ancien produit : prix FC calculé à la lecture
+        await db.produits.insert_one({"id": "p1", "nom": "Filtre", "prix_usd": 10.0, "prix_fc": None})
+        # Taux changé par un autre worker : le cache local n'est pas encore rafraîchi
+        await db.taux_change.insert_one({"id": "t1", "taux": 3000.0, "actif": True, "date_creation": datetime.now()})
+
+        jeton = serveur.create_access_token({"sub": "admin@demo.com"})
+        entetes = {"Authorization": f"Bearer {jeton}"}
+        transport = httpx.ASGITransport(app=serveur.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            liste = await http.get("/api/produits", headers=entetes)
+            produit = await http.get("/api/produits/p1", headers=entetes)
+        return liste, produit
+
+    liste, produit = asyncio.run(scenario())
+    assert serveur.TAUX_CHANGE["USD_TO_FC"] == 2000.0
+    assert liste.status_code == 200 and liste.headers["etag"]
+    assert liste.json()[0]["prix_fc"] == 30000.0
+    assert produit.json()["prix_fc"] == 30000.0
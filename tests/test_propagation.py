@@ -0,0 +1,38 @@
+"""Renommages : la propagation du nom dénormalisé n'est planifiée que si le nom change"""
+
+import asyncio
+
+import httpx
+
+
+def test_propagation_planifiee_seulement_si_le_nom_change(serveur):
+    async def scenario():
+        db = serveur.db
+        await db.users.insert_one({"id": "u1", "email": "admin@demo.com", "nom": "A", "prenom": "B",
+                                   "role": "admin", "is_active": True})
+        await db.clients.insert_one({"id": "c1", "nom": "Acme", "email": "acme@demo.com"})
+        await db.entrepots.insert_one({"id": "e1", "nom": "Nord", "statut": "actif"})
+
+        jeton = serveur.create_access_token({"sub": "admin@demo.com"})
+        entetes = {"Authorization": f"Bearer {jeton}"}
+        transport = httpx.ASGITransport(app=serveur.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            # Modifications sans renommage
+            client = await http.put("/api/clients/c1", headers=entetes,
+                                    json={"nom": "Acme", "email": "acme@demo.com", "telephone": "0102"})
+            entrepot = await http.put("/api/entrepots/e1", headers=entetes, json={"nom": "Nord", "adresse": "Kinshasa"})
+            user = await http.put("/api/users/u1", headers=entetes, json={"prenom": "B", "nom": "A"})
+            assert (client.status_code, entrepot.status_code, user.status_code) == (200, 200, 200)
+            sans_renommage = await db.propagations_noms.count_documents({})
+
+            await http.put("/api/clients/c1", headers=entetes, json={"nom": "Acme SARL", "email": "acme@demo.com"})
+            await http.put("/api/entrepots/e1", headers=entetes, json={"nom": "Nord 2"})
+            await http.put("/api/users/u1", headers=entetes, json={"prenom": "C"})
+            propagations = await db.propagations_noms.find({}, {"_id": 0, "source": 1, "nom": 1}).to_list(None)
+        return sans_renommage, propagations
+
+    sans_renommage, propagations = asyncio.run(scenario())
+    assert sans_renommage == 0
+    assert sorted((p["source"], p["nom"]) for p in propagations) == [
+        ("clients", "Acme SARL"), ("entrepots", "Nord 2"), ("users", "C A")
+    ]
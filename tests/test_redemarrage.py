@@ -0,0 +1,64 @@
+"""Plusieurs lifespans dans un même processus : écritures différées et journal réarmés au démarrage"""
+
+import asyncio
+from datetime import datetime
+
+from pymongo.errors import AutoReconnect
+
+
+def test_tampon_ecritures_reprend_apres_un_arret(serveur, monkeypatch):
+    monkeypatch.setattr(serveur, "ECRITURES_DIFFEREES_INTERVALLE_SECONDES", 0.01)
+    tampon = serveur.TamponEcritures()
+
+    async def premier_lifespan():
+        tampon.demarrer()
+        await tampon.arreter()
+
+    async def second_lifespan():
+        await serveur.db.users.insert_one({"email": "a@demo.com"})
+        boucle = tampon.demarrer()
+        tampon.differer("users", {"email": "a@demo.com"}, {"derniere_connexion": datetime(2026, 1, 2)})
+        # Écrit par la boucle, sans attendre l'arrêt
+        for _ in range(100):
+            utilisateur = await serveur.db.users.find_one({"email": "a@demo.com"})
+            if utilisateur.get("derniere_connexion"):
+                break
+            await asyncio.sleep(0.01)
+        assert not boucle.done()
+        await tampon.arreter()
+        return utilisateur
+
+    asyncio.run(premier_lifespan())
+    assert asyncio.run(second_lifespan())["derniere_connexion"] == datetime(2026, 1, 2)
+
+
+def test_journal_retente_apres_un_arret(serveur, monkeypatch):
+    monkeypatch.setattr(serveur, "JOURNAL_REPRISE_DELAI_SECONDES", 0.01)
+    journal = serveur.journal_mouvements
+    collection_reelle = journal._collection
+    echecs = {"restants": 1}
+
+    class UnEchec:
+        def __init__(self, collection):
+            self.collection = collection
+
+        async def bulk_write(self, operations, **kwargs):
+            if echecs["restants"]:
+                echecs["restants"] -= 1
+                raise AutoReconnect("indisponible")
+            return await self.collection.bulk_write(operations, **kwargs)
+
+    async def premier_lifespan():
+        await journal.arreter()
+
+    async def second_lifespan():
+        journal.demarrer()
+        monkeypatch.setattr(journal, "_collection", lambda nom: UnEchec(collection_reelle(nom)))
+        mouvement = {"id": "m1", "produit_id": "p1", "date_mouvement": datetime(2026, 1, 2)}
+        await journal.journaliser("mouvements_stock", mouvement)
+        while journal.reprises or journal.ecrivains:
+            await asyncio.sleep(0.01)
+        return await serveur.historique_mouvements("mouvements_stock", ["p1"])
+
+    asyncio.run(premier_lifespan())
+    assert [m["id"] for m in asyncio.run(second_lifespan())] == ["m1"]
@@ -0,0 +1,29 @@
+"""Restauration incrémentale : rejeu d'une collection vidée sans pierres tombales"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import bson
+
+
+def test_collection_videe_rejouee_sans_pierres_tombales(serveur, tmp_path):
+    debut = datetime(2026, 1, 2)
+    evenements = [
+        {"ts": debut, "op": "r", "cle": {"_id": "c1"}, "doc": {"_id": "c1", "id": "c1", "nom": "Avant"}},
+        {"ts": debut + timedelta(seconds=1), "op": "x"},
+        {"ts": debut + timedelta(seconds=2), "op": "r", "cle": {"_id": "c2"}, "doc": {"_id": "c2", "id": "c2", "nom": "Après"}},
+    ]
+    chemin = tmp_path / "clients.bson"
+    chemin.write_bytes(b"".join(bson.encode(evenement) for evenement in evenements))
+
+    async def scenario():
+        db = serveur.db
+        await db.clients.insert_many([{"id": f"ancien{i}", "nom": "Ancien"} for i in range(5)])
+        await db.suppressions.delete_many({})
+        rejoues = await serveur.rejouer_segment("clients", str(chemin), "aucune", None)
+        return rejoues, await db.clients.distinct("id"), await db.suppressions.count_documents({})
+
+    rejoues, identifiants, pierres_tombales = asyncio.run(scenario())
+    assert rejoues == 3
+    assert identifiants == ["c2"]
+    assert pierres_tombales == 0
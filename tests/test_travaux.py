@@ -0,0 +1,57 @@
+"""Travaux de fond : nouvelle tentative après l'échec d'un gestionnaire, réconciliation planifiée"""
+
+import asyncio
+from datetime import datetime
+
+
+async def executer_prochain(serveur, worker, type_travail, travail_id):
+    # Rendre le travail disponible sans attendre le délai de nouvelle tentative
+    await serveur.db.jobs.update_one({"id": travail_id}, {"$set": {"disponible_a": datetime.utcnow()}})
+    travail = await worker.reserver([type_travail])
+    assert travail is not None and travail["id"] == travail_id
+    await worker.executer(travail)
+    return await serveur.db.jobs.find_one({"id": travail_id})
+
+
+def test_echec_du_gestionnaire_retente_puis_passe_en_erreur(serveur):
+    async def scenario():
+        db = serveur.db
+        await db.propagations_noms.insert_one({"id": "p1", "statut": "en_attente"})
+        # Source inconnue : le gestionnaire échoue à chaque tentative
+        travail_id = await serveur.planifier_travail(
+            "propagation_noms",
+            {"propagation_id": "p1", "source": "inconnue", "identifiants": ["x"], "nom": "Nouveau nom"},
+            tentatives_max=2
+        )
+        worker = serveur.WorkerTravaux(["propagation_noms"])
+
+        travail = await executer_prochain(serveur, worker, "propagation_noms", travail_id)
+        propagation = await db.propagations_noms.find_one({"id": "p1"})
+        assert travail["statut"] == "en_attente"
+        assert travail["tentatives"] == 1
+        assert travail["disponible_a"] > datetime.utcnow()
+        # Pas encore la dernière tentative : le document métier n'est pas en erreur
+        assert propagation["statut"] == "en_attente"
+
+        travail = await executer_prochain(serveur, worker, "propagation_noms", travail_id)
+        propagation = await db.propagations_noms.find_one({"id": "p1"})
+        assert travail["statut"] == "erreur"
+        assert travail["tentatives"] == 2
+        assert propagation["statut"] == "erreur"
+        assert propagation.get("erreur")
+
+    asyncio.run(scenario())
+
+
+def test_reconciliation_periodique_planifiee_une_seule_fois_par_creneau(serveur, monkeypatch):
+    monkeypatch.setattr(serveur, "RECONCILIATION_INTERVAL_HEURES", 1)
+
+    async def scenario():
+        await serveur.db.jobs.create_index("id", unique=True)
+        # Plusieurs processus API démarrent en même temps
+        await asyncio.gather(*(serveur.planifier_reconciliation_periodique() for _ in range(3)))
+        travaux = await serveur.db.jobs.find({"type": "reconciliation_noms"}).to_list(None)
+        assert len(travaux) == 1
+        assert travaux[0]["params"].get("periodique") is True
+
+    asyncio.run(scenario())